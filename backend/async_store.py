@@ -0,0 +1,157 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from firebase_admin import firestore_async
+from google.cloud.firestore import FieldFilter, Query
+
+# Importing bmibmr initializes the Firebase app and the shared profile cache
+from bmibmr import profile_cache
+from timestamps import TS_FIELD
+from read_stats import read_stats
+
+adb = firestore_async.client()
+
+# Set to 0 to read whole documents everywhere (to compare read sizes)
+FIRESTORE_PROJECTIONS = os.getenv("FIRESTORE_PROJECTIONS", "1") != "0"
+
+
+# ============= FIELD PROJECTIONS =============
+# Fields each chart endpoint reads. Queries given one of these issue a
+# select(), so only those fields are transferred and deserialized.
+
+# Weight / BMI graphs and trends (plus both timestamp fields, for ordering and the sync cursor)
+HISTORY_CHART_FIELDS = ("timestamp", TS_FIELD, "weight", "bmi")
+
+# Today's nutrition, macro and protein history (dailyMacros rollups)
+ROLLUP_CHART_FIELDS = ("date", "calories", "protein", "carbs", "fat", "meal_count")
+
+
+def projected(query, fields: Optional[Sequence[str]]):
+    """`query` restricted to `fields`, or unchanged when fields is None or projections are off."""
+    if fields and FIRESTORE_PROJECTIONS:
+        return query.select(list(fields))
+    return query
+
+
+async def fetch(query, sub: str, fields: Optional[Sequence[str]] = None) -> List:
+    """Stream an (async) query, applying the projection and recording the read."""
+    docs = [doc async for doc in projected(query, fields).stream()]
+    read_stats.record(sub, fields if FIRESTORE_PROJECTIONS else None, docs)
+    return docs
+
+
+# ============= ASYNC FIRESTORE DATA LAYER =============
+# Awaitable counterparts of the sync db.collection(...) calls, for `async def`
+# routes. Using the AsyncClient keeps a slow scan from freezing every other
+# request on the same worker.
+
+def user_ref(user_id: str):
+    return adb.collection("users").document(user_id)
+
+
+async def get_profile(user_id: str) -> Dict:
+    """
+    Async version of bmibmr.get_user_profile: served from the shared
+    ProfileCache when possible, otherwise read with the AsyncClient.
+    Raises HTTPException(404) when the user does not exist.
+    """
+    data = profile_cache.peek(user_id)
+    if data is not None:
+        return data
+
+    doc = await user_ref(user_id).get()
+    if not doc.exists:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    data = doc.to_dict() or {}
+    profile_cache.remember(user_id, data, doc.update_time)
+    return data
+
+
+async def stream_subcollection(
+    user_id: str,
+    sub: str,
+    order_by: Optional[str] = None,
+    descending: bool = False,
+    limit: Optional[int] = None,
+    fields: Optional[Sequence[str]] = None,
+    after: Optional[str] = None,
+) -> List:
+    """
+    Return the document snapshots of users/{user_id}/{sub}, optionally
+    ordered by a field, limited and projected to `fields`. Snapshots keep
+    `.id` and `.to_dict()` so route code reads the same as with the sync client.
+    `after` is the id of the last document of the previous page.
+    Raises HTTPException(400) when it does not exist.
+    """
+    query = user_ref(user_id).collection(sub)
+    if order_by:
+        direction = Query.DESCENDING if descending else Query.ASCENDING
+        query = query.order_by(order_by, direction=direction)
+    if after is not None:
+        # A snapshot cursor also orders by document id, so equal timestamps page correctly
+        cursor = await user_ref(user_id).collection(sub).document(after).get()
+        read_stats.record(sub, None, [cursor] if cursor.exists else [])
+        if not cursor.exists:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.start_after(cursor)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return await fetch(query, sub, fields)
+
+
+async def latest_docs(user_id: str, sub: str, field: str = "timestamp", limit: int = 20,
+                      fields: Optional[Sequence[str]] = None, after: Optional[str] = None) -> List:
+    """Most recent `limit` docs of a subcollection by `field`, newest first (older than doc `after`)."""
+    return await stream_subcollection(user_id, sub, order_by=field, descending=True, limit=limit,
+                                      fields=fields, after=after)
+
+
+async def range_docs(
+    user_id: str,
+    sub: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    field: str = TS_FIELD,
+    fields: Optional[Sequence[str]] = None,
+) -> List:
+    """
+    Docs of a subcollection with start <= field < end, oldest first.
+    Cost scales with the window instead of the whole history.
+    """
+    query = user_ref(user_id).collection(sub)
+    if start is not None:
+        query = query.where(filter=FieldFilter(field, ">=", start))
+    if end is not None:
+        query = query.where(filter=FieldFilter(field, "<", end))
+    query = query.order_by(field)
+
+    return await fetch(query, sub, fields)
+
+
+async def count_docs(user_id: str, sub: str) -> int:
+    """
+    Number of docs in a subcollection, from a count aggregation: billed as
+    one read per 1000 index entries, no documents are transferred.
+    """
+    result = await user_ref(user_id).collection(sub).count(alias="n").get()
+    return int(result[0][0].value)
+
+
+async def doc_versions(user_id: str, sub: str) -> Dict[str, datetime]:
+    """{doc id: update time} of a subcollection, from a keys-only query (no fields transferred)."""
+    docs = [doc async for doc in user_ref(user_id).collection(sub).select([]).stream()]
+    read_stats.record(sub, ("__name__",), docs)
+    return {doc.id: doc.update_time for doc in docs}
+
+
+async def get_docs(user_id: str, sub: str, doc_ids: Sequence[str]) -> List:
+    """Snapshots of the given docs of a subcollection, fetched concurrently; missing ones are left out."""
+    col = user_ref(user_id).collection(sub)
+    docs = [doc for doc in await asyncio.gather(*(col.document(i).get() for i in doc_ids)) if doc.exists]
+    read_stats.record(sub, None, docs)
+    return docs
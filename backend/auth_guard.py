@@ -0,0 +1,26 @@
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from firebase_admin import auth
+
+
+# ============= REQUEST AUTHENTICATION =============
+# Routes that write through the admin SDK bypass Firestore security rules,
+# so they check the caller's Firebase ID token themselves.
+
+def require_owner(user_id: str, authorization: Optional[str] = Header(None)) -> str:
+    """
+    FastAPI dependency: the request must carry `Authorization: Bearer <Firebase
+    ID token>` for the user in the `user_id` path parameter. Returns the uid.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    try:
+        claims = auth.verify_id_token(token.strip())
+    except Exception as e:
+        print("ID token rejected:", e)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if claims.get("uid") != user_id:
+        raise HTTPException(status_code=403, detail="Token does not belong to this user")
+    return user_id
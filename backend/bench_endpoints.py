@@ -0,0 +1,382 @@
+"""
+Endpoint benchmark: every main.py route against an in-memory Firestore
+(fake_firestore.py) seeded with synthetic users, and a stub chat model
+with a fixed latency. No Firebase project, Gemini key or network needed.
+
+Per route it reports p50/p95/p99 latency, throughput, and Firestore
+reads, writes and LLM calls per request, so a regression like a new
+full-collection stream() shows up as a jump in reads/req.
+
+By default each route is measured warm (one unmeasured request per user
+first), i.e. with the in-process caches filled as in a running server.
+--cold clears the profile, history, LLM-result and API-key caches before
+every request (sequentially) to measure the first-request path; the RAG
+index stays warm. /api/analyze_food and /api/delete_temp_image call
+external services and are not benchmarked.
+
+Usage (from backend/):
+    python bench_endpoints.py
+    python bench_endpoints.py --users 5 --meals 100000 --history 2000 --requests 50
+    python bench_endpoints.py --routes weight,meals --cold --json results.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from fake_firestore import FakeStore, install
+
+store = FakeStore()
+install(store)
+
+# Measure the app, not the per-key rate limit; local embeddings; no macro cache file;
+# the read stats route enabled
+os.environ.setdefault("LLM_RATE_PER_MIN", "1000000")
+os.environ.setdefault("LLM_BURST", "100000")
+os.environ.setdefault("RAG_EMBEDDER", "hashing")
+os.environ.setdefault("MACRO_CACHE_DB", "")
+os.environ.setdefault("READ_STATS_ENDPOINT", "1")
+
+import httpx
+from pydantic import SecretStr
+
+import auth_guard
+import llm_clients
+import main
+from bmibmr import profile_cache
+from history_cache import history_cache
+from nutrition_db import nutrition_index
+from rollups import ROLLUP_SUB, add_meal, day_key, meal_macros
+from timestamps import TS_FIELD
+
+MEAL_TIMES = ("breakfast", "lunch", "snack", "dinner")
+GOALS = ("lose_weight", "build_muscle", "tone_body", "increase_endurance")
+
+
+# ============= STUB LLM =============
+
+class StubMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class StubChat:
+    """
+    Stands in for ChatGoogleGenerativeAI: waits `latency` seconds, then
+    answers in the shape each route's prompt asks for.
+    """
+
+    latency = 0.3
+    calls = 0
+
+    def __init__(self, api_key: str, model: str, temperature: float):
+        self.google_api_key = SecretStr(api_key)
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, prompt: str) -> StubMessage:
+        StubChat.calls += 1
+        time.sleep(self.latency)
+        return StubMessage(stub_reply(prompt))
+
+    async def ainvoke(self, prompt: str) -> StubMessage:
+        StubChat.calls += 1
+        await asyncio.sleep(self.latency)
+        return StubMessage(stub_reply(prompt))
+
+    async def astream(self, prompt: str):
+        StubChat.calls += 1
+        words = stub_reply(prompt).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield StubMessage(word if i == 0 else " " + word)
+
+
+def stub_reply(prompt: str) -> str:
+    if '"rating"' in prompt:
+        ids = re.findall(r'"doc_id": "([^"]+)"', prompt)
+        return json.dumps([{"doc_id": i, "rating": "good", "rating_explain": "balanced macros for the goal"}
+                           for i in ids])
+    if '"meal_plan"' in prompt:
+        option = "Option 1: Oats with milk (Calories: 350, Protein: 15g, Carbs: 55g, Fats: 8g)"
+        return json.dumps({
+            "meal_plan": {k: [option] for k in ("breakfast", "lunch", "snack", "dinner", "late_night_meal")},
+            "total_daily_macros": {"calories": "1750", "protein": "75", "carbs": "275", "fats": "40"},
+        })
+    if '"insights"' in prompt:
+        return json.dumps({"insights": [{"title": f"Insight {i}", "description": "Stub insight."} for i in range(5)]})
+    if '"ai_response"' in prompt:
+        return json.dumps({"ai_response": "On track for your goal."})
+    if '"fact"' in prompt:
+        return json.dumps({"fact": "Muscles can't push, they only pull."})
+    return "**Stub answer.** " + "Keep protein high and stay consistent. " * 8
+
+
+# ============= STUB AUTH =============
+# Write routes verify a Firebase ID token; here the "token" is the uid itself.
+
+class StubAuth:
+    @staticmethod
+    def verify_id_token(token: str) -> dict:
+        return {"uid": token}
+
+
+# ============= SYNTHETIC DATA =============
+
+def js_iso(dt: datetime) -> str:
+    """JS Date.toISOString() form, as the frontend stores `timestamp`."""
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def seed_user(user_id: str, n_meals: int, n_history: int, days: int, rnd: random.Random):
+    now = datetime.now(timezone.utc)
+    height, weight = rnd.randint(155, 195), rnd.randint(55, 110)
+    gender, age, goal = rnd.choice(("male", "female")), rnd.randint(18, 65), rnd.choice(GOALS)
+    bmi = weight / (height / 100) ** 2
+    bmr = 10 * weight + 6.25 * height - 5 * age + (5 if gender == "male" else -161)
+    store.put("users", user_id, {
+        "name": f"Bench {user_id}",
+        "gemini_api": f"stub-key-{user_id}",
+        "gender": gender, "age": age, "diet": "vegetarian", "budget": 6000,
+        "currentData": {
+            "height": height, "weight": weight, "bmi": round(bmi, 1), "bmr": round(bmr),
+            "goal": goal, "explain_goal": "Feel fitter", "exercise_intensity": "medium",
+            "maintenanceCalories": round(bmr * 1.55), "req_cal_intake": round(bmr * 1.3),
+            "any_complication": "none", "body_type": "mesomorph",
+        },
+    })
+
+    span = days * 86400
+    rollups = defaultdict(lambda: {"calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0, "meal_count": 0})
+    foods = nutrition_index.rows
+    for i in range(n_meals):
+        dt = now - timedelta(seconds=span * (n_meals - i) / n_meals)
+        food = rnd.choice(foods)
+        entry = {
+            "meal_name": food["name"], "meal_time": rnd.choice(MEAL_TIMES),
+            "cals": food["calories"], "protein": food["protein"], "carbs": food["carbs"], "fat": food["fat"],
+            "timestamp": js_iso(dt), TS_FIELD: dt,
+        }
+        store.put(f"users/{user_id}/meals", f"m{i:07d}", entry)
+        acc = rollups[day_key(dt)]
+        for k, v in meal_macros(entry).items():
+            acc[k] += v
+        acc["meal_count"] += 1
+    for day, acc in rollups.items():
+        store.put(f"users/{user_id}/{ROLLUP_SUB}", day, {**acc, "date": day, "updatedAt": now})
+
+    w = float(weight)
+    for i in range(n_history):
+        dt = now - timedelta(seconds=span * (n_history - i) / n_history)
+        w += rnd.gauss(-0.02, 0.3)
+        store.put(f"users/{user_id}/history", f"h{i:07d}", {
+            "weight": round(w, 1), "bmi": round(w / (height / 100) ** 2, 2),
+            "timestamp": js_iso(dt), TS_FIELD: dt,
+        })
+
+
+# ============= ROUTES =============
+# (name, method, path, body(user_id, state) or None, headers(user_id, state) or None)
+
+def _ask_body(uid, state):
+    return {"user_id": uid, "query": "How is my protein intake this week?", "history": [], "type": "nutrition"}
+
+
+def _created_meal(uid, state):
+    return state["created"][uid][-1]
+
+
+def _bearer(uid, state):
+    return {"Authorization": f"Bearer {uid}"}
+
+
+ROUTES = [
+    ("bmi", "GET", "/api/user/{uid}/bmi", None, None),
+    ("bmr", "GET", "/api/user/{uid}/bmr", None, None),
+    ("reqCal", "GET", "/api/user/reqCal/{uid}", None, None),
+    ("metrics", "GET", "/api/user/{uid}/metrics", None, None),
+    ("weight", "GET", "/api/user/weight/{uid}", None, None),
+    ("weight page", "GET", "/api/user/weight/{uid}?limit=100", None, None),
+    ("weight 304", "GET", "/api/user/weight/{uid}", None, lambda uid, s: {"If-None-Match": s["etag"].get(uid, "")}),
+    ("bmiGraph", "GET", "/api/user/{uid}/bmiGraph", None, None),
+    ("trends", "GET", "/api/user/{uid}/trends", None, None),
+    ("meals", "GET", "/api/user/meals/{uid}", None, None),
+    ("todayNutrition", "GET", "/api/user/todayNutrition/{uid}", None, None),
+    ("macroHistory", "GET", "/api/user/macroHistory/{uid}", None, None),
+    ("proteinHistory", "GET", "/api/user/proteinHistory/{uid}", None, None),
+    ("todayFood", "GET", "/api/todayFood/{uid}", None, None),
+    ("bodyInsights", "GET", "/api/user/bodyInsights/{uid}", None, None),
+    ("randomFact", "GET", "/api/randomFact", None, None),
+    ("dashboard", "GET", "/api/user/{uid}/dashboard", None, None),
+    ("dashboard stream", "GET", "/api/user/{uid}/dashboard?stream=true", None, None),
+    ("ask", "POST", "/api/ask", _ask_body, None),
+    ("ask stream", "POST", "/api/ask/stream", _ask_body, None),
+    ("macros", "POST", "/api/macros", lambda uid, s: {"name": "banana"}, None),
+    ("macros batch", "POST", "/api/macros/batch",
+     lambda uid, s: {"names": ["banana", "boiled egg", "paneer tikka", "brown rice", "greek yogurt"]}, None),
+    ("refreshInsights", "POST", "/api/user/{uid}/refreshInsights", None, _bearer),
+    ("create meal", "POST", "/api/user/{uid}/meals",
+     lambda uid, s: {"meal_name": "Bench oats", "cals": 350, "protein": 15, "carbs": 55, "fat": 8}, _bearer),
+    ("edit meal", "PUT", "/api/user/{uid}/meals/{meal}", lambda uid, s: {"cals": 400}, _bearer),
+    ("delete meal", "DELETE", "/api/user/{uid}/meals/{meal}", None, _bearer),
+    ("stats reads", "GET", "/api/stats/reads", None, None),
+]
+
+
+def clear_caches():
+    profile_cache.clear()
+    history_cache.clear()
+    main.llm_cache.clear()
+    main._GEMINI_KEY_CACHE.clear()
+
+
+async def request(client: httpx.AsyncClient, route, uid: str, state) -> httpx.Response:
+    name, method, path, body, headers = route
+    meal = ""
+    if "{meal}" in path:
+        meal = state["created"][uid].pop() if name == "delete meal" else _created_meal(uid, state)
+    resp = await client.request(
+        method, path.format(uid=uid, meal=meal),
+        json=body(uid, state) if body else None,
+        headers=headers(uid, state) if headers else None,
+    )
+    if name == "create meal" and resp.status_code == 200:
+        state["created"][uid].append(resp.json()["doc_id"])
+    if name == "weight" and "etag" in resp.headers:
+        state["etag"][uid] = resp.headers["etag"]
+    return resp
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    i = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[i]
+
+
+async def bench_route(client, route, users, n: int, concurrency: int, cold: bool, state) -> dict:
+    if not cold:
+        for uid in users:
+            await request(client, route, uid, state)
+
+    latencies, statuses = [], Counter()
+    reads0, writes0, llm0 = store.reads, store.writes, StubChat.calls
+    todo = iter(range(n))
+
+    async def worker():
+        for i in todo:
+            uid = users[i % len(users)]
+            if cold:
+                clear_caches()
+            start = time.perf_counter()
+            resp = await request(client, route, uid, state)
+            latencies.append(time.perf_counter() - start)
+            statuses[resp.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(1 if cold else concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ok = sum(c for s, c in statuses.items() if s < 400)
+    return {
+        "route": route[0],
+        "requests": n,
+        "errors": n - ok,
+        "statuses": dict(statuses),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "rps": round(n / elapsed, 1),
+        "reads_per_req": round((store.reads - reads0) / n, 2),
+        "writes_per_req": round((store.writes - writes0) / n, 2),
+        "llm_per_req": round((StubChat.calls - llm0) / n, 2),
+    }
+
+
+def print_table(results):
+    cols = [("route", 18), ("errors", 6), ("p50_ms", 9), ("p95_ms", 9), ("p99_ms", 9), ("rps", 8),
+            ("reads_per_req", 10), ("writes_per_req", 10), ("llm_per_req", 8)]
+    labels = {"reads_per_req": "reads/req", "writes_per_req": "writes/req", "llm_per_req": "llm/req"}
+    print("  ".join(f"{labels.get(c, c):>{w}}" if c != "route" else f"{c:<{w}}" for c, w in cols))
+    for r in results:
+        print("  ".join(f"{r[c]:>{w}}" if c != "route" else f"{r[c]:<{w}}" for c, w in cols))
+
+
+async def run(args):
+    StubChat.latency = args.llm_latency / 1000
+    llm_clients.chat_clients.factory = StubChat
+    auth_guard.auth = StubAuth()
+
+    rnd = random.Random(args.seed)
+    users = [f"bench{i:04d}" for i in range(args.users)]
+    start = time.perf_counter()
+    for uid in users:
+        seed_user(uid, args.meals, args.history, args.days, rnd)
+    print(f"Seeded {args.users} users x {args.meals} meals, {args.history} history entries "
+          f"in {time.perf_counter() - start:.1f}s; LLM stub latency {args.llm_latency} ms\n")
+
+    wanted = [w.strip() for w in args.routes.split(",")] if args.routes else None
+    routes = [r for r in ROUTES if wanted is None or r[0] in wanted]
+    names = {r[0] for r in routes}
+    state = {"created": defaultdict(list), "etag": {}}
+
+    # Meals for edit/delete to work on, however many "create meal" adds
+    if names & {"edit meal", "delete meal"}:
+        per_user = args.requests // len(users) + 2
+        for uid in users:
+            for _ in range(per_user):
+                state["created"][uid].append(add_meal(uid, {
+                    "meal_name": "Bench rice", "cals": 200, "protein": 4, "carbs": 45, "fat": 1,
+                    "timestamp": js_iso(datetime.now(timezone.utc)), TS_FIELD: datetime.now(timezone.utc),
+                }))
+
+    results = []
+    async with client_for() as client:
+        # The 304 route revalidates the ETag of a prior full response
+        if "weight 304" in names:
+            weight = next(r for r in ROUTES if r[0] == "weight")
+            for uid in users:
+                await request(client, weight, uid, state)
+
+        for route in routes:
+            results.append(await bench_route(client, route, users, args.requests, args.concurrency, args.cold, state))
+            print(f"  {route[0]}: done", file=sys.stderr)
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+def client_for() -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--meals", type=int, default=1000, help="meals per user (100 to 100000)")
+    parser.add_argument("--history", type=int, default=365, help="weight/BMI history entries per user")
+    parser.add_argument("--days", type=int, default=365, help="days the synthetic data spans")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=300, help="stub chat model latency (ms)")
+    parser.add_argument("--routes", help="comma-separated route names (default: all)")
+    parser.add_argument("--cold", action="store_true", help="clear in-process caches before each request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark: parse_timestamp vs the format-specialized TimestampDecoder.
+
+Decodes a mixed batch of timestamp values the way history/meals scans see
+them: mostly JS toISOString() strings and native datetimes, plus some
+offset/naive ISO strings and junk.
+
+Best-of-N timings still move between runs: decode has held at 1.3-1.5x,
+while decode_epochs has come out anywhere from 0.8x to 2x (1.1x in review).
+Treat the epochs path as parity with parse_timestamp; its point is one
+float64 array per batch, not speed.
+
+Usage (from backend/):
+    python bench_timestamps.py
+    python bench_timestamps.py --n 200000 --repeat 5
+"""
+import random
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from timestamps import TimestampDecoder, parse_timestamp
+
+
+def make_values(n: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    values = []
+    for _ in range(n):
+        dt = base + timedelta(seconds=rnd.randrange(0, 2 * 365 * 86400), milliseconds=rnd.randrange(1000))
+        r = rnd.random()
+        if r < 0.60:
+            values.append(dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z")
+        elif r < 0.85:
+            values.append(dt)
+        elif r < 0.93:
+            values.append(dt.isoformat())                                 # +00:00 offset
+        elif r < 0.98:
+            values.append(dt.replace(tzinfo=None).isoformat(timespec="milliseconds"))  # naive
+        else:
+            values.append(rnd.choice(["", "n/a", None, "2025-13-40T00:00:00Z"]))
+    # history is re-scanned: repeat a share of the strings
+    for i in range(0, n, 5):
+        values[i] = values[rnd.randrange(n)]
+    return values
+
+
+def bench(label: str, fn, repeat: int, setup=None) -> float:
+    """Best wall time of `repeat` runs; `setup()` (untimed) builds fn's argument each run."""
+    best = float("inf")
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:8.1f} ms")
+    return best
+
+
+def primed(values: list) -> TimestampDecoder:
+    dec = TimestampDecoder()
+    for v in values[:4 * dec.sample]:
+        dec.decode(v)
+    return dec
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    values = make_values(args.n)
+
+    # Same answers first
+    dec = TimestampDecoder()
+    for v in values:
+        a, b = parse_timestamp(v), dec.decode(v)
+        assert a == b, (v, a, b)
+    expected = np.array([dt.timestamp() if dt else np.nan for dt in map(parse_timestamp, values)])
+    assert np.allclose(primed(values).decode_epochs(values), expected, equal_nan=True)
+    print(f"{args.n} mixed values, dominant format: {dec.kind}\n")
+
+    base = bench("parse_timestamp (per value)", lambda _: [parse_timestamp(v) for v in values], args.repeat)
+    fast = bench("TimestampDecoder.decode",
+                 lambda d: [d.decode(v) for v in values], args.repeat, setup=lambda: primed(values))
+
+    base_e = bench("parse_timestamp + .timestamp()",
+                   lambda _: [dt.timestamp() if dt else None for dt in map(parse_timestamp, values)], args.repeat)
+    fast_e = bench("TimestampDecoder.decode_epochs",
+                   lambda d: d.decode_epochs(values), args.repeat, setup=lambda: primed(values))
+
+    print(f"\nspeedup vs parse_timestamp: decode {base / fast:.1f}x, epochs {base_e / fast_e:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
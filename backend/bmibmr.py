@@ -1,10 +1,13 @@
 import os
 import json
+from typing import Optional
 from dotenv import load_dotenv
 from fastapi import HTTPException
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from profile_cache import ProfileCache
+
 load_dotenv()
 
 # ============= FIREBASE INITIALIZATION =============
@@ -19,18 +22,26 @@ except ValueError:
 
 db = firestore.client()
 
+# One shared snapshot of users/{user_id} for every fetcher below
+profile_cache = ProfileCache(db)
 
-# ============= FETCH FUNCTIONS =============
 
-def fetch_bmi_firestore(user_id: str):
-    try:
-        ref = db.collection("users").document(user_id)
-        doc = ref.get()
+def get_user_profile(user_id: str) -> dict:
+    """
+    Return the user's profile document from the shared cache (read-only).
+    Raises HTTPException(404) when the user does not exist.
+
+    Routes load this once and pass it as `profile` to the fetchers below,
+    so a single request never reads the same document twice.
+    """
+    return profile_cache.get(user_id)
 
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="User not found")
 
-        data = doc.to_dict() or {}
+# ============= FETCH FUNCTIONS =============
+
+def fetch_bmi_firestore(user_id: str, profile: Optional[dict] = None):
+    try:
+        data = profile if profile is not None else get_user_profile(user_id)
 
         if "bmi" in data:
             return {
@@ -56,15 +67,9 @@ def fetch_bmi_firestore(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def fetch_bmr_firestore(user_id: str):
+def fetch_bmr_firestore(user_id: str, profile: Optional[dict] = None):
     try:
-        ref = db.collection("users").document(user_id)
-        doc = ref.get()
-
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        data = doc.to_dict() or {}
+        data = profile if profile is not None else get_user_profile(user_id)
 
         if "bmr" in data:
             return {
@@ -94,15 +99,9 @@ def fetch_bmr_firestore(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def fetch_req_cal_firestore(user_id: str):
+def fetch_req_cal_firestore(user_id: str, profile: Optional[dict] = None):
     try:
-        ref = db.collection("users").document(user_id)
-        doc = ref.get()
-
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        data = doc.to_dict() or {}
+        data = profile if profile is not None else get_user_profile(user_id)
 
         if "currentData" in data and isinstance(data["currentData"], dict):
             cur = data["currentData"]
@@ -125,15 +124,9 @@ def fetch_req_cal_firestore(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def health_summary(user_id: str):
+def health_summary(user_id: str, profile: Optional[dict] = None):
     try:
-        ref = db.collection("users").document(user_id)
-        doc = ref.get()
-
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        data = doc.to_dict() or {}
+        data = profile if profile is not None else get_user_profile(user_id)
 
         if "currentData" not in data:
             raise HTTPException(status_code=404, detail="currentData not found")
@@ -162,56 +155,13 @@ def health_summary(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ============= TEXT FLATTENING =============
-
-def flatten_dict(d, parent_key='', sep='_'):
-    out = {}
-    for k, v in d.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            out.update(flatten_dict(v, new_key, sep=sep))
-        else:
-            out[new_key] = v
-    return out
-
-
-# ============= CONTEXT QUERY (NO EMBEDDINGS) =============
-
-def ans_query_on_demand(user_id: str, query: str):
-    user_doc = db.collection("users").document(user_id).get()
-
-    if not user_doc.exists:
-        return "No data found for this user."
-
-    user_data = user_doc.to_dict() or {}
-    texts = []
-
-    # Add flattened user profile
-    flat = flatten_dict(user_data)
-    profile_parts = [f"{k.replace('_', ' ')}: {v}" for k, v in flat.items() if v]
-    if profile_parts:
-        texts.append("User Profile → " + ", ".join(profile_parts))
-
-    # Add meals + history (limit to 20 each to avoid token overflow)
-    for sub in ["history", "meals"]:
-        try:
-            docs = db.collection("users").document(user_id).collection(sub).stream()
-            count = 0
-            for doc in docs:
-                if count >= 20:
-                    break
-                flat_doc = flatten_dict(doc.to_dict() or {})
-                parts = [f"{k.replace('_', ' ')}: {v}" for k, v in flat_doc.items() if v]
-                if parts:
-                    texts.append(f"{sub.capitalize()} → " + ", ".join(parts))
-                    count += 1
-        except:
-            pass
+# ============= CONTEXT QUERY =============
 
+def wrap_context(texts: list, query: str):
     if not texts:
         return "No user data exists."
 
-    # Pass all context directly — Gemini 2.5 Flash handles large context well
+    # Lines come from context_builder, already deduplicated and cut to the token budget
     context = "\n".join(texts)
 
     return (
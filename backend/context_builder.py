@@ -0,0 +1,252 @@
+import os
+import math
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from timestamps import entry_datetime
+
+# Token budget for the user-data part of the chat prompt
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", 1200))
+
+# Profile fields worth sending (top level or under currentData); everything else is noise
+PROFILE_FIELDS = OrderedDict([
+    ("goal", "goal"),
+    ("explain_goal", "goal details"),
+    ("age", "age"),
+    ("gender", "gender"),
+    ("height", "height cm"),
+    ("weight", "weight kg"),
+    ("bmi", "BMI"),
+    ("bmr", "BMR"),
+    ("maintenanceCalories", "maintenance kcal"),
+    ("req_cal_intake", "target kcal"),
+    ("exercise_intensity", "activity"),
+    ("body_type", "body type"),
+    ("diet", "diet"),
+    ("budget", "monthly budget"),
+    ("any_complication", "health issues"),
+])
+
+# Keys never worth a token in a history line
+_HISTORY_SKIP = {"timestamp", "ts", "updatedAt"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English/JSON-ish text)."""
+    return math.ceil(len(text) / 4)
+
+
+def _num(val) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fmt(val) -> str:
+    n = _num(val)
+    if n is None:
+        return str(val)
+    return f"{n:.0f}" if n == int(n) else f"{n:.1f}"
+
+
+# ============= LINE RENDERERS =============
+
+def profile_line(profile: Dict) -> Optional[str]:
+    cur = profile.get("currentData") if isinstance(profile.get("currentData"), dict) else {}
+    parts = []
+    for key, label in PROFILE_FIELDS.items():
+        val = cur.get(key, profile.get(key))
+        if val not in (None, "", [], {}):
+            parts.append(f"{label}: {_fmt(val)}")
+    return "Profile → " + ", ".join(parts) if parts else None
+
+
+def meal_line(entry: Dict, count: int = 1) -> Optional[str]:
+    name = entry.get("meal_name")
+    if not name:
+        return None
+    dt = entry_datetime(entry, "meals")
+    when = dt.strftime("%Y-%m-%d") if dt else ""
+    if entry.get("meal_time"):
+        when = f"{when} {entry['meal_time']}".strip()
+    macros = [f"{_fmt(entry[k])}{unit}" for k, unit in
+              (("cals", " kcal"), ("protein", "g P"), ("carbs", "g C"), ("fat", "g F"))
+              if _num(entry.get(k))]
+    times = f" ×{count}" if count > 1 else ""
+    line = f"{when}: {name}{times}" if when else f"{name}{times}"
+    return f"{line} ({', '.join(macros)})" if macros else line
+
+
+def history_line(entry: Dict) -> Optional[str]:
+    dt = entry_datetime(entry, "history")
+    parts = [f"{k.replace('_', ' ')}: {_fmt(v)}" for k, v in entry.items()
+             if k not in _HISTORY_SKIP and not isinstance(v, (dict, list)) and v not in (None, "")]
+    if not parts:
+        return None
+    when = dt.strftime("%Y-%m-%d") if dt else "undated"
+    return f"{when}: " + ", ".join(parts)
+
+
+def entry_line(sub: str, entry: Dict) -> Optional[str]:
+    """Compact one-line rendering of a meals/history document."""
+    line = meal_line(entry) if sub == "meals" else history_line(entry)
+    return f"{sub.capitalize()} {line}" if line else None
+
+
+# ============= AGGREGATES =============
+
+def dedupe_meals(meals: List[Dict]) -> List[str]:
+    """
+    Collapse repeated meals (same name, case-insensitive) into one line with
+    a count, keeping the order and macros of the most recent occurrence.
+    `meals` must be newest first.
+    """
+    groups: "OrderedDict[str, list]" = OrderedDict()
+    for entry in meals:
+        name = (entry.get("meal_name") or "").strip().lower()
+        if not name:
+            continue
+        if name in groups:
+            groups[name][1] += 1
+        else:
+            groups[name] = [entry, 1]
+    lines = []
+    for entry, count in groups.values():
+        line = meal_line(entry, count)
+        if line:
+            lines.append(line)
+    return lines
+
+
+def daily_lines(rollups: List[Dict], start: date) -> List[str]:
+    """Per-day totals from dailyMacros rollups on/after `start`, newest first."""
+    lines = []
+    for r in sorted(rollups, key=lambda r: r.get("date", ""), reverse=True):
+        if r.get("date", "") < start.isoformat():
+            continue
+        lines.append(
+            f"{r['date']}: {_fmt(r.get('calories', 0))} kcal, {_fmt(r.get('protein', 0))}g P, "
+            f"{_fmt(r.get('carbs', 0))}g C, {_fmt(r.get('fat', 0))}g F ({r.get('meal_count', 0)} meals)"
+        )
+    return lines
+
+
+def weekly_lines(rollups: List[Dict], history: List[Dict], before: date) -> List[str]:
+    """
+    Weekly averages for periods before `before`: daily macros from rollups
+    and average weight from history. Newest week first.
+    """
+    weeks: Dict[date, Dict] = {}
+
+    def bucket(d: date) -> Dict:
+        monday = d - timedelta(days=d.weekday())
+        return weeks.setdefault(monday, {"days": 0, "calories": 0.0, "protein": 0.0, "weights": []})
+
+    for r in rollups:
+        try:
+            d = date.fromisoformat(r.get("date", ""))
+        except ValueError:
+            continue
+        if d >= before:
+            continue
+        w = bucket(d)
+        w["days"] += 1
+        w["calories"] += _num(r.get("calories")) or 0
+        w["protein"] += _num(r.get("protein")) or 0
+
+    for entry in history:
+        dt = entry_datetime(entry, "history")
+        weight = _num(entry.get("weight"))
+        if dt is None or weight is None or dt.date() >= before:
+            continue
+        bucket(dt.date())["weights"].append(weight)
+
+    lines = []
+    for monday in sorted(weeks, reverse=True):
+        w = weeks[monday]
+        parts = []
+        if w["days"]:
+            parts.append(f"avg {_fmt(w['calories'] / w['days'])} kcal/day, "
+                         f"{_fmt(w['protein'] / w['days'])}g P/day over {w['days']} logged days")
+        if w["weights"]:
+            parts.append(f"avg weight {_fmt(sum(w['weights']) / len(w['weights']))} kg")
+        if parts:
+            lines.append(f"week of {monday.isoformat()}: " + "; ".join(parts))
+    return lines
+
+
+# ============= BUDGETED BUILDER =============
+
+class ContextBuilder:
+    """
+    Accumulates context lines in priority order until the token budget is
+    spent. Sections are only emitted if at least one of their lines fits,
+    and a line already present (e.g. retrieved and also recent) is skipped.
+    """
+
+    def __init__(self, budget: int = CHAT_CONTEXT_TOKENS):
+        self.budget = budget
+        self.used = 0
+        self.lines: List[str] = []
+        self._seen = set()
+
+    def add(self, line: Optional[str]) -> bool:
+        if not line or line in self._seen:
+            return False
+        cost = estimate_tokens(line) + 1  # + newline
+        if self.used + cost > self.budget:
+            return False
+        self.lines.append(line)
+        self._seen.add(line)
+        self.used += cost
+        return True
+
+    def add_section(self, title: str, lines: List[str]) -> int:
+        lines = [l for l in lines if l and l not in self._seen]
+        header = f"{title}:"
+        if not lines or self.used + estimate_tokens(header) + 1 + estimate_tokens(lines[0]) + 1 > self.budget:
+            return 0
+        self.add(header)
+        added = 0
+        for line in lines:
+            if not self.add(line):
+                break
+            added += 1
+        return added
+
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+
+def build_chat_context(
+    profile: Dict,
+    retrieved: List[str],
+    recent_meals: List[Dict],
+    recent_history: List[Dict],
+    history: List[Dict],
+    rollups: List[Dict],
+    today: date,
+    budget: int = CHAT_CONTEXT_TOKENS,
+) -> ContextBuilder:
+    """
+    Fill `budget` tokens with, in order: the profile, entries retrieved for
+    the question, recent meals (deduplicated), latest body measurements,
+    the last 7 days as daily totals, and older weeks as weekly averages.
+    `recent_meals` and `recent_history` (whole documents) newest first;
+    `history` (chart fields are enough) oldest first.
+    """
+    builder = ContextBuilder(budget)
+    builder.add(profile_line(profile))
+
+    builder.add_section("Relevant entries", retrieved)
+
+    week_start = today - timedelta(days=6)
+    builder.add_section("Recent meals", dedupe_meals(recent_meals))
+    builder.add_section("Latest measurements",
+                        [l for l in (history_line(e) for e in recent_history[:5]) if l])
+    builder.add_section("Daily totals (last 7 days)", daily_lines(rollups, week_start))
+    builder.add_section("Weekly averages", weekly_lines(rollups, history, week_start))
+
+    return builder
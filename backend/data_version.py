@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from google.cloud.firestore import Query
+
+from bmibmr import profile_cache
+from async_store import get_profile, user_ref
+from read_stats import read_stats
+from rollups import ROLLUP_SUB
+from singleflight import SingleFlight
+from timestamps import TS_FIELD
+
+# How long a computed version is trusted (seconds). API meal writes and
+# profile changes bump it at once; writes made straight to Firestore from
+# the client (history) show up within this.
+DATA_VERSION_TTL = int(os.getenv("DATA_VERSION_TTL", 30))
+
+# Users whose version is kept in memory
+DATA_VERSION_MAX = int(os.getenv("DATA_VERSION_MAX", 4096))
+
+# Keys-only projection: document names and update times, no field values
+_KEYS_ONLY = ("__name__",)
+
+
+async def latest_update(user_id: str, sub: str, field: str) -> str:
+    """'<doc id>@<update time>' of the newest doc of a subcollection by `field` ('-' when empty)."""
+    query = user_ref(user_id).collection(sub).order_by(field, direction=Query.DESCENDING).limit(1)
+    docs = [doc async for doc in query.select([]).stream()]
+    read_stats.record(sub, _KEYS_ONLY, docs)
+    return f"{docs[0].id}@{docs[0].update_time}" if docs else "-"
+
+
+class DataVersions:
+    """
+    Per-user data version for conditional GETs: a hash of the profile's
+    update time, the newest history and meal documents (id + update time),
+    the most recently updated daily rollup and the UTC day (day-dependent
+    routes like todayFood/todayNutrition change at midnight).
+
+    Subcollections are probed with keys-only queries (one read each, no
+    field values). Meal writes through the API touch a rollup's updatedAt,
+    so edits and deletes change the version too; history edits of older
+    entries show up with the history cache's full resync, like the graphs
+    themselves. Concurrent requests for a user share one computation.
+
+    A computed version is kept in memory for DATA_VERSION_TTL seconds, so
+    most requests cost no reads. `bump` (API meal writes, profile listener
+    events) drops it; a computation that started before the bump is not
+    stored. Bumps are per process, so API meal writes also increment the
+    profile's dataVersion in the same batch/transaction (rollups): the
+    profile update time changes, and a kept version is only served while
+    the profile cache still holds the update time it was computed from.
+    Other workers therefore see the write as soon as their profile watch
+    does, rather than after the TTL.
+    """
+
+    def __init__(self, ttl: int = DATA_VERSION_TTL, max_users: int = DATA_VERSION_MAX):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._flights = SingleFlight()
+        # user_id -> (generation, version or None, expiry, profile update time)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations = itertools.count(1)
+        self._lock = threading.Lock()
+
+    async def get(self, user_id: str) -> str:
+        with self._lock:
+            gen, version, expiry, stamp = self._entries.get(user_id, (0, None, 0.0, None))
+        if version is not None and time.time() < expiry and profile_cache.update_time(user_id) == stamp:
+            return version
+
+        version, stamp = await self._flights.ado((user_id, gen), lambda: self._compute(user_id))
+        with self._lock:
+            if self._entries.get(user_id, (0,))[0] == gen:
+                self._put(user_id, (gen, version, time.time() + self.ttl, stamp))
+        return version
+
+    def bump(self, user_id: str):
+        """Forget a user's version after a write; thread-safe (listener threads, threadpool)."""
+        with self._lock:
+            self._put(user_id, (next(self._generations), None, 0.0, None))
+
+    def on_profile_change(self, user_id: str, old: Optional[Dict], new: Optional[Dict]):
+        self.bump(user_id)
+
+    def _put(self, user_id: str, entry: tuple):
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    async def _compute(self, user_id: str) -> tuple:
+        """(version, profile update time it includes)."""
+        # Usually a profile cache hit; raises HTTPException(404) for unknown users
+        await get_profile(user_id)
+        stamp = profile_cache.update_time(user_id)
+        parts = [
+            str(stamp),
+            datetime.now(timezone.utc).date().isoformat(),
+            *await asyncio.gather(
+                latest_update(user_id, "history", TS_FIELD),
+                latest_update(user_id, "meals", "timestamp"),
+                latest_update(user_id, ROLLUP_SUB, "updatedAt"),
+            ),
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:24], stamp
+
+
+data_versions = DataVersions()
+profile_cache.add_listener(data_versions.on_profile_change)
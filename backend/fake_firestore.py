@@ -0,0 +1,559 @@
+"""
+In-memory stand-in for the Firestore clients the backend uses (the sync
+`firestore.client()` and the async `firestore_async.client()`), so the
+FastAPI app can run without Firebase, e.g. in bench_endpoints.py.
+
+Covers the subset of the API this code base calls: documents (get, set
+with merge, update, delete, on_snapshot), queries (where, order_by,
+limit, select, start_after, stream, count), batches and transactions, plus the
+Increment / SERVER_TIMESTAMP transforms. Reads and writes are counted the
+way Firestore bills them: one read per document returned (at least one
+per query), one write per document written.
+
+    store = FakeStore()
+    install(store)      # before importing bmibmr / async_store / main
+"""
+import bisect
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import firebase_admin
+from firebase_admin import firestore, firestore_async
+from google.api_core.exceptions import NotFound
+from google.cloud.firestore_v1 import transforms
+
+_auto_ids = itertools.count(1)
+
+
+# ============= VALUES =============
+
+def sort_key(val) -> tuple:
+    """Firestore's cross-type value order: null < bool < number < timestamp < string < bytes."""
+    if val is None:
+        return (0, 0)
+    if isinstance(val, bool):
+        return (1, val)
+    if isinstance(val, (int, float)):
+        return (2, val)
+    if isinstance(val, datetime):
+        if val.tzinfo is None:
+            val = val.replace(tzinfo=timezone.utc)
+        return (3, val.timestamp())
+    if isinstance(val, str):
+        return (4, val)
+    if isinstance(val, bytes):
+        return (5, val)
+    return (6, repr(val))
+
+
+def _copy(data: Dict) -> Dict:
+    # Fresh containers per read, like a deserialized document
+    return {k: dict(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v
+            for k, v in data.items()}
+
+
+def _resolve(old: Dict, changes: Dict, now: datetime) -> Dict:
+    out = dict(old)
+    for k, v in changes.items():
+        if v is transforms.SERVER_TIMESTAMP:
+            out[k] = now
+        elif isinstance(v, transforms.Increment):
+            out[k] = (out.get(k) or 0) + v.value
+        elif v is transforms.DELETE_FIELD:
+            out.pop(k, None)
+        else:
+            out[k] = v
+    return out
+
+
+class _Record:
+    __slots__ = ("data", "create_time", "update_time")
+
+    def __init__(self, data: Dict, create_time: datetime, update_time: datetime):
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+
+# ============= STORE =============
+
+class FakeStore:
+    """
+    All documents, by collection path then document id. Sorted (value, id)
+    indexes are built per (collection, field) on first query and kept up to
+    date on writes, so ordered/range queries cost O(log n + results).
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.collections: Dict[str, Dict[str, _Record]] = {}
+        self.indexes: Dict[str, Dict[str, List[tuple]]] = {}
+        self.listeners: Dict[str, List[Callable]] = {}
+        self.reads = 0
+        self.writes = 0
+        self._last_time = datetime.now(timezone.utc)
+
+    def now(self) -> datetime:
+        # Strictly increasing, so every write gets a distinct update_time
+        with self.lock:
+            now = max(datetime.now(timezone.utc), self._last_time + timedelta(microseconds=1))
+            self._last_time = now
+            return now
+
+    # ---------- raw access (seeding; not counted) ----------
+
+    def put(self, coll: str, doc_id: str, data: Dict, update_time: Optional[datetime] = None):
+        now = update_time or self.now()
+        with self.lock:
+            docs = self.collections.setdefault(coll, {})
+            old = docs.get(doc_id)
+            docs[doc_id] = _Record(data, old.create_time if old else now, now)
+            self._reindex(coll, doc_id, old.data if old else None, data)
+
+    def count(self, coll: str) -> int:
+        return len(self.collections.get(coll, {}))
+
+    # ---------- documents ----------
+
+    def get(self, coll: str, doc_id: str) -> Optional[_Record]:
+        with self.lock:
+            self.reads += 1
+            return self.collections.get(coll, {}).get(doc_id)
+
+    def write(self, ops: List[tuple]):
+        """Apply (kind, coll, doc_id, data, merge) ops atomically: kind is set/update/delete."""
+        notify = []
+        with self.lock:
+            for kind, coll, doc_id, _, _ in ops:
+                if kind == "update" and doc_id not in self.collections.get(coll, {}):
+                    raise NotFound(f"No document to update: {coll}/{doc_id}")
+            now = self.now()
+            for kind, coll, doc_id, data, merge in ops:
+                docs = self.collections.setdefault(coll, {})
+                old = docs.get(doc_id)
+                self.writes += 1
+                if kind == "delete":
+                    if old is None:
+                        continue
+                    del docs[doc_id]
+                    self._reindex(coll, doc_id, old.data, None)
+                else:
+                    base = old.data if old is not None and (merge or kind == "update") else {}
+                    new = _resolve(base, data, now)
+                    docs[doc_id] = _Record(new, old.create_time if old else now, now)
+                    self._reindex(coll, doc_id, old.data if old else None, new)
+                path = f"{coll}/{doc_id}"
+                if path in self.listeners:
+                    notify.append(path)
+        for path in notify:
+            self._notify(path)
+
+    # ---------- listeners ----------
+
+    def listen(self, path: str, callback: Callable):
+        with self.lock:
+            self.listeners.setdefault(path, []).append(callback)
+
+    def unlisten(self, path: str, callback: Callable):
+        with self.lock:
+            callbacks = self.listeners.get(path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self.listeners.pop(path, None)
+
+    def _notify(self, path: str):
+        coll, doc_id = path.rsplit("/", 1)
+        with self.lock:
+            callbacks = list(self.listeners.get(path, []))
+            rec = self.collections.get(coll, {}).get(doc_id)
+        for callback in callbacks:
+            with self.lock:
+                self.reads += 1
+            callback([snapshot_of(self, coll, doc_id, rec)], [], self.now())
+
+    # ---------- queries ----------
+
+    def _index(self, coll: str, field: str) -> List[tuple]:
+        by_field = self.indexes.setdefault(coll, {})
+        idx = by_field.get(field)
+        if idx is None:
+            idx = sorted((sort_key(rec.data[field]), doc_id)
+                         for doc_id, rec in self.collections.get(coll, {}).items() if field in rec.data)
+            by_field[field] = idx
+        return idx
+
+    def _reindex(self, coll: str, doc_id: str, old: Optional[Dict], new: Optional[Dict]):
+        for field, idx in self.indexes.get(coll, {}).items():
+            if old is not None and field in old:
+                entry = (sort_key(old[field]), doc_id)
+                i = bisect.bisect_left(idx, entry)
+                if i < len(idx) and idx[i] == entry:
+                    del idx[i]
+            if new is not None and field in new:
+                bisect.insort(idx, (sort_key(new[field]), doc_id))
+
+    def run(self, q: "FakeQuery") -> List["FakeSnapshot"]:
+        with self.lock:
+            docs = self.collections.get(q.coll, {})
+            order = q.orders[0] if q.orders else None
+            if order is None:
+                # Firestore orders by the inequality field when there is one
+                ineq = next((f for f in q.filters if f[1] not in ("==", "in")), None)
+                order = (ineq[0], "ASCENDING") if ineq else None
+
+            if order is None:
+                ids = sorted(docs)
+                filters = q.filters
+            else:
+                field, direction = order
+                idx = self._index(q.coll, field)
+                lo, hi = 0, len(idx)
+                filters = []
+                for f in q.filters:
+                    fld, op, val = f
+                    if fld != field:
+                        filters.append(f)
+                        continue
+                    k = sort_key(val)
+                    if op == ">=":
+                        lo = max(lo, bisect.bisect_left(idx, (k,)))
+                    elif op == ">":
+                        lo = max(lo, bisect.bisect_left(idx, (k, "\U0010ffff")))
+                    elif op == "<":
+                        hi = min(hi, bisect.bisect_left(idx, (k,)))
+                    elif op == "<=":
+                        hi = min(hi, bisect.bisect_left(idx, (k, "\U0010ffff")))
+                    elif op == "==":
+                        lo = max(lo, bisect.bisect_left(idx, (k,)))
+                        hi = min(hi, bisect.bisect_left(idx, (k, "\U0010ffff")))
+                    else:
+                        filters.append(f)
+                if q.cursor is not None:
+                    snap = q.cursor
+                    at = (sort_key((snap.to_dict() or {}).get(field)), snap.id)
+                    if direction == "DESCENDING":
+                        hi = min(hi, bisect.bisect_left(idx, at))
+                    else:
+                        lo = max(lo, bisect.bisect_right(idx, at))
+                window = idx[lo:hi] if lo < hi else []
+                if direction == "DESCENDING":
+                    window = window[::-1]
+                ids = [doc_id for _, doc_id in window]
+                if len(q.orders) > 1:
+                    for fld, dirn in reversed(q.orders):
+                        ids.sort(key=lambda d: sort_key(docs[d].data.get(fld)), reverse=dirn == "DESCENDING")
+
+            out = []
+            for doc_id in ids:
+                rec = docs[doc_id]
+                if all(_match(rec.data, f) for f in filters):
+                    out.append(snapshot_of(self, q.coll, doc_id, rec, q.projection, q.is_async))
+                    if q.limit_to is not None and len(out) >= q.limit_to:
+                        break
+            self.reads += max(1, len(out))
+            return out
+
+
+def _match(data: Dict, f: tuple) -> bool:
+    field, op, val = f
+    if field not in data:
+        return False
+    a, b = sort_key(data[field]), sort_key(val)
+    if op == "==":
+        return a == b
+    if op == "!=":
+        return a != b
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    if op == ">=":
+        return a >= b
+    if op == "in":
+        return any(a == sort_key(v) for v in val)
+    if op == "array_contains":
+        return val in (data[field] or [])
+    raise ValueError(f"Unsupported operator in fake Firestore: {op}")
+
+
+# ============= SNAPSHOTS & REFERENCES =============
+
+class FakeSnapshot:
+    def __init__(self, reference, data: Optional[Dict], create_time=None, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = update_time
+
+    def to_dict(self) -> Optional[Dict]:
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return (self._data or {}).get(field)
+
+
+def snapshot_of(store: FakeStore, coll: str, doc_id: str, rec: Optional[_Record],
+                projection: Optional[List[str]] = None, is_async: bool = False) -> FakeSnapshot:
+    ref = (FakeAsyncDocumentReference if is_async else FakeDocumentReference)(store, coll, doc_id)
+    if rec is None:
+        return FakeSnapshot(ref, None)
+    data = rec.data
+    if projection is not None:
+        data = {k: data[k] for k in projection if k in data}
+    return FakeSnapshot(ref, data, rec.create_time, rec.update_time)
+
+
+class _Watch:
+    def __init__(self, store: FakeStore, path: str, callback: Callable):
+        self._store, self._path, self._callback = store, path, callback
+
+    def unsubscribe(self):
+        self._store.unlisten(self._path, self._callback)
+
+
+class FakeDocumentReference:
+    is_async = False
+
+    def __init__(self, store: FakeStore, coll: str, doc_id: str):
+        self._store = store
+        self._coll = coll
+        self.id = doc_id
+        self.path = f"{coll}/{doc_id}"
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        cls = FakeAsyncCollectionReference if self.is_async else FakeCollectionReference
+        return cls(self._store, f"{self.path}/{name}")
+
+    def _get(self, field_paths=None) -> FakeSnapshot:
+        rec = self._store.get(self._coll, self.id)
+        return snapshot_of(self._store, self._coll, self.id, rec,
+                           list(field_paths) if field_paths is not None else None, self.is_async)
+
+    def get(self, field_paths=None, transaction=None, **kwargs) -> FakeSnapshot:
+        return self._get(field_paths)
+
+    def set(self, data: Dict, merge: bool = False):
+        self._store.write([("set", self._coll, self.id, data, merge)])
+
+    def update(self, data: Dict):
+        self._store.write([("update", self._coll, self.id, data, True)])
+
+    def delete(self):
+        self._store.write([("delete", self._coll, self.id, None, False)])
+
+    def on_snapshot(self, callback: Callable) -> _Watch:
+        self._store.listen(self.path, callback)
+        # Like the real listener, the current state is delivered first
+        callback([self._get()], [], self._store.now())
+        return _Watch(self._store, self.path, callback)
+
+
+class FakeAsyncDocumentReference(FakeDocumentReference):
+    is_async = True
+
+    async def get(self, field_paths=None, transaction=None, **kwargs) -> FakeSnapshot:
+        return self._get(field_paths)
+
+    async def set(self, data: Dict, merge: bool = False):
+        super().set(data, merge)
+
+    async def update(self, data: Dict):
+        super().update(data)
+
+    async def delete(self):
+        super().delete()
+
+
+class FakeQuery:
+    is_async = False
+
+    def __init__(self, store: FakeStore, coll: str, filters=(), orders=(), limit_to=None,
+                 projection=None, cursor=None):
+        self._store = store
+        self.coll = coll
+        self.filters = list(filters)
+        self.orders = list(orders)
+        self.limit_to = limit_to
+        self.projection = projection
+        self.cursor = cursor
+
+    def _copy(self, **changes) -> "FakeQuery":
+        args = dict(filters=self.filters, orders=self.orders, limit_to=self.limit_to,
+                    projection=self.projection, cursor=self.cursor)
+        args.update(changes)
+        cls = FakeAsyncQuery if self.is_async else FakeQuery
+        return cls(self._store, self.coll, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self.orders + [(field_path, direction)])
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_to=count)
+
+    def select(self, field_paths) -> "FakeQuery":
+        # [] / ["__name__"] is a keys-only query
+        return self._copy(projection=[f for f in field_paths if f != "__name__"])
+
+    def start_after(self, snapshot: FakeSnapshot) -> "FakeQuery":
+        return self._copy(cursor=snapshot)
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self, alias or "field_1")
+
+    def stream(self, transaction=None, **kwargs):
+        return iter(self._store.run(self))
+
+    def get(self, transaction=None, **kwargs) -> List[FakeSnapshot]:
+        return self._store.run(self)
+
+
+class FakeAsyncQuery(FakeQuery):
+    is_async = True
+
+    async def stream(self, transaction=None, **kwargs):
+        for snap in self._store.run(self):
+            yield snap
+
+    async def get(self, transaction=None, **kwargs) -> List[FakeSnapshot]:
+        return self._store.run(self)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias: str, value: int):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """count() of a query: billed one read per 1000 matching documents (at least one)."""
+
+    def __init__(self, query: FakeQuery, alias: str):
+        self._query = query
+        self._alias = alias
+
+    def _count(self) -> List[List[FakeAggregationResult]]:
+        store = self._query._store
+        with store.lock:
+            before = store.reads
+            n = len(store.run(self._query))
+            store.reads = before + max(1, -(-n // 1000))
+        return [[FakeAggregationResult(self._alias, n)]]
+
+    def get(self, transaction=None, **kwargs):
+        if self._query.is_async:
+            return self._aget()
+        return self._count()
+
+    async def _aget(self):
+        return self._count()
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store: FakeStore, path: str):
+        super().__init__(store, path)
+        self.id = path.rsplit("/", 1)[-1]
+        self.path = path
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        cls = FakeAsyncDocumentReference if self.is_async else FakeDocumentReference
+        return cls(self._store, self.path, doc_id or f"auto{next(_auto_ids):012d}")
+
+    def list_documents(self, **kwargs) -> List[FakeDocumentReference]:
+        with self._store.lock:
+            ids = list(self._store.collections.get(self.path, {}))
+        return [self.document(doc_id) for doc_id in ids]
+
+
+class FakeAsyncCollectionReference(FakeCollectionReference, FakeAsyncQuery):
+    is_async = True
+
+
+# ============= BATCHES, TRANSACTIONS, CLIENTS =============
+
+class FakeWriteBatch:
+    def __init__(self, store: FakeStore):
+        self._store = store
+        self._ops: List[tuple] = []
+
+    def set(self, ref: FakeDocumentReference, data: Dict, merge: bool = False):
+        self._ops.append(("set", ref._coll, ref.id, data, merge))
+
+    def update(self, ref: FakeDocumentReference, data: Dict):
+        self._ops.append(("update", ref._coll, ref.id, data, True))
+
+    def delete(self, ref: FakeDocumentReference):
+        self._ops.append(("delete", ref._coll, ref.id, None, False))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        self._store.write(ops)
+        return []
+
+
+class FakeAsyncWriteBatch(FakeWriteBatch):
+    async def commit(self):
+        return super().commit()
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Writes queued and committed by `transactional` (no contention in one process)."""
+
+
+def transactional(fn: Callable) -> Callable:
+    """Replacement for firestore.transactional: run once, then commit."""
+    def run(transaction: FakeTransaction, *args, **kwargs):
+        with transaction._store.lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
+
+
+class FakeClient:
+    is_async = False
+
+    def __init__(self, store: FakeStore):
+        self._store = store
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        cls = FakeAsyncCollectionReference if self.is_async else FakeCollectionReference
+        return cls(self._store, name)
+
+    def collections(self, *args, **kwargs):
+        with self._store.lock:
+            names = [p for p in self._store.collections if "/" not in p]
+        return iter([self.collection(n) for n in names])
+
+    def batch(self) -> FakeWriteBatch:
+        return (FakeAsyncWriteBatch if self.is_async else FakeWriteBatch)(self._store)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self._store)
+
+
+class FakeAsyncClient(FakeClient):
+    is_async = True
+
+
+def install(store: FakeStore):
+    """
+    Route firebase_admin's Firestore clients to `store`. Call before the
+    backend modules are imported: they create their clients at import time.
+    """
+    firebase_admin.get_app = lambda *args, **kwargs: object()
+    firestore.client = lambda *args, **kwargs: FakeClient(store)
+    firestore_async.client = lambda *args, **kwargs: FakeAsyncClient(store)
+    firestore.transactional = transactional
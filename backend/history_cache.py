@@ -0,0 +1,169 @@
+import os
+import time
+import base64
+import asyncio
+import bisect
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from async_store import HISTORY_CHART_FIELDS, stream_subcollection, range_docs
+from timestamps import entry_datetime, parse_timestamp
+
+# Users whose history is kept in memory
+HISTORY_CACHE_MAX = int(os.getenv("HISTORY_CACHE_MAX", 1024))
+
+# History is append-mostly; re-read it in full this often to pick up edits/deletes (seconds)
+HISTORY_FULL_RESYNC = int(os.getenv("HISTORY_FULL_RESYNC", 60 * 60))
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+# Sorts after every document id: (dt, _LAST_ID) is "everything at dt"
+_LAST_ID = "\U0010ffff"
+
+
+# ============= CURSORS =============
+# A cursor is the (timestamp, doc_id) sort key of the last entry a client
+# has, as an opaque url-safe token. The doc id breaks ties between entries
+# logged in the same millisecond.
+
+def encode_cursor(key: tuple) -> str:
+    dt, doc_id = key
+    raw = f"{dt.isoformat()}|{doc_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple:
+    """Sort key of a cursor token. Raises ValueError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        iso, doc_id = raw.split("|", 1)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {token!r}")
+    dt = parse_timestamp(iso)
+    if dt is None:
+        raise ValueError(f"Invalid cursor: {token!r}")
+    return dt, doc_id
+
+
+def since_key(since: str) -> tuple:
+    """Sort key for `since`: a cursor token, or an ISO timestamp (strictly newer entries)."""
+    dt = parse_timestamp(since)
+    if dt is not None:
+        return dt, _LAST_ID
+    return decode_cursor(since)
+
+
+class HistorySeries:
+    """One user's history entries, kept sorted by timestamp, plus the sync cursor."""
+
+    def __init__(self):
+        self.keys: List[tuple] = []      # (datetime, doc_id), sorted
+        self.entries: List[Dict] = []    # parallel to keys
+        self.ids = set()
+        self.cursor: Optional[datetime] = None
+        self.loaded_at = time.time()
+
+    def add(self, doc_id: str, entry: Dict):
+        if doc_id in self.ids:
+            return
+        dt = entry_datetime(entry, "history")
+        key = (dt or _EPOCH, doc_id)
+        i = bisect.bisect(self.keys, key)
+        self.keys.insert(i, key)
+        self.entries.insert(i, entry)
+        self.ids.add(doc_id)
+        if dt is not None and (self.cursor is None or dt > self.cursor):
+            self.cursor = dt
+
+    def points(self, field: str, after: Optional[tuple] = None,
+               limit: Optional[int] = None) -> Tuple[List[tuple], bool]:
+        """
+        (key, entry) pairs of timestamped entries carrying `field`, oldest
+        first, strictly after the `after` key; at most `limit` of them.
+        Also returns whether more entries follow. Bisects to the start, so
+        a delta costs O(log n + new entries).
+        """
+        start = bisect.bisect_right(self.keys, after) if after is not None else 0
+        out = []
+        for i in range(start, len(self.keys)):
+            entry = self.entries[i]
+            if self.keys[i][0] is _EPOCH or field not in entry:
+                continue
+            if limit is not None and len(out) >= limit:
+                return out, True
+            out.append((self.keys[i], entry))
+        return out, False
+
+    def latest_key(self, field: str) -> Optional[tuple]:
+        """Sort key of the newest timestamped entry carrying `field`."""
+        for i in range(len(self.keys) - 1, -1, -1):
+            if self.keys[i][0] is not _EPOCH and field in self.entries[i]:
+                return self.keys[i]
+        return None
+
+
+class HistoryCache:
+    """
+    Per-user in-memory cache of the `history` subcollection.
+
+    The first call reads the whole subcollection; later calls only fetch
+    documents at or after the newest timestamp seen (the cursor), so a
+    repeat load costs O(new entries). Weight and BMI graphs are both served
+    from the same sorted series. Only `fields` are read (None: whole docs).
+    """
+
+    def __init__(self, max_users: int = HISTORY_CACHE_MAX, full_resync: int = HISTORY_FULL_RESYNC,
+                 fields: Optional[tuple] = HISTORY_CHART_FIELDS):
+        self.max_users = max_users
+        self.full_resync = full_resync
+        self.fields = fields
+        self._series: "OrderedDict[str, HistorySeries]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def entries(self, user_id: str) -> List[Dict]:
+        """History entries of a user, oldest first (treat as read-only)."""
+        return (await self.series(user_id)).entries
+
+    async def series(self, user_id: str) -> HistorySeries:
+        """A user's synced HistorySeries (treat as read-only)."""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            series = self._series.get(user_id)
+            if series is None or time.time() - series.loaded_at > self.full_resync:
+                series = await self._full_load(user_id)
+            else:
+                await self._sync(user_id, series)
+
+            self._series[user_id] = series
+            self._series.move_to_end(user_id)
+            while len(self._series) > self.max_users:
+                old_id, _ = self._series.popitem(last=False)
+                self._locks.pop(old_id, None)
+
+            return series
+
+    def invalidate(self, user_id: str):
+        self._series.pop(user_id, None)
+
+    def clear(self):
+        self._series.clear()
+
+    async def _full_load(self, user_id: str) -> HistorySeries:
+        series = HistorySeries()
+        for doc in await stream_subcollection(user_id, "history", fields=self.fields):
+            series.add(doc.id, doc.to_dict() or {})
+        return series
+
+    async def _sync(self, user_id: str, series: HistorySeries):
+        if series.cursor is None:
+            # Nothing with a usable timestamp yet; a range query can't help
+            for doc in await stream_subcollection(user_id, "history", fields=self.fields):
+                series.add(doc.id, doc.to_dict() or {})
+            return
+        # >= cursor so entries sharing the newest timestamp aren't missed; ids dedupe
+        for doc in await range_docs(user_id, "history", start=series.cursor, fields=self.fields):
+            series.add(doc.id, doc.to_dict() or {})
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,206 @@
+import os
+import gzip
+import hashlib
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+
+from data_version import data_versions
+
+try:
+    import brotli
+except ImportError:  # optional (pip install brotli): responses are gzip-only without it
+    brotli = None
+
+# JSON bodies smaller than this (bytes) are sent uncompressed
+HTTP_COMPRESS_MIN = int(os.getenv("HTTP_COMPRESS_MIN", 1024))
+
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", 6))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", 5))
+
+# Set HTTP_CONDITIONAL_GET=0 to stop emitting ETags / answering 304
+HTTP_CONDITIONAL_GET = os.getenv("HTTP_CONDITIONAL_GET", "1") != "0"
+
+# Per-user responses: browsers keep them but revalidate before every reuse
+CACHE_CONTROL = "private, no-cache"
+
+# Degraded answers (an LLM fallback): never stored, never revalidated as current
+NO_STORE = "no-store"
+
+# Per-request flags the middleware reads when the response is sent. A
+# mutable dict, so marks made in threadpool copies of the context still count.
+_response_flags: ContextVar[Optional[Dict[str, bool]]] = ContextVar("response_flags", default=None)
+
+
+# ============= HELPERS =============
+
+def route_user_id(scope) -> Optional[str]:
+    """`user_id` path parameter of the route a request will hit, if any."""
+    for route in scope["app"].router.routes:
+        match, child = route.matches(scope)
+        if match == Match.FULL:
+            return child.get("path_params", {}).get("user_id")
+    return None
+
+
+def make_etag(version: str, scope) -> str:
+    # Weak: the gzip, brotli and identity bodies are the same representation
+    url = scope["path"].encode("utf-8") + b"?" + scope.get("query_string", b"")
+    return 'W/"' + hashlib.sha256(version.encode("utf-8") + b"|" + url).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:]
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def pick_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' or 'gzip' if the client accepts it (q > 0), preferring brotli when available."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL)
+
+
+def mark_uncacheable():
+    """
+    Called by a route about to return a fallback instead of its real answer
+    (e.g. the LLM failed): the response is sent with Cache-Control: no-store
+    and no ETag, so a later request asks again instead of getting a 304.
+    Marks the whole request, so a dashboard section marks the dashboard.
+    No-op outside a request (background insight jobs).
+    """
+    flags = _response_flags.get()
+    if flags is not None:
+        flags["no_store"] = True
+
+
+# ============= MIDDLEWARE =============
+
+class ConditionalGetMiddleware:
+    """
+    ETag / If-None-Match for the per-user GET routes, plus gzip/brotli for
+    large JSON bodies on every route.
+
+    For a GET with a `user_id` path parameter the user's data version
+    (data_version.DataVersions) is computed before the route runs. When
+    If-None-Match carries the matching ETag the answer is a bare 304: no
+    document bodies are read and no LLM is called. Otherwise the route's
+    200 JSON response gets the ETag. Responses marked uncacheable (see
+    mark_uncacheable, or a route's own Cache-Control: no-store) or
+    reporting an "error" are not tagged, so a fallback isn't revalidated
+    as current. Streaming responses (SSE) pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = HTTP_COMPRESS_MIN, conditional: bool = HTTP_CONDITIONAL_GET):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.conditional = conditional
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        flags = {"no_store": False}
+        token = _response_flags.set(flags)
+        try:
+            await self._respond(scope, receive, send, headers, flags)
+        finally:
+            _response_flags.reset(token)
+
+    async def _respond(self, scope, receive, send, headers: Headers, flags: Dict[str, bool]):
+        etag = await self._etag(scope) if self.conditional and scope["method"] == "GET" else None
+        vary = "Accept-Encoding"
+
+        if etag is not None and etag_matches(headers.get("if-none-match"), etag):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [(b"etag", etag.encode("latin-1")),
+                            (b"cache-control", CACHE_CONTROL.encode("latin-1")),
+                            (b"vary", vary.encode("latin-1"))],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        encoding = pick_encoding(headers.get("accept-encoding", ""))
+        start: Optional[dict] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                out = Headers(raw=message["headers"])
+                if (not out.get("content-type", "").startswith("application/json")
+                        or "content-encoding" in out):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            out = MutableHeaders(raw=start["headers"])
+            if flags["no_store"] or NO_STORE in out.get("cache-control", ""):
+                out["Cache-Control"] = NO_STORE
+            elif etag is not None and start["status"] == 200 and b'"error":' not in body:
+                out["ETag"] = etag
+                out["Cache-Control"] = CACHE_CONTROL
+            if len(body) >= self.minimum_size:
+                out.add_vary_header(vary)
+                if encoding is not None:
+                    body = compress(body, encoding)
+                    out["Content-Encoding"] = encoding
+                    out["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
+
+    async def _etag(self, scope) -> Optional[str]:
+        user_id = route_user_id(scope)
+        if not user_id:
+            return None
+        try:
+            return make_etag(await data_versions.get(user_id), scope)
+        except HTTPException:
+            # e.g. unknown user: let the route answer
+            return None
+        except Exception as e:
+            print(f"Data version failed for {user_id}, serving without ETag: {e}")
+            return None
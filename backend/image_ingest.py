@@ -0,0 +1,116 @@
+import os
+from io import BytesIO
+from typing import Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+# Hard cap on downloaded image size (bytes, default 8 MB)
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", 8 * 1024 * 1024))
+
+# Longest side sent to the model; Gemini tiles images far smaller than phone photos
+MODEL_IMAGE_MAX_SIDE = int(os.getenv("MODEL_IMAGE_MAX_SIDE", 1024))
+MODEL_JPEG_QUALITY = 85
+
+# Anything smaller can't be a real photo
+MIN_IMAGE_BYTES = 200
+
+FETCH_TIMEOUT = 10
+
+_http: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide async HTTP client, so image fetches and Spoonacular calls reuse connections."""
+    global _http
+    if _http is None:
+        _http = httpx.AsyncClient(
+            timeout=FETCH_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        )
+    return _http
+
+
+# ============= FETCH =============
+
+async def fetch_image(url: str) -> Tuple[bytes, str]:
+    """
+    Download an image without blocking the event loop.
+    Aborts as soon as the response is known to be non-image or larger than
+    MAX_IMAGE_BYTES, instead of buffering the whole body first.
+    Returns (bytes, declared mime type); the real format is read from the
+    bytes by downscale_for_model.
+    """
+    try:
+        async with get_http_client().stream("GET", url) as resp:
+            if resp.status_code >= 400:
+                raise HTTPException(status_code=400, detail=f"Image fetch failed: {resp.status_code}")
+
+            mime_type = resp.headers.get("Content-Type", "").lower().split(";")[0].strip()
+            # Some CDNs serve images as octet-stream; let Pillow decide for those
+            if mime_type and not mime_type.startswith("image/") and mime_type != "application/octet-stream":
+                raise HTTPException(status_code=415, detail=f"URL is not an image ({mime_type})")
+
+            declared = resp.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail="Image too large")
+
+            buf = bytearray()
+            async for chunk in resp.aiter_bytes():
+                buf.extend(chunk)
+                if len(buf) > MAX_IMAGE_BYTES:
+                    raise HTTPException(status_code=413, detail="Image too large")
+
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to fetch image: {str(e)}")
+
+    if len(buf) < MIN_IMAGE_BYTES:
+        raise HTTPException(status_code=400, detail="Image too small or invalid")
+
+    return bytes(buf), mime_type
+
+
+# ============= DOWNSCALE =============
+
+def downscale_for_model(data: bytes) -> Tuple[bytes, str]:
+    """
+    Re-encode the image as JPEG with its longest side capped at
+    MODEL_IMAGE_MAX_SIDE. Small JPEG/PNG/WebP images are passed through,
+    labelled with the format Pillow detected (servers often send
+    octet-stream or a wrong Content-Type).
+    CPU-bound: call through prepare_image() from async code.
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        width, height = img.size
+    except Image.DecompressionBombError:
+        # few bytes, but a pixel count that would exhaust memory when decoded
+        raise HTTPException(status_code=413, detail="Image dimensions too large")
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(status_code=400, detail="Image too small or invalid")
+
+    mime_type = Image.MIME.get(img.format or "")
+    if (max(width, height) <= MODEL_IMAGE_MAX_SIDE
+            and mime_type in ("image/jpeg", "image/png", "image/webp")):
+        return data, mime_type
+
+    # For JPEGs, let the decoder skip straight to a reduced scale
+    img.draft("RGB", (MODEL_IMAGE_MAX_SIDE, MODEL_IMAGE_MAX_SIDE))
+    img.thumbnail((MODEL_IMAGE_MAX_SIDE, MODEL_IMAGE_MAX_SIDE))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=MODEL_JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+async def prepare_image(url: str) -> Tuple[bytes, str]:
+    """Fetch (size-bounded) and downscale an image for the model."""
+    data, _ = await fetch_image(url)
+    return await run_in_threadpool(downscale_for_model, data)
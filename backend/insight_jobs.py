@@ -0,0 +1,66 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Max AI sections generated at once in the background (across all users)
+INSIGHT_JOB_CONCURRENCY = int(os.getenv("INSIGHT_JOB_CONCURRENCY", 4))
+
+# Profile inputs the AI sections depend on; a change in anything else
+# (e.g. the frontend writing currentData.ideal_bmi back) doesn't trigger a job.
+INSIGHT_CURRENT_FIELDS = (
+    "goal", "explain_goal", "bmi", "bmr", "height", "weight", "maintenanceCalories",
+    "exercise_intensity", "any_complication", "body_type", "req_cal_intake",
+)
+INSIGHT_PROFILE_FIELDS = ("gender", "age", "diet", "budget")
+
+
+def insight_inputs(profile: Optional[Dict]) -> Dict:
+    profile = profile or {}
+    cur = profile.get("currentData") if isinstance(profile.get("currentData"), dict) else {}
+    out = {k: profile.get(k) for k in INSIGHT_PROFILE_FIELDS}
+    out.update({f"currentData.{k}": cur.get(k) for k in INSIGHT_CURRENT_FIELDS})
+    return out
+
+
+class InsightPrecomputer:
+    """
+    Regenerates a user's AI outputs in the background after their profile
+    changes, so the GET routes find them already cached.
+
+    Each section is a callable taking user_id that computes and stores its
+    result (the profile routes write into the LLM result cache). Sections
+    run on a bounded thread pool; a (user, section) already queued is not
+    queued twice.
+    """
+
+    def __init__(self, sections: Dict[str, Callable[[str], object]],
+                 concurrency: int = INSIGHT_JOB_CONCURRENCY):
+        self.sections = sections
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="insights")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, user_id: str):
+        for name in self.sections:
+            key = (user_id, name)
+            with self._lock:
+                if key in self._pending:
+                    continue
+                self._pending.add(key)
+            self._executor.submit(self._run, user_id, name)
+
+    def on_profile_change(self, user_id: str, old: Optional[Dict], new: Optional[Dict]):
+        """ProfileCache listener: schedule a refresh when an AI input changed."""
+        if new is None or old is None:
+            return
+        if insight_inputs(old) != insight_inputs(new):
+            self.schedule(user_id)
+
+    def _run(self, user_id: str, name: str):
+        with self._lock:
+            self._pending.discard((user_id, name))
+        try:
+            self.sections[name](user_id)
+        except Exception as e:
+            print(f"Background insight '{name}' failed for {user_id}: {e}")
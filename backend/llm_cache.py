@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# How long an LLM answer stays valid for identical inputs (seconds, default 24h)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 24 * 60 * 60))
+
+# Maximum number of answers kept in memory
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", 2048))
+
+# Set LLM_CACHE_PERSIST=1 to also keep answers in Firestore (survives restarts / shared by workers)
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "0") == "1"
+LLM_CACHE_COLLECTION = "llmCache"
+
+
+def make_key(route: str, model: str, temperature: float, fields: Dict[str, Any]) -> str:
+    """
+    Stable fingerprint of one LLM call: the route, model, temperature and
+    the exact profile fields its prompt consumes. Key order doesn't matter.
+    """
+    payload = json.dumps(
+        {"route": route, "model": model, "temperature": temperature, "fields": fields},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResultCache:
+    """
+    LRU + TTL cache of parsed LLM answers, with an optional Firestore tier.
+    Only store answers that parsed successfully; failures should be retried.
+    """
+
+    def __init__(self, db=None, ttl: int = LLM_CACHE_TTL, max_size: int = LLM_CACHE_MAX,
+                 persist: bool = LLM_CACHE_PERSIST):
+        self.db = db
+        self.ttl = ttl
+        self.max_size = max_size
+        self.persist = persist and db is not None
+        # key -> (value, expiry)
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached:
+                value, expiry = cached
+                if now < expiry:
+                    self._entries.move_to_end(key)
+                    return value
+                self._entries.pop(key, None)
+
+        if not self.persist:
+            return None
+
+        try:
+            doc = self.db.collection(LLM_CACHE_COLLECTION).document(key).get()
+        except Exception as e:
+            print("LLM cache read failed:", e)
+            return None
+        if not doc.exists:
+            return None
+
+        data = doc.to_dict() or {}
+        expires_at = data.get("expiresAt")
+        if expires_at is None or expires_at.timestamp() <= now:
+            return None
+
+        value = data.get("value")
+        self._store(key, value, expires_at.timestamp())
+        return value
+
+    def set(self, key: str, value: Any):
+        expiry = time.time() + self.ttl
+        self._store(key, value, expiry)
+
+        if not self.persist:
+            return
+        try:
+            self.db.collection(LLM_CACHE_COLLECTION).document(key).set({
+                "value": value,
+                "expiresAt": datetime.fromtimestamp(expiry, tz=timezone.utc),
+            })
+        except Exception as e:
+            print("LLM cache write failed:", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key: str, value: Any, expiry: float):
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from google import genai
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# Maximum number of live clients per registry
+LLM_CLIENT_MAX = int(os.getenv("LLM_CLIENT_MAX", 64))
+
+# Clients unused for this long are dropped (seconds, default 30 min)
+LLM_CLIENT_IDLE_TTL = int(os.getenv("LLM_CLIENT_IDLE_TTL", 30 * 60))
+
+
+class ClientRegistry:
+    """
+    Process-wide pool of LLM clients keyed by (api_key, model, temperature, ...).
+
+    Building a client per request throws away its HTTP connection pool and
+    TLS session; handing out the same instance lets repeat requests from a
+    user reuse the kept-alive connection. Bounded in size (LRU), and clients
+    idle for LLM_CLIENT_IDLE_TTL are closed.
+    """
+
+    def __init__(self, factory: Callable, max_size: int = LLM_CLIENT_MAX,
+                 idle_ttl: int = LLM_CLIENT_IDLE_TTL):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        # key -> (client, last_used)
+        self._clients: "OrderedDict[Hashable, tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *key):
+        now = time.time()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry:
+                client = entry[0]
+            else:
+                client = self.factory(*key)
+            self._clients[key] = (client, now)
+            self._clients.move_to_end(key)
+            # Over capacity: drop the least recently used without closing it,
+            # since a request may still be using it; GC releases its pool.
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+
+        for old in evicted:
+            _close(old)
+        return client
+
+    def __len__(self):
+        return len(self._clients)
+
+    def clear(self):
+        with self._lock:
+            clients = [c for c, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            _close(client)
+
+    def _evict_idle(self, now: float) -> list:
+        evicted = []
+        # Oldest entries are at the front; stop at the first fresh one
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            evicted.append(client)
+        return evicted
+
+
+def _close(client):
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+
+# ============= REGISTRIES =============
+
+def _make_chat(api_key: str, model: str, temperature: float) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, api_key=api_key)
+
+
+def _make_genai(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+
+chat_clients = ClientRegistry(_make_chat)
+genai_clients = ClientRegistry(_make_genai)
+
+
+def get_chat(api_key: str, temperature: float, model: str = DEFAULT_MODEL) -> ChatGoogleGenerativeAI:
+    """Shared ChatGoogleGenerativeAI for (api_key, model, temperature)."""
+    return chat_clients.get(api_key, model, float(temperature))
+
+
+def get_genai_client(api_key: str) -> genai.Client:
+    """Shared google-genai Client for an API key."""
+    return genai_clients.get(api_key)
@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+
+# Token bucket per API key: sustained requests/minute and burst size
+LLM_RATE_PER_MIN = float(os.getenv("LLM_RATE_PER_MIN", 60))
+LLM_BURST = float(os.getenv("LLM_BURST", 10))
+
+# AIMD concurrency window per API key
+LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", 1))
+LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", 16))
+LLM_CONCURRENCY_START = int(os.getenv("LLM_CONCURRENCY_START", 4))
+
+# Total time a call may spend queued + retrying before giving up (seconds)
+LLM_RETRY_DEADLINE = float(os.getenv("LLM_RETRY_DEADLINE", 20))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", 0.5))
+LLM_RETRY_CAP = float(os.getenv("LLM_RETRY_CAP", 8))
+
+# API keys tracked at once (per-user keys are possible)
+LLM_SCHEDULER_MAX_KEYS = int(os.getenv("LLM_SCHEDULER_MAX_KEYS", 1024))
+
+# How often a waiter re-checks for a free slot (seconds)
+_POLL = 0.05
+
+_RETRY_DELAY = re.compile(r"retry(?:Delay)?\D{0,10}?(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class RateLimited(HTTPException):
+    """Raised when a call could not get through before its deadline."""
+
+    def __init__(self, retry_after: float):
+        seconds = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=429,
+            detail="Rate limit hit. Wait a moment and retry.",
+            headers={"Retry-After": str(seconds)},
+        )
+        self.retry_after = retry_after
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """
+    True for Gemini quota/rate-limit errors, whichever client raised them:
+    judged by exception type or HTTP status, never by message text. Wrapped
+    errors (langchain re-raises the SDK's) are checked down the cause chain.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (ResourceExhausted, TooManyRequests)):
+            return True
+        if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+            return True
+        if getattr(exc, "status", None) == "RESOURCE_EXHAUSTED":
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Server-suggested delay (e.g. "retryDelay: '12s'"), if the error carries one."""
+    match = _RETRY_DELAY.search(str(exc))
+    return float(match.group(1)) if match else None
+
+
+class KeyState:
+    """
+    Admission state for one API key: a token bucket for the request rate
+    and an AIMD concurrency window (additive increase on success,
+    multiplicative decrease on 429, at most once per cool-down).
+    """
+
+    def __init__(self, rate: float, burst: float, start: int, lo: int, hi: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.limit = float(start)
+        self.lo, self.hi = lo, hi
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.refilled = time.monotonic()
+
+    def try_acquire(self, now: float) -> float:
+        """Take a slot and a token; returns 0 on success, else seconds to wait."""
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return _POLL
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0.0
+
+    def release(self, now: float, throttled: bool, pause: float = 0.0):
+        self.in_flight -= 1
+        if not throttled:
+            self.limit = min(self.hi, self.limit + 1 / self.limit)
+            return
+        # Calls already in flight when the key got throttled will fail too;
+        # halve once per pause instead of once per failure.
+        if now >= self.paused_until:
+            self.limit = max(self.lo, self.limit / 2)
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, now + pause)
+
+
+class LLMScheduler:
+    """
+    Wraps every Gemini call: waits for the key's token bucket and
+    concurrency window, and retries rate-limited calls with full-jitter
+    exponential backoff until the deadline. Bursts queue briefly instead
+    of failing, and a throttled key is backed off rather than hammered.
+    """
+
+    def __init__(self, rate_per_min: float = LLM_RATE_PER_MIN, burst: float = LLM_BURST,
+                 start: int = LLM_CONCURRENCY_START, lo: int = LLM_CONCURRENCY_MIN,
+                 hi: int = LLM_CONCURRENCY_MAX, deadline: float = LLM_RETRY_DEADLINE,
+                 max_keys: int = LLM_SCHEDULER_MAX_KEYS):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.start, self.lo, self.hi = start, lo, hi
+        self.deadline = deadline
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, KeyState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def state(self, api_key: Optional[str]) -> KeyState:
+        # Keyed by a digest so raw API keys aren't kept around as dict keys
+        key = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            st = self._states.get(key)
+            if st is None:
+                st = KeyState(self.rate, self.burst, self.start, self.lo, self.hi)
+                self._states[key] = st
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+            return st
+
+    # ---------- admission ----------
+
+    def _try(self, st: KeyState, end: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = st.try_acquire(now)
+        if wait and now + wait > end:
+            raise RateLimited(wait)
+        return wait
+
+    def _release(self, st: KeyState, exc: Optional[BaseException], attempt: int) -> float:
+        throttled = exc is not None and is_rate_limited(exc)
+        pause = 0.0
+        if throttled:
+            pause = retry_after(exc) or random.uniform(0, min(LLM_RETRY_CAP, LLM_RETRY_BASE * 2 ** attempt))
+        with self._lock:
+            st.release(time.monotonic(), throttled, pause)
+        return pause
+
+    def acquire(self, st: KeyState, end: float):
+        while True:
+            wait = self._try(st, end)
+            if not wait:
+                return
+            time.sleep(min(wait, _POLL))
+
+    async def aacquire(self, st: KeyState, end: float):
+        while True:
+            wait = self._try(st, end)
+            if not wait:
+                return
+            await asyncio.sleep(min(wait, _POLL))
+
+    # ---------- calls ----------
+
+    def call(self, api_key: Optional[str], fn: Callable, deadline: Optional[float] = None):
+        st = self.state(api_key)
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            self.acquire(st, end)
+            try:
+                result = fn()
+            except Exception as e:
+                pause = self._release(st, e, attempt)
+                if not is_rate_limited(e):
+                    raise
+                if time.monotonic() + pause > end:
+                    raise RateLimited(pause) from e
+                attempt += 1
+                continue
+            self._release(st, None, attempt)
+            return result
+
+    async def acall(self, api_key: Optional[str], fn: Callable[[], Awaitable],
+                    deadline: Optional[float] = None):
+        st = self.state(api_key)
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            await self.aacquire(st, end)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self._release(st, None, attempt)
+                raise
+            except Exception as e:
+                pause = self._release(st, e, attempt)
+                if not is_rate_limited(e):
+                    raise
+                if time.monotonic() + pause > end:
+                    raise RateLimited(pause) from e
+                attempt += 1
+                continue
+            self._release(st, None, attempt)
+            return result
+
+    async def astream(self, api_key: Optional[str], fn: Callable[[], AsyncIterator],
+                      deadline: Optional[float] = None):
+        """
+        Stream under the scheduler. A rate-limit error is only retried
+        before the first chunk; after that the caller has seen output.
+        """
+        st = self.state(api_key)
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+        while True:
+            await self.aacquire(st, end)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                # cancelled, or the consumer stopped reading
+                self._release(st, None, attempt)
+                raise
+            except Exception as e:
+                pause = self._release(st, e, attempt)
+                if started or not is_rate_limited(e):
+                    raise
+                if time.monotonic() + pause > end:
+                    raise RateLimited(pause) from e
+                attempt += 1
+                continue
+            self._release(st, None, attempt)
+            return
+
+
+def chat_api_key(chat) -> Optional[str]:
+    """API key a ChatGoogleGenerativeAI instance was built with."""
+    secret = getattr(chat, "google_api_key", None)
+    return secret.get_secret_value() if secret is not None else None
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from image_ingest import get_http_client
+from nutrition_db import (
+    NUTRITION_FALLBACK_CONFIDENCE,
+    NUTRITION_MIN_CONFIDENCE,
+    local_result,
+    normalize_name,
+    nutrition_index,
+)
+from singleflight import SingleFlight
+
+SPOON_KEY = os.getenv("SPOONACULAR_API_KEY", "YOUR_SPOONACULAR_KEY_HERE")
+SPOON_GUESS_URL = "https://api.spoonacular.com/recipes/guessNutrition"
+SPOON_TIMEOUT = 10
+
+# On-disk cache of name -> macros (SQLite); set to "" to keep the cache in memory only
+MACRO_CACHE_DB = os.getenv("MACRO_CACHE_DB", os.path.join(os.path.dirname(__file__), "macro_cache.sqlite3"))
+
+# Names kept in memory in front of the SQLite store
+MACRO_CACHE_MAX = int(os.getenv("MACRO_CACHE_MAX", 4096))
+
+# How long answers stay valid (seconds): found macros 30 days, "not found" 1 day
+MACRO_CACHE_TTL = int(os.getenv("MACRO_CACHE_TTL", 30 * 24 * 60 * 60))
+MACRO_NEGATIVE_TTL = int(os.getenv("MACRO_NEGATIVE_TTL", 24 * 60 * 60))
+
+# Max Spoonacular requests in flight for one batch
+MACRO_BATCH_CONCURRENCY = int(os.getenv("MACRO_BATCH_CONCURRENCY", 8))
+MACRO_BATCH_MAX = 50
+
+
+class MacroCache:
+    """
+    Food name -> macros lookup cache: an in-memory LRU in front of a small
+    SQLite table, so answers survive restarts. "Not found" answers are
+    cached too, with a shorter TTL.
+
+    get / set are async: memory hits stay on the event loop, SQLite reads
+    and writes run in the threadpool.
+    """
+
+    def __init__(self, path: Optional[str] = MACRO_CACHE_DB, max_size: int = MACRO_CACHE_MAX,
+                 ttl: int = MACRO_CACHE_TTL, negative_ttl: int = MACRO_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # name -> (result, expiry)
+        self._entries: "OrderedDict[str, tuple[Dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # the connection is shared by threadpool workers; one statement at a time
+        self._db_lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS macros ("
+                "name TEXT PRIMARY KEY, result TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    async def get(self, name: str) -> Optional[Dict]:
+        cached = self._memory_get(name)
+        if cached is not None or self._conn is None:
+            return cached
+        return await run_in_threadpool(self._load, name)
+
+    async def set(self, name: str, result: Dict):
+        expires = self._expiry(result)
+        with self._lock:
+            self._remember(name, result, expires)
+        if self._conn is not None:
+            await run_in_threadpool(self._store, name, result, expires)
+
+    def _expiry(self, result: Dict) -> float:
+        return time.time() + (self.ttl if result.get("found") else self.negative_ttl)
+
+    def _memory_get(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            cached = self._entries.get(name)
+            if cached and time.time() < cached[1]:
+                self._entries.move_to_end(name)
+                return cached[0]
+            self._entries.pop(name, None)
+            return None
+
+    def _load(self, name: str) -> Optional[Dict]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT result, expires FROM macros WHERE name = ?", (name,)).fetchone()
+        if row is None or time.time() >= row[1]:
+            return None
+        result = json.loads(row[0])
+        with self._lock:
+            self._remember(name, result, row[1])
+        return result
+
+    def _store(self, name: str, result: Dict, expires: float):
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO macros (name, result, expires) VALUES (?, ?, ?)",
+                (name, json.dumps(result), expires),
+            )
+            self._conn.commit()
+
+    def _remember(self, name: str, result: Dict, expires: float):
+        self._entries[name] = (result, expires)
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+macro_cache = MacroCache()
+_flights = SingleFlight()
+
+
+# ============= SPOONACULAR =============
+
+def parse_guess(data: Dict) -> Dict:
+    """Macros from a guessNutrition answer; found=False when Spoonacular couldn't guess."""
+    # guessNutrition responds with keys: calories, protein, carbs, fat each like {"value": X, "unit": "g"}
+    def get_val(key):
+        val = data.get(key, {}) or {}
+        # some keys might be nested differently; resilient extraction
+        if isinstance(val, dict):
+            return val.get("value", 0)
+        try:
+            return float(val)
+        except Exception:
+            return 0
+
+    macros = {
+        "calories": float(get_val("calories") or 0),
+        "protein": float(get_val("protein") or 0),
+        "carbs": float(get_val("carbs") or 0),
+        "fat": float(get_val("fat") or 0),
+    }
+    # If all values are 0 or not present, treat as not found
+    found = any(v != 0 for v in macros.values())
+    if not found:
+        macros = {k: 0 for k in macros}
+    return {"found": found, **macros, "confidence": data.get("confidence", None)}
+
+
+async def fetch_spoonacular(name: str) -> Dict:
+    """
+    One guessNutrition call. Returns a cacheable result, or one carrying
+    "error" for a transient Spoonacular failure (not cached).
+    """
+    if not SPOON_KEY:
+        raise HTTPException(status_code=500, detail="Spoonacular API key not configured on server")
+    try:
+        resp = await get_http_client().get(
+            SPOON_GUESS_URL, params={"title": name, "apiKey": SPOON_KEY}, timeout=SPOON_TIMEOUT)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Network/requests error: {str(e)}")
+
+    if resp.status_code == 401:
+        # explicit auth failure
+        raise HTTPException(status_code=502, detail=f"Spoonacular unauthorized: {resp.text}")
+    if resp.status_code != 200:
+        # relay message
+        return {"found": False, "error": f"Spoonacular error: {resp.status_code}", "details": resp.text}
+    return parse_guess(resp.json())
+
+
+# ============= LOOKUPS =============
+
+async def lookup_macros(name: str) -> Dict:
+    """
+    Macros for a food name. Keys: found, calories, protein, carbs, fat,
+    confidence, source ("local" or "spoonacular"); local answers also
+    carry the matched food and its serving.
+
+    The bundled table answers confident matches with no network call;
+    otherwise Spoonacular (cached) is asked. If Spoonacular fails, a
+    weaker local match is still better than nothing.
+    """
+    local = nutrition_index.match(name)
+    if local and local[1] >= NUTRITION_MIN_CONFIDENCE:
+        return local_result(*local)
+
+    key = normalize_name(name)
+    cached = await macro_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        result = await fetch_spoonacular(name)
+        if "error" not in result:
+            result["source"] = "spoonacular"
+            await macro_cache.set(key, result)
+        return result
+
+    try:
+        # Concurrent lookups of the same name share one request
+        result = await _flights.ado(key, fetch)
+    except HTTPException:
+        if local and local[1] >= NUTRITION_FALLBACK_CONFIDENCE:
+            return local_result(*local)
+        raise
+    if "error" in result and local and local[1] >= NUTRITION_FALLBACK_CONFIDENCE:
+        return local_result(*local)
+    return result
+
+
+async def lookup_many(names: List[str], concurrency: int = MACRO_BATCH_CONCURRENCY) -> List[Dict]:
+    """
+    Resolve many names concurrently (at most `concurrency` Spoonacular
+    calls at once). Results are in input order; a failed name gets
+    found=False with an "error" instead of failing the batch.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(name: str) -> Dict:
+        async with sem:
+            try:
+                return await lookup_macros(name)
+            except HTTPException as e:
+                return {"found": False, "error": e.detail}
+
+    return list(await asyncio.gather(*(one(n) for n in names)))
@@ -1,20 +1,21 @@
 import os
 import json
+import asyncio
 import traceback
 import time
-from fastapi import FastAPI, HTTPException, Body, Query, BackgroundTasks
+import hashlib
+from fastapi import FastAPI, HTTPException, Body, Query, BackgroundTasks, Depends
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from google import genai
 from google.genai import types
-import requests
 import re
 from datetime import datetime, timedelta, timezone
 
 from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 import firebase_admin
 from firebase_admin import credentials, firestore
@@ -26,9 +27,39 @@ from bmibmr import (
     fetch_bmi_firestore,
     fetch_bmr_firestore,
     fetch_req_cal_firestore,
-    ans_query_on_demand,
-    health_summary
+    wrap_context,
+    health_summary,
+    get_user_profile,
+    profile_cache
 )
+from async_store import get_profile, latest_docs
+from read_stats import read_stats
+from auth_guard import require_owner
+from http_cache import ConditionalGetMiddleware, mark_uncacheable
+from data_version import data_versions
+from timestamps import TS_FIELD, parse_timestamp, decoder_for
+from image_ingest import prepare_image
+from llm_clients import get_chat, get_genai_client
+from history_cache import history_cache, HistorySeries, encode_cursor, decode_cursor, since_key
+from rag_index import rag_index, get_embedder
+from context_builder import build_chat_context
+from insight_jobs import InsightPrecomputer
+from singleflight import llm_flights
+from llm_scheduler import llm_scheduler, RateLimited
+from macro_lookup import MACRO_BATCH_MAX, lookup_macros, lookup_many
+from metrics import compute_metrics
+from trends import TREND_PROMPT_POINTS, analyze, series_arrays, trend_summary, recent_history
+from meal_ratings import MEAL_RATING_MODEL, rating_fingerprint, stored_rating, parse_ratings, save_ratings
+from rollups import (
+    add_meal,
+    update_meal,
+    delete_meal,
+    read_rollups,
+    nutrition_for_day,
+    macro_totals,
+    protein_series
+)
+from llm_cache import LLMResultCache, make_key
 
 # Load environment variables
 load_dotenv()
@@ -43,6 +74,9 @@ origins = [
 # Initialize FastAPI app
 app = FastAPI()
 
+# ETag/304 on per-user GETs and gzip/brotli for large JSON (inside CORS, so 304s carry CORS headers)
+app.add_middleware(ConditionalGetMiddleware)
+
 # Enable CORS (dev: allow all; change for production)
 app.add_middleware(
     CORSMiddleware,
@@ -69,16 +103,20 @@ except ValueError:
 
 db = firestore.client()
 Gemini_API = db.collections("users")
+
+# Parsed answers of the deterministic profile prompts, keyed by their exact inputs
+llm_cache = LLMResultCache(db)
 # ---------- Helpers: timestamp parsing & safe sorting ----------
 _GEMINI_KEY_CACHE: Dict[str, tuple[str, float]] = {}
 
 # Cache TTL in seconds (e.g. 3 hours)
 GEMINI_KEY_TTL = 3 * 60 * 60  # 3 hours
 
-def get_gemini_api_key(user_id: str) -> str:
+def get_gemini_api_key(user_id: str, profile: Optional[dict] = None) -> str:
     """
     Fetch Gemini API key for a user with TTL-based caching.
     Cache auto-expires after GEMINI_KEY_TTL seconds.
+    Pass the request's already-loaded `profile` to avoid another lookup.
     """
 
     now = time.time()
@@ -93,13 +131,11 @@ def get_gemini_api_key(user_id: str) -> str:
             # expired → remove
             _GEMINI_KEY_CACHE.pop(user_id, None)
 
-    # 2️⃣ Fetch from Firestore
-    doc = db.collection("users").document(user_id).get()
+    # 2️⃣ Read from the shared profile snapshot (one Firestore read per user, not per route)
+    if profile is None:
+        profile = get_user_profile(user_id)
 
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    gemini_api = doc.to_dict().get("gemini_api")
+    gemini_api = profile.get("gemini_api")
 
     if not gemini_api:
         raise HTTPException(
@@ -116,56 +152,43 @@ def get_gemini_api_key(user_id: str) -> str:
     return gemini_api
 
 
-def parse_timestamp(val) -> Optional[datetime]:
+# Largest page of a history graph
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", 1000))
+
+# Meals per page of the meal history (and the most one page may ask for)
+MEALS_PAGE_SIZE = 5
+MEALS_PAGE_MAX = 50
+
+
+def history_page(series: HistorySeries, field: str, after: Optional[str] = None,
+                 since: Optional[str] = None, limit: Optional[int] = None) -> Dict:
     """
-    Accepts Firestore Timestamp-like objects (with to_datetime),
-    ISO strings, or datetime objects. Returns datetime (tz-aware UTC)
-    or None if invalid.
+    {"data": [{"date": iso, field: value}], "next": cursor, "cursor": cursor}
+    for history entries that carry `field` and a valid timestamp, sorted by
+    date ascending (Option C: invalid timestamps are skipped).
+
+    - `after`: cursor from a previous page's "next"; returns the entries after it.
+    - `since`: "cursor" from an earlier response (or an ISO timestamp); returns
+      only entries newer than it, so a client holding the series fetches deltas.
+    - `limit`: page size; "next" is set while more entries follow.
+
+    "cursor" always points at the newest entry, whatever page was requested.
+    Deltas only carry new entries: clients refetch in full to see edits/deletes.
     """
-    if val is None:
-        return None
+    if after and since:
+        raise HTTPException(status_code=400, detail="Pass either after or since, not both")
+    try:
+        key = decode_cursor(after) if after else since_key(since) if since else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Firestore timestamp object
-    if hasattr(val, "to_datetime") and callable(getattr(val, "to_datetime")):
-        try:
-            dt = val.to_datetime()
-            # Ensure tz-aware (Firestore usually returns tz-aware)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt
-        except Exception:
-            return None
-
-    # datetime instance
-    if isinstance(val, datetime):
-        if val.tzinfo is None:
-            return val.replace(tzinfo=timezone.utc)
-        return val
-
-    # string ISO format
-    if isinstance(val, str):
-        s = val.strip()
-        if not s:
-            return None
-        # Try several common iso variants
-        try:
-            # handle trailing Z
-            s_mod = s.replace("Z", "+00:00")
-            dt = datetime.fromisoformat(s_mod)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt
-        except Exception:
-            # last resort: try to parse common formats
-            try:
-                # e.g., "2025-11-01T15:10:54.784"
-                dt = datetime.strptime(s.split(".")[0], "%Y-%m-%dT%H:%M:%S")
-                return dt.replace(tzinfo=timezone.utc)
-            except Exception:
-                return None
-
-    # unknown type
-    return None
+    points, more = series.points(field, after=key, limit=limit)
+    latest = series.latest_key(field)
+    return {
+        "data": [{"date": k[0].isoformat(), field: entry.get(field)} for k, entry in points],
+        "next": encode_cursor(points[-1][0]) if more else None,
+        "cursor": encode_cursor(latest) if latest else None,
+    }
 
 
 def filter_and_sort_by_timestamp(items: List[Dict], key_name: str = "date", output_ts_field: Optional[str] = None) -> List[Dict]:
@@ -196,47 +219,11 @@ def filter_and_sort_by_timestamp(items: List[Dict], key_name: str = "date", outp
 @app.get("/api/user/{user_id}/bmi")
 def get_bmi(user_id: str):
     try:
-        api_key = get_gemini_api_key(user_id)
-        data = fetch_bmi_firestore(user_id)
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.2,
-            api_key=api_key,
-        )
-
-        template = f"""
-        You are a great fitness coach. Analyze the following person's fitness data and provide a structured response.
-
-        Current data:
-        - Current BMI : {data.get('bmi')}
-        - Current Weight: {data.get('weight')}
-        - Current Height: {data.get('height')}
-        - Current Goal: {data.get('goal')}
-
-        Provide a JSON object:
-        {{
-            "ideal_bmi": <number>
-        }}
-
-        IMPORTANT:
-        - Return ONLY valid JSON
-        - ideal_bmi should be a number, not a string
-        """
-
-        response = chat.invoke(template)
-
-        try:
-            ai_data = json.loads(response.content)
-        except json.JSONDecodeError:
-            content = response.content.strip()
-            start = content.find("{")
-            end = content.rfind("}") + 1
-            if start != -1 and end != 0:
-                ai_data = json.loads(content[start:end])
-            else:
-                ai_data = {"ideal_bmi": None}
+        profile = get_user_profile(user_id)
+        fetch_bmi_firestore(user_id, profile)  # 404s when the user has no BMI yet
 
-        return {"ideal_bmi": ai_data.get("ideal_bmi")}
+        # Formula-derived (metrics.ideal_bmi); no LLM call needed for a number
+        return {"ideal_bmi": compute_metrics(profile)["ideal_bmi"]}
 
     except Exception as e:
         print(f"Error in get_bmi: {str(e)}")
@@ -247,15 +234,26 @@ def get_bmi(user_id: str):
 
 # ----------------------------- BMR ROUTE -----------------------------
 @app.get("/api/user/{user_id}/bmr")
-def get_bmr(user_id: str):
+def get_bmr(user_id: str, narrative: bool = True):
+    """
+    ideal_bmr comes from metrics (BMR at the goal weight). Gemini only
+    writes the one-line `ai_response`; skipped with ?narrative=false, and
+    a failed narrative still returns the number.
+    """
     try:
-        api_key = get_gemini_api_key(user_id)
-        data = fetch_bmr_firestore(user_id)
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.4,
-            api_key=api_key,
-        )
+        profile = get_user_profile(user_id)
+        data = fetch_bmr_firestore(user_id, profile)
+        result = {"ai_response": None, "ideal_bmr": compute_metrics(profile)["ideal_bmr"]}
+        if not narrative:
+            return result
+
+        cache_key = make_key("bmr", "gemini-2.5-flash", 0.4, {**data, "ideal_bmr": result["ideal_bmr"]})
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return {**result, "ai_response": cached}
+
+        api_key = get_gemini_api_key(user_id, profile)
+        chat = get_chat(api_key, temperature=0.4)
 
         template = f"""
         You are a great fitness coach. Analyze the following person's data and return structured JSON.
@@ -263,6 +261,7 @@ def get_bmr(user_id: str):
         Data:
         - Goal: {data.get('goal')}
         - BMR: {data.get('bmr')}
+        - BMR at goal weight: {result['ideal_bmr']}
         - Height: {data.get('height')} cm
         - Weight: {data.get('weight')} kg
         - Gender: {data.get('gender')}
@@ -270,32 +269,31 @@ def get_bmr(user_id: str):
 
         Return:
         {{
-            "ai_response": "What can you determine by looking at BMR and goal and other data. Just tell in a one very short line under 10 words.",
-            "ideal_bmr": <number>
+            "ai_response": "What can you determine by looking at BMR and goal and other data. Just tell in a one very short line under 10 words."
         }}
         """
 
-        response = chat.invoke(template)
-
         try:
-            ai_data = json.loads(response.content)
-        except json.JSONDecodeError:
+            response = llm_flights.invoke("bmr", user_id, chat, template)
             content = response.content.strip()
             start = content.find("{")
             end = content.rfind("}") + 1
-            if start != -1 and end != 0:
-                ai_data = json.loads(content[start:end])
-            else:
-                ai_data = {
-                    "ai_response": "Unable to generate structured response.",
-                    "ideal_bmr": None,
-                }
+            ai_data = json.loads(content[start:end]) if start != -1 and end != 0 else {}
+        except RateLimited:
+            raise
+        except Exception as e:
+            print(f"BMR narrative failed for {user_id}: {e}")
+            ai_data = {}
 
-        return {
-            "ai_response": ai_data.get("ai_response"),
-            "ideal_bmr": ai_data.get("ideal_bmr"),
-        }
+        if ai_data.get("ai_response"):
+            result["ai_response"] = ai_data["ai_response"]
+            llm_cache.set(cache_key, result["ai_response"])
+        else:
+            mark_uncacheable()
+        return result
 
+    except RateLimited:
+        raise
     except Exception as e:
         print(f"Error in get_bmr: {str(e)}")
         traceback.print_exc()
@@ -305,40 +303,21 @@ def get_bmr(user_id: str):
 
 # ----------------------------- WEIGHT HISTORY -----------------------------
 @app.get("/api/user/weight/{user_id}")
-async def get_user_weight(user_id: str):
+async def get_user_weight(user_id: str,
+                          limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX),
+                          after: Optional[str] = None,
+                          since: Optional[str] = None):
     try:
-        api_key = get_gemini_api_key(user_id)
-        history_ref = db.collection("users").document(user_id).collection("history")
-        docs = history_ref.stream()
-        data = []
+        profile = await get_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        # Shared incremental cache: only history newer than the last sync is read
+        series = await history_cache.series(user_id)
 
-        for doc in docs:
-            entry = doc.to_dict() or {}
-            # Only accept entries that have weight and a valid timestamp
-            ts = entry.get("timestamp")
-            dt = parse_timestamp(ts)
-            if dt is None:
-                continue  # Option C: skip invalid timestamps
-            if "weight" in entry:
-                data.append({
-                    "date": dt,  # keep datetime for sorting helper
-                    "weight": entry.get("weight"),
-                })
-
-        # Convert and sort using helper (it expects items with 'date' key as datetime-like)
-        # Prepare list with raw datetime objects stored under 'date', filter already done
-        # Now convert to iso strings and sort
-        formatted = []
-        for item in data:
-            dt = item["date"]
-            formatted.append({
-                "date": dt.isoformat(),
-                "weight": item["weight"]
-            })
-        # sort by date ascending
-        formatted.sort(key=lambda x: x["date"])
-        return {"data": formatted}
+        # Only entries that have weight and a valid timestamp, sorted by date ascending
+        return history_page(series, "weight", after=after, since=since, limit=limit)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("Error in get_user_weight:", e)
         traceback.print_exc()
@@ -347,23 +326,34 @@ async def get_user_weight(user_id: str):
 
 # ----------------------------- MEAL HISTORY -----------------------------
 @app.get("/api/user/meals/{user_id}")
-async def get_user_meals(user_id: str):
+async def get_user_meals(user_id: str,
+                         limit: int = Query(MEALS_PAGE_SIZE, ge=1, le=MEALS_PAGE_MAX),
+                         after: Optional[str] = None):
+    """
+    Latest `limit` meals with goal ratings, newest first. `next` is the
+    doc_id to pass as `after` for the page of older meals (None on the last page).
+    """
     try:
-        api_key = get_gemini_api_key(user_id)
-        # 1️⃣ Fetch only latest 5 meals (ordered by timestamp descending) from Firestore
-        meals_ref = db.collection("users").document(user_id).collection("meals")
-        docs = meals_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(20).stream()
+        profile = await get_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        # 1️⃣ Fetch only the latest meals (ordered by timestamp descending) from Firestore,
+        # with headroom for entries skipped below
+        fetch_limit = max(20, limit * 4)
+        docs = await latest_docs(user_id, "meals", limit=fetch_limit, after=after)
 
-        firestore_data = health_summary(user_id)
+        firestore_data = health_summary(user_id, profile)
+        goal, goal_exp = firestore_data.get('goal'), firestore_data.get('exp_goal')
 
         latest_meals = []
+        fingerprints = {}
+        stored = {}
         for doc in docs:
             entry = doc.to_dict() or {}
             if "meal_name" not in entry:
                 continue
 
             ts = entry.get("timestamp")
-            dt = parse_timestamp(ts)
+            dt = decoder_for("meals", "timestamp").decode(ts)
             if dt is None:
                 # Option C: skip entries without valid timestamps
                 continue
@@ -378,43 +368,73 @@ async def get_user_meals(user_id: str):
                 "fats": entry.get("fat"),
                 "protein": entry.get("protein"),
             })
+            fingerprints[doc.id] = rating_fingerprint(goal, goal_exp, entry)
+            stored[doc.id] = stored_rating(entry, fingerprints[doc.id])
 
         # If no meals after filtering, return empty array
         if not latest_meals:
-            return {"data": []}
+            return {"data": [], "next": None}
 
         # Sort by timestamp descending (most recent first)
         latest_meals.sort(key=lambda x: x["timestamp"], reverse=True)
-        # Keep only the top 5 after sorting
-        latest_meals = latest_meals[:5]
+        # Keep only the top `limit` after sorting
+        more = len(latest_meals) > limit or len(docs) == fetch_limit
+        latest_meals = latest_meals[:limit]
 
         # Convert timestamp -> iso string
         for m in latest_meals:
             if isinstance(m["timestamp"], datetime):
                 m["timestamp"] = m["timestamp"].isoformat()
 
-        # 2️⃣ Prepare items for prompt
-        items_for_prompt = [
-            {
-                "doc_id": m["doc_id"],
-                "meal_name": m["meal_name"],
-                "protein": m.get("protein"),
-                "carbs": m.get("carbs"),
-                "fats": m.get("fats"),
-                "calories": m.get("cals"),
-            }
-            for m in latest_meals
-        ]
+        # 2️⃣ Only meals without a rating for the current goal + macros go to Gemini
+        rating_map = {m["doc_id"]: stored[m["doc_id"]] for m in latest_meals if stored[m["doc_id"]]}
+        unrated = [m for m in latest_meals if m["doc_id"] not in rating_map]
+        if unrated:
+            rating_map.update(await rate_meals(user_id, api_key, goal, goal_exp, unrated, fingerprints))
 
-        # 3️⃣ Configure Gemini
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
-            api_key=api_key,
-        )
+        # 3️⃣ Merge meals with ratings
+        merged = []
+        for m in latest_meals:
+            out = m.copy()
+            match = rating_map.get(out["doc_id"])
+            if match:
+                out.update(match)
+            merged.append(out)
+        if len(rating_map) < len(latest_meals):
+            # some ratings failed: the next request should try again
+            mark_uncacheable()
+
+        return {"data": merged, "next": merged[-1]["doc_id"] if more else None}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Error in get_user_meals:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def rate_meals(user_id: str, api_key: str, goal, goal_exp, meals: List[Dict],
+                     fingerprints: Dict[str, str]) -> Dict[str, Dict]:
+    """Rate `meals` against the user's goal with Gemini and store the ratings on the meal docs."""
+    # Prepare items for prompt
+    items_for_prompt = [
+        {
+            "doc_id": m["doc_id"],
+            "meal_name": m["meal_name"],
+            "protein": m.get("protein"),
+            "carbs": m.get("carbs"),
+            "fats": m.get("fats"),
+            "calories": m.get("cals"),
+        }
+        for m in meals
+    ]
+
+    # Configure Gemini
+    chat = get_chat(api_key, temperature=0, model=MEAL_RATING_MODEL)
 
-        # 4️⃣ Enhanced Goal-Aware Prompt
-        prompt = f"""
+    # Enhanced Goal-Aware Prompt
+    prompt = f"""
 You are an expert sports nutritionist.
 
 Rate how well each meal supports the user's stated goal.
@@ -432,8 +452,8 @@ Rules:
 5. For "weight loss" or "cutting", low calorie + high protein are "best".
 6. Be logical and consistent — do not mark high-protein meals "worst" unless calories/fats are extreme.
 
-User Goal: {firestore_data.get('goal')}
-Goal Explanation: {firestore_data.get('goal_exp')}
+User Goal: {goal}
+Goal Explanation: {goal_exp}
 
 Meals:
 {json.dumps(items_for_prompt, indent=2)}
@@ -445,137 +465,173 @@ Return ONLY a valid JSON array like this:
 ]
 """
 
-        # 5️⃣ Call Gemini for 5 meals
-        response = chat.invoke(prompt)
-        raw = getattr(response, "content", "") or str(response)
+    # Call Gemini for the unrated meals only
+    response = await llm_flights.ainvoke("meals", user_id, chat, prompt)
+    raw = getattr(response, "content", "") or str(response)
 
-        # 6️⃣ Extract and parse JSON array
-        match = re.search(r"\[.*\]", raw, re.DOTALL)
-        json_text = match.group(0).strip() if match else raw.strip()
+    # Extract and parse JSON array
+    match = re.search(r"\[.*\]", raw, re.DOTALL)
+    json_text = match.group(0).strip() if match else raw.strip()
 
-        try:
-            ratings = json.loads(json_text)
-            if not isinstance(ratings, list):
-                raise ValueError("Not a JSON array")
-        except Exception as err:
-            print("Gemini parse error:", err)
-            print("Raw output:", raw)
-            ratings = []
-
-        # 7️⃣ Map results
-        rating_map = {
-            str(item.get("doc_id")): {
-                "rating": (item.get("rating") or "").strip().lower(),
-                "rating_explain": (item.get("rating_explain") or "").strip()
-            }
-            for item in ratings if isinstance(item, dict)
-        }
+    try:
+        ratings = json.loads(json_text)
+        if not isinstance(ratings, list):
+            raise ValueError("Not a JSON array")
+    except Exception as err:
+        print("Gemini parse error:", err)
+        print("Raw output:", raw)
+        ratings = []
+
+    # Keep well-formed ratings for the meals we asked about, and remember them
+    asked = {m["doc_id"] for m in meals}
+    rated = {doc_id: r for doc_id, r in parse_ratings(ratings).items() if doc_id in asked}
+    await save_ratings(user_id, rated, fingerprints)
+    return rated
+
+
+# ----------------------------- MEAL WRITES -----------------------------
+# Meals are written through the backend so the daily rollups
+# (users/{uid}/dailyMacros) are updated in the same batch/transaction.
+# The admin SDK skips security rules, so each write checks the caller's ID token.
+
+class MealBody(BaseModel):
+    meal_name: str
+    cals: float = 0
+    protein: float = 0
+    carbs: float = 0
+    fat: float = 0
+    meal_time: Optional[str] = None
+
+
+class MealUpdateBody(BaseModel):
+    meal_name: Optional[str] = None
+    cals: Optional[float] = None
+    protein: Optional[float] = None
+    carbs: Optional[float] = None
+    fat: Optional[float] = None
+    meal_time: Optional[str] = None
+    timestamp: Optional[str] = None
+
+
+@app.post("/api/user/{user_id}/meals", dependencies=[Depends(require_owner)])
+def create_meal(user_id: str, body: MealBody):
+    try:
+        now = datetime.now(timezone.utc)
+        entry = body.model_dump()
+        entry["timestamp"] = now.isoformat()
+        entry[TS_FIELD] = now
 
-        # 8️⃣ Merge meals with ratings
-        merged = []
-        for m in latest_meals:
-            out = m.copy()
-            match = rating_map.get(out["doc_id"])
-            if match:
-                out.update(match)
-            merged.append(out)
+        doc_id = add_meal(user_id, entry)
+        data_versions.bump(user_id)
+        return {"doc_id": doc_id}
+
+    except Exception as e:
+        print("Error in create_meal:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return {"data": merged}
+
+@app.put("/api/user/{user_id}/meals/{meal_id}", dependencies=[Depends(require_owner)])
+def edit_meal(user_id: str, meal_id: str, body: MealUpdateBody):
+    try:
+        changes = body.model_dump(exclude_none=True)
+        if "timestamp" in changes:
+            dt = parse_timestamp(changes["timestamp"])
+            if dt is None:
+                raise HTTPException(status_code=400, detail="Invalid timestamp")
+            changes[TS_FIELD] = dt
+        if not changes:
+            raise HTTPException(status_code=400, detail="Nothing to update")
+
+        updated = update_meal(user_id, meal_id, changes)
+        if updated is None:
+            raise HTTPException(status_code=404, detail="Meal not found")
+        data_versions.bump(user_id)
+        # Same document count, so only a full listing notices the edit
+        rag_index.mark_stale(user_id)
+        return {"doc_id": meal_id}
 
     except HTTPException:
         raise
     except Exception as e:
-        print("Error in get_user_meals:", e)
+        print("Error in edit_meal:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ----------------------------- BMI GRAPH -----------------------------
-@app.get("/api/user/{user_id}/bmiGraph")
-async def get_user_bmi(user_id: str):
+@app.delete("/api/user/{user_id}/meals/{meal_id}", dependencies=[Depends(require_owner)])
+def remove_meal(user_id: str, meal_id: str):
     try:
-        
-        history_ref = db.collection("users").document(user_id).collection("history")
-        docs = history_ref.stream()
-        data = []
+        if not delete_meal(user_id, meal_id):
+            raise HTTPException(status_code=404, detail="Meal not found")
+        data_versions.bump(user_id)
+        return {"status": "success"}
 
-        for doc in docs:
-            entry = doc.to_dict() or {}
-            if "bmi" not in entry:
-                continue
-            ts = entry.get("timestamp")
-            dt = parse_timestamp(ts)
-            if dt is None:
-                continue  # Option C: skip
-            data.append({
-                "date": dt,
-                "bmi": entry.get("bmi"),
-            })
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Error in remove_meal:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Format and sort
-        formatted = []
-        for item in data:
-            formatted.append({
-                "date": item["date"].isoformat(),
-                "bmi": item["bmi"]
-            })
-        formatted.sort(key=lambda x: x["date"])
 
-        return {"data": formatted}
+# ----------------------------- BMI GRAPH -----------------------------
+@app.get("/api/user/{user_id}/bmiGraph")
+async def get_user_bmi(user_id: str,
+                       limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX),
+                       after: Optional[str] = None,
+                       since: Optional[str] = None):
+    """BMI points; same paging (`limit`, `after`) and delta (`since`) parameters as the weight graph."""
+    try:
+        series = await history_cache.series(user_id)
+
+        return history_page(series, "bmi", after=after, since=since, limit=limit)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("Error in get_user_bmi:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ----------------------------- REQUIRED CALORIES -----------------------------
-@app.get("/api/user/reqCal/{user_id}")
-def get_user_cal(user_id: str):
+@app.get("/api/user/{user_id}/trends")
+async def get_user_trends(user_id: str):
+    """
+    Weight and BMI analytics: per point the 7-day moving average with a ±1σ
+    band, plus a robust trend (per week) and the projected date to reach
+    the goal (ideal weight / BMI from metrics), when the trend heads there.
+    """
     try:
-        api_key = get_gemini_api_key(user_id)
-        data = fetch_req_cal_firestore(user_id)
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.4,
-            api_key=api_key,
-        )
-
-        template = f"""
-        You are a fitness expert.
+        profile = await get_profile(user_id)
+        entries = await history_cache.entries(user_id)
+        metrics = compute_metrics(profile)
 
-        Data:
-        - Goal: {data.get('goal')}
-        - Maintenance Calorie: {data.get('mCal')}
-        - Height: {data.get('height')}
-        - Weight: {data.get('weight')}
-        - Gender: {data.get('gender')}
-        - Age: {data.get('age')}
-        - Exercise Intensity: {data.get('exercise_intensity')}
+        return {
+            "weight": analyze(*series_arrays(entries, "weight"), goal=metrics["ideal_weight"]),
+            "bmi": analyze(*series_arrays(entries, "bmi"), goal=metrics["ideal_bmi"]),
+        }
 
-        Return JSON:
-        {{
-            "req_intake": <number>,
-            "percent_chg": <number>
-        }}
-        """
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Error in get_user_trends:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
-        response = chat.invoke(template)
 
-        try:
-            ai_data = json.loads(response.content)
-        except json.JSONDecodeError:
-            content = response.content.strip()
-            start = content.find("{")
-            end = content.rfind("}") + 1
-            if start != -1 and end != 0:
-                ai_data = json.loads(content[start:end])
-            else:
-                ai_data = {"req_intake": None, "percent_chg": None}
+# ----------------------------- REQUIRED CALORIES -----------------------------
+@app.get("/api/user/reqCal/{user_id}")
+def get_user_cal(user_id: str):
+    try:
+        profile = get_user_profile(user_id)
+        fetch_req_cal_firestore(user_id, profile)  # 404s without currentData
 
+        # Maintenance x goal adjustment (metrics.required_intake); no LLM call needed
+        metrics = compute_metrics(profile)
         return {
-            "req_intake": ai_data.get("req_intake"),
-            "percent_chg": ai_data.get("percent_chg"),
+            "req_intake": metrics["req_intake"],
+            "percent_chg": metrics["percent_chg"],
         }
 
     except Exception as e:
@@ -585,14 +641,24 @@ def get_user_cal(user_id: str):
             status_code=500, detail=f"Error processing request: {str(e)}")
 
 
+@app.get("/api/user/{user_id}/metrics")
+async def get_user_metrics(user_id: str):
+    """All formula-derived body metrics (BMI, ideal BMI/weight, BMR, maintenance, goal intake)."""
+    try:
+        return compute_metrics(await get_profile(user_id))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in get_user_metrics: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/randomFact")
 def get_random_fact():
     api_key = get_gemini_api_key(user_id)
-    chat = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature="0.6",
-        api_key=api_key
-    )
+    chat = get_chat(api_key, temperature=0.6)
 
     prompt = """
         Instructions: You are a fitness scientist. Tell me a fun fact that will blow my mind about fitness, health, food, workout.
@@ -607,7 +673,7 @@ def get_random_fact():
         }}
     """
 
-    response = chat.invoke(prompt)
+    response = llm_scheduler.call(api_key, lambda: chat.invoke(prompt))
 
     try:
         ai_data = json.loads(response.content)
@@ -625,6 +691,13 @@ def get_random_fact():
     }
 
 
+# Latest meals considered for the chat context (deduplicated before use)
+CHAT_RECENT_MEALS = 30
+
+# Latest history documents shown in full as "Latest measurements"
+CHAT_RECENT_HISTORY = 5
+
+
 class AskRequest(BaseModel):
     user_id: str
     query: str
@@ -632,20 +705,45 @@ class AskRequest(BaseModel):
     type: str
 
 
-@app.post("/api/ask")
-async def ask(req: AskRequest = Body(...)):
-    try:
-        api_key = get_gemini_api_key(req.user_id)
-        # 🧠 Convert conversation history into readable text
-        history_text = "\n".join(
-            [f"{m['role'].capitalize()}: {m['content']}" for m in req.history[-5:]]
-        )
+async def build_ask_prompt(req: AskRequest) -> tuple[str, str]:
+    """
+    Resolve the user's Gemini key and assemble the chat prompt.
+    Shared by /api/ask and /api/ask/stream so both answer the same question.
+    """
+    profile = await get_profile(req.user_id)
+    api_key = get_gemini_api_key(req.user_id, profile)
+    # 🧠 Convert conversation history into readable text
+    history_text = "\n".join(
+        [f"{m['role'].capitalize()}: {m['content']}" for m in req.history[-5:]]
+    )
+
+    # 📘 Fetch RAG context: entries relevant to the question + recent data + rollups
+    async def retrieve():
+        try:
+            return await rag_index.retrieve(req.user_id, req.query, get_embedder(api_key))
+        except Exception as e:
+            print("RAG retrieval failed, using recent entries only:", e)
+            return []
+
+    today = datetime.now(timezone.utc).date()
+    retrieved, recent_meals, recent_history, history, rollups = await asyncio.gather(
+        retrieve(),
+        latest_docs(req.user_id, "meals", limit=CHAT_RECENT_MEALS),
+        # Measurement lines show every field; the cached series only holds chart fields
+        latest_docs(req.user_id, "history", field=TS_FIELD, limit=CHAT_RECENT_HISTORY),
+        history_cache.entries(req.user_id),
+        read_rollups(req.user_id, today - timedelta(weeks=12), today),
+    )
 
-        # 📘 Fetch RAG context (user data from Firestore)
-        rag_context = ans_query_on_demand(user_id=req.user_id, query=req.query)
+    # Most recent first, deduplicated, older periods summarized; stops at the token budget
+    context = build_chat_context(
+        profile, retrieved, [doc.to_dict() or {} for doc in recent_meals],
+        [doc.to_dict() or {} for doc in recent_history], history, rollups, today
+    )
+    rag_context = wrap_context(context.lines, req.query)
 
-        # 🧩 Combine all context for the LLM
-        prompt = f"""
+    # 🧩 Combine all context for the LLM
+    prompt = f"""
 You are a helpful and friendly fitness AI assistant.
 
 Conversation so far:
@@ -663,45 +761,105 @@ Now answer the user's new question:
 Be clear, short, and honest. Answer every question based on the user data. Answer no personal questions like email address, phone number etc.
 also provide stylish markdown to improve answer presentation.
 """
+    return api_key, prompt
+
+
+@app.post("/api/ask")
+async def ask(req: AskRequest = Body(...)):
+    try:
+        api_key, prompt = await build_ask_prompt(req)
 
         # 🔮 Call Gemini
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.2,
-            api_key=api_key,
-        )
+        chat = get_chat(api_key, temperature=0.2)
 
-        answer = chat.invoke(prompt)
+        answer = await llm_flights.ainvoke("ask", req.user_id, chat, prompt)
         return {"answer": answer.content}
 
+    except HTTPException:
+        # unknown user (404), missing Gemini key (400), rate limited (429)
+        raise
     except Exception as e:
         print("Error in /api/ask:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ---------- Analyze food (safe image fetch + better errors) ----------
-@app.post("/api/analyze_food")
-async def analyze_food(image_url: str = Query(...)):
+def _chunk_text(chunk) -> str:
+    """Text of a streamed message chunk (content may be a str or a list of parts)."""
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(p if isinstance(p, str) else p.get("text", "") for p in content)
+    return ""
+
+
+def _sse(data: Dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/ask/stream")
+async def ask_stream(req: AskRequest = Body(...)):
+    """
+    Same as /api/ask, but streams the answer as Server-Sent Events:
+    `data: {"token": "..."}` per chunk, then `event: done` (or `event: error`).
+    Errors before the first chunk (unknown user, rate limit, ...) are
+    plain HTTP errors; only failures mid-stream become `event: error`.
+    """
     try:
-        if not image_url:
-            raise HTTPException(status_code=400, detail="image_url is required")
+        api_key, prompt = await build_ask_prompt(req)
+        chat = get_chat(api_key, temperature=0.2)
+
+        # Wait for the first chunk here, so admission and rate-limit retries
+        # can still answer with a status code
+        stream = llm_scheduler.astream(api_key, lambda: chat.astream(prompt))
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = None
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Error in /api/ask/stream:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
+    async def events():
         try:
-            resp = requests.get(image_url, stream=True, timeout=10)
+            if first is not None:
+                text = _chunk_text(first)
+                if text:
+                    yield _sse({"token": text})
+                async for chunk in stream:
+                    text = _chunk_text(chunk)
+                    if text:
+                        yield _sse({"token": text})
+            yield _sse({}, event="done")
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to fetch image: {str(e)}")
+            print("Error streaming /api/ask/stream:", e)
+            traceback.print_exc()
+            yield _sse({"detail": str(e)}, event="error")
+        finally:
+            # releases the scheduler slot if the client went away mid-stream
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        if resp.status_code >= 400:
-            raise HTTPException(status_code=400, detail=f"Image fetch failed: {resp.status_code}")
 
-        mime_type = resp.headers.get("Content-Type", "").lower().split(";")[0].strip()
-        if not mime_type.startswith("image/"):
-            mime_type = "image/jpeg"
+# ---------- Analyze food (safe image fetch + better errors) ----------
+@app.post("/api/analyze_food")
+async def analyze_food(image_url: str = Query(...)):
+    try:
+        if not image_url:
+            raise HTTPException(status_code=400, detail="image_url is required")
 
-        img_bytes = resp.content
-        if len(img_bytes) < 200:
-            raise HTTPException(status_code=400, detail="Image too small or invalid")
+        # Async, size-capped fetch + server-side downscale to what the model needs
+        img_bytes, mime_type = await prepare_image(image_url)
 
         prompt = (
             "Analyze this food image and quantify macros. "
@@ -709,22 +867,23 @@ async def analyze_food(image_url: str = Query(...)):
             '{"food_name":"...", "total_calories":..., "protein_g":..., "carbs_g":..., "fat_g":...}'
         )
 
-        import base64
-        img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": prompt},
-                        {"inline_data": {"mime_type": mime_type, "data": img_b64}}
-                    ]
-                }
-            ]
+        api_key = os.getenv("GEMINI_API_KEY")
+        client = get_genai_client(api_key)
+
+        contents = [
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part.from_text(text=prompt),
+                    types.Part.from_bytes(data=img_bytes, mime_type=mime_type),
+                ]
+            )
+        ]
+
+        # Queued/retried per API key; gives up with a 429 (RateLimited) past the deadline
+        response = await llm_scheduler.acall(
+            api_key,
+            lambda: client.aio.models.generate_content(model="gemini-2.5-flash", contents=contents),
         )
 
         text = response.text.strip()
@@ -735,11 +894,8 @@ async def analyze_food(image_url: str = Query(...)):
     except HTTPException:
         raise
     except Exception as e:
-        err_str = str(e)
-        if "429" in err_str or "RESOURCE_EXHAUSTED" in err_str:
-            raise HTTPException(status_code=429, detail="Rate limit hit. Wait a moment and retry.")
         print("analyze_food error:", traceback.format_exc())
-        raise HTTPException(status_code=500, detail=err_str)
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 
@@ -769,14 +925,21 @@ async def delete_temp_image(public_id: str = Query(...)):
 @app.get("/api/todayFood/{user_id}")
 def get_today_food(user_id: str):
     try:
-        api_key = get_gemini_api_key(user_id)
-        data = health_summary(user_id)
-
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.6,
-            api_key=api_key
-        )
+        profile = get_user_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        data = health_summary(user_id, profile)
+
+        # Same inputs on the same day -> same plan; precomputed in the background on profile change
+        prompt_fields = {k: data.get(k) for k in
+                         ("bmr", "diet", "goal", "exp_goal", "exercise_intensity",
+                          "complication", "budget", "req_cal_intake")}
+        prompt_fields["day"] = datetime.now(timezone.utc).date().isoformat()
+        cache_key = make_key("todayFood", "gemini-2.5-flash", 0.6, prompt_fields)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        chat = get_chat(api_key, temperature=0.6)
 
         prompt_template = f"""
 You are a certified nutrition expert.
@@ -787,7 +950,7 @@ Based on the user's data below, create a one-day meal plan with Breakfast, Lunch
 - BMR: {data.get("bmr")}
 - Diet: {data.get("diet")}
 - Goal: {data.get("goal")}
-- Goal Explanation: {data.get("goal_exp")}
+- Goal Explanation: {data.get("exp_goal")}
 - Exercise Intensity: {data.get("exercise_intensity")}
 - Health Complications: {data.get("complication")}
 - Monthly budget: {data.get("budget")}
@@ -819,7 +982,7 @@ JSON OUTPUT STRUCTURE:
 """
 
         # Invoke Gemini model
-        response = chat.invoke(prompt_template)
+        response = llm_flights.invoke("todayFood", user_id, chat, prompt_template)
 
         # Clean possible text outside JSON (Gemini sometimes adds explanation)
         raw = response.content.strip()
@@ -831,10 +994,17 @@ JSON OUTPUT STRUCTURE:
 
         # Parse safely
         meal_data = json.loads(json_text)
+        if isinstance(meal_data, dict) and meal_data.get("meal_plan"):
+            llm_cache.set(cache_key, meal_data)
+        else:
+            mark_uncacheable()
         return meal_data
 
     except json.JSONDecodeError:
+        mark_uncacheable()
         return {"error": "Model did not return valid JSON.", "raw_output": getattr(response, "content", None)}
+    except RateLimited:
+        raise
     except Exception as e:
         print("Error in get_today_food:", e)
         traceback.print_exc()
@@ -844,34 +1014,13 @@ JSON OUTPUT STRUCTURE:
 @app.get("/api/user/todayNutrition/{user_id}")
 async def get_today_nutrition(user_id: str):
     try:
-        api_key = get_gemini_api_key(user_id)
-        # Get today's date range (00:00:00 → 23:59:59 in UTC)
-        now = datetime.now(timezone.utc)
-        start_of_day = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
-        end_of_day = start_of_day + timedelta(days=1)
+        profile = await get_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        # Today's rollup (UTC day) already holds the summed macros
+        today = datetime.now(timezone.utc).date()
+        rollups = await read_rollups(user_id, today, today)
 
-        meals_ref = db.collection("users").document(user_id).collection("meals")
-        docs = meals_ref.stream()
-        data = []
-
-        for doc in docs:
-            entry = doc.to_dict() or {}
-            timestamp = entry.get("timestamp")
-
-            dt = parse_timestamp(timestamp)
-            if not dt:
-                continue
-
-            # Filter only today's meals
-            if start_of_day <= dt < end_of_day:
-                data.append({
-                    "calories": entry.get("cals", 0),
-                    "protein": entry.get("protein", 0),
-                    "carbs": entry.get("carbs", 0),
-                    "fat": entry.get("fat", 0)
-                })
-
-        return {"data": data}
+        return {"data": nutrition_for_day(rollups, today)}
 
     except Exception as e:
         print("Error in get_today_nutrition:", e)
@@ -880,46 +1029,21 @@ async def get_today_nutrition(user_id: str):
 
 
 @app.get("/api/user/macroHistory/{user_id}")
-def get_macro_history(user_id: str) -> Dict:
+async def get_macro_history(user_id: str) -> Dict:
     try:
-        api_key = get_gemini_api_key(user_id)
-        today = datetime.now().date()
+        profile = await get_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        today = datetime.now(timezone.utc).date()
         one_year_ago = today - timedelta(days=365)
-        history_ref = db.collection("users").document(user_id).collection("meals")
-        docs = history_ref.stream()
-
-        protein_total = 0.0
-        carbs_total = 0.0
-        fats_total = 0.0
-        entry_count = 0
-
-        for doc in docs:
-            entry = doc.to_dict() or {}
-            timestamp = entry.get("timestamp")
 
-            dt = parse_timestamp(timestamp)
-            if not dt:
-                continue
-
-            entry_date = dt.date()
-
-            # Filter only last 1 year
-            if one_year_ago <= entry_date <= today:
-                protein_total += float(entry.get("protein", 0) or 0)
-                carbs_total += float(entry.get("carbs", 0) or 0)
-                fats_total += float(entry.get("fat", 0) or 0)
-                entry_count += 1
+        # At most 365 rollup docs, however many meals were logged
+        rollups = await read_rollups(user_id, one_year_ago, today)
 
-        if entry_count == 0:
+        totals = macro_totals(rollups)
+        if totals is None:
             return {"message": "No entries found in the past year.", "data": None}
 
-        return {
-            "data": {
-                "protein": round(protein_total, 2),
-                "carbs": round(carbs_total, 2),
-                "fats": round(fats_total, 2)
-            }
-        }
+        return {"data": totals}
 
     except Exception as e:
         print("Error fetching macro history:", e)
@@ -927,86 +1051,59 @@ def get_macro_history(user_id: str) -> Dict:
         return {"error": str(e)}
 
 
-SPOON_KEY = os.getenv("SPOONACULAR_API_KEY", "YOUR_SPOONACULAR_KEY_HERE")
-
-
 class QueryBody(BaseModel):
     name: str
 
 
+class BatchQueryBody(BaseModel):
+    names: List[str]
+
+
 @app.post("/api/macros")
-def fetch_macros(body: QueryBody):
+async def fetch_macros(body: QueryBody):
     """
-    Fetch macros for a given food/recipe name using Spoonacular /recipes/guessNutrition.
+    Fetch macros for a given food/recipe name. Common foods are answered from the
+    bundled nutrition table (source="local"); otherwise Spoonacular /recipes/guessNutrition.
     If Spoonacular cannot guess useful values (all zeros), return found=False so frontend can allow manual entry.
+    Spoonacular answers (including found=False) are cached by normalized name.
     """
     name = body.name.strip()
     if not name:
         raise HTTPException(status_code=400, detail="name is required")
 
-    if not SPOON_KEY:
-        raise HTTPException(status_code=500, detail="Spoonacular API key not configured on server")
-
     try:
-        url = "https://api.spoonacular.com/recipes/guessNutrition"
-        params = {"title": name, "apiKey": SPOON_KEY}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 401:
-            # explicit auth failure
-            raise HTTPException(status_code=502, detail=f"Spoonacular unauthorized: {resp.text}")
-        if resp.status_code != 200:
-            # relay message
-            return {"found": False, "error": f"Spoonacular error: {resp.status_code}", "details": resp.text}
-
-        data = resp.json()
-
-        # guessNutrition responds with keys: calories, protein, carbs, fat each like {"value": X, "unit": "g"}
-        def get_val(key):
-            val = data.get(key, {}) or {}
-            # some keys might be nested differently; resilient extraction
-            if isinstance(val, dict):
-                return val.get("value", 0)
-            try:
-                return float(val)
-            except Exception:
-                return 0
-
-        calories = float(get_val("calories") or 0)
-        protein = float(get_val("protein") or 0)
-        carbs = float(get_val("carbs") or 0)
-        fat = float(get_val("fat") or 0)
-        confidence = data.get("confidence", None)
-
-        # If all values are 0 or not present, treat as not found
-        if all(v == 0 for v in [calories, protein, carbs, fat]):
-            return {
-                "found": False,
-                "name": name,
-                "calories": 0,
-                "protein": 0,
-                "carbs": 0,
-                "fat": 0,
-                "confidence": confidence,
-            }
+        return {**await lookup_macros(name), "name": name}
 
-        return {
-            "found": True,
-            "name": name,
-            "calories": calories,
-            "protein": protein,
-            "carbs": carbs,
-            "fat": fat,
-            "confidence": confidence,
-        }
-
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Network/requests error: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         print("Error in /api/macros:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/macros/batch")
+async def fetch_macros_batch(body: BatchQueryBody):
+    """
+    Same as /api/macros for many names at once, resolved concurrently.
+    Returns {"results": [...]} in input order; each has the /api/macros shape.
+    """
+    names = [n.strip() for n in body.names if n and n.strip()]
+    if not names:
+        raise HTTPException(status_code=400, detail="names is required")
+    if len(names) > MACRO_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {MACRO_BATCH_MAX} names per batch")
+
+    try:
+        results = await lookup_many(names)
+        return {"results": [{**r, "name": n} for n, r in zip(names, results)]}
+
+    except Exception as e:
+        print("Error in /api/macros/batch:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/user/proteinHistory/{user_id}")
 async def get_protein_history(user_id: str):
     """
@@ -1018,47 +1115,13 @@ async def get_protein_history(user_id: str):
             raise HTTPException(status_code=400, detail="user_id is required")
 
         # Calculate date range (last 30 days)
-        end_date = datetime.now(timezone.utc)
+        end_date = datetime.now(timezone.utc).date()
         start_date = end_date - timedelta(days=30)
 
-        # Query all meals (can't filter string timestamps in Firestore)
-        meals_ref = db.collection("users").document(user_id).collection("meals")
-        meals_docs = meals_ref.stream()
-
-        # Aggregate protein by date
-        daily_protein: Dict[str, float] = {}
-
-        for doc in meals_docs:
-            try:
-                data_doc = doc.to_dict() or {}
-                if not data_doc:
-                    continue
-
-                timestamp_val = data_doc.get("timestamp")
-                protein = data_doc.get("protein", 0)
-
-                dt = parse_timestamp(timestamp_val)
-                if not dt or protein is None:
-                    continue
-
-                # Check if within date range
-                if start_date <= dt <= end_date:
-                    date_str = dt.strftime("%Y-%m-%d")
-                    protein_val = float(protein)
-                    daily_protein[date_str] = daily_protein.get(date_str, 0.0) + protein_val
+        # One rollup doc per logged day, already sorted by date (ascending)
+        rollups = await read_rollups(user_id, start_date, end_date)
 
-            except (ValueError, AttributeError, TypeError) as e:
-                print(f"Error processing document {doc.id}: {e}")
-                traceback.print_exc()
-                continue
-
-        # Convert to list and sort by date (ascending)
-        protein_data = [
-            {"date": date, "protein": round(protein, 2)}
-            for date, protein in sorted(daily_protein.items())
-        ]
-
-        return {"data": protein_data}
+        return {"data": protein_series(rollups, start_date)}
 
     except Exception as e:
         print(f"Error fetching protein history for user {user_id}: {str(e)}")
@@ -1071,22 +1134,54 @@ async def get_protein_history(user_id: str):
 
 # ----------------------------- BODY INSIGHTS (single endpoint only) -----------------------------
 @app.get("/api/user/bodyInsights/{user_id}")
-def get_body_insights(user_id: str):
+async def get_body_insights(user_id: str):
     """
     Returns 5 hidden and useful body/workout insights based on user stats.
     """
+    try:
+        entries = await history_cache.entries(user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in get_body_insights: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    # sliced here, on the event loop: the cached series isn't touched from the threadpool
+    return await run_in_threadpool(body_insights, user_id, entries[-TREND_PROMPT_POINTS:])
 
+
+def body_insights(user_id: str, history: List[Dict]):
+    """
+    bodyInsights from already-loaded history (latest entries, oldest first):
+    the route and the dashboard pass history_cache entries, the background
+    precomputer the sync loader's.
+    """
     try:
-        api_key = get_gemini_api_key(user_id)
-        # Fetch user stats from Firestore
-        data = fetch_req_cal_firestore(user_id)  # Should return dict
+        profile = get_user_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+        # Fetch user stats from the shared profile snapshot
+        data = fetch_req_cal_firestore(user_id, profile)  # Should return dict
+
+        # Only the fields the prompt below actually uses; the weight trend is
+        # keyed by the exact points it's fitted on, so a cache hit costs no reads
+        prompt_fields = {k: data.get(k) for k in
+                         ("goal", "height", "weight", "exp_goal", "gender", "age",
+                          "exercise_intensity", "mCal", "bmi", "bmr")}
+        t, y = series_arrays(history, "weight")
+        prompt_fields["history"] = hashlib.sha1(t.tobytes() + y.tobytes()).hexdigest()
+        cache_key = make_key("bodyInsights", "gemini-2.5-flash", 0.4, prompt_fields)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Computed trend instead of leaving the model to guess it from raw numbers
+        weight_trend = trend_summary("Weight", "kg", analyze(
+            t, y,
+            goal=compute_metrics(profile)["ideal_weight"],
+        ))
 
         # Gemini client
-        chat = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.4,
-            api_key=api_key,
-        )
+        chat = get_chat(api_key, temperature=0.4)
 
         # AI prompt
         template = f"""
@@ -1107,6 +1202,7 @@ def get_body_insights(user_id: str):
         - Maintenance Calorie: {data.get('mCal')}
         - BMI: {data.get('bmi')}
         - BMR: {data.get('bmr')}
+        - Weight trend: {weight_trend or 'not enough history yet'}
 
         Remember that telling calories to burn today and body fat %age is compulsory to tell
 
@@ -1124,7 +1220,7 @@ def get_body_insights(user_id: str):
         }}
         """
 
-        response = chat.invoke(template)
+        response = llm_flights.invoke("bodyInsights", user_id, chat, template)
 
         # Parse JSON safely
         try:
@@ -1138,12 +1234,19 @@ def get_body_insights(user_id: str):
             else:
                 ai_data = {"insights": []}
 
-        return {
+        result = {
             "insights": ai_data.get("insights", [])
         }
+        if result["insights"]:
+            llm_cache.set(cache_key, result)
+        else:
+            mark_uncacheable()
+        return result
 
+    except RateLimited:
+        raise
     except Exception as e:
-        print(f"Error in get_body_insights: {str(e)}")
+        print(f"Error in body_insights: {str(e)}")
         traceback.print_exc()
         raise HTTPException(
             status_code=500,
@@ -1151,4 +1254,135 @@ def get_body_insights(user_id: str):
         )
 
 
+# ----------------------------- BACKGROUND INSIGHTS -----------------------------
+# When a profile's AI inputs change, regenerate these sections off the request
+# path. Each route stores its answer in llm_cache, so the next GET is a cache hit
+# and only falls back to live generation on a miss.
+# bmi / reqCal are formula-only (metrics), nothing to precompute
+insight_jobs = InsightPrecomputer({
+    "bmr": get_bmr,
+    "bodyInsights": lambda user_id: body_insights(user_id, recent_history(user_id)),
+    "todayFood": get_today_food,
+})
+profile_cache.add_listener(insight_jobs.on_profile_change)
+
+
+@app.post("/api/user/{user_id}/refreshInsights", dependencies=[Depends(require_owner)])
+def refresh_insights(user_id: str, background_tasks: BackgroundTasks):
+    """
+    Called after a profile update: re-reads the profile and regenerates
+    the AI sections in the background. Returns immediately.
+    """
+    profile_cache.invalidate(user_id)
+    data_versions.bump(user_id)
+    background_tasks.add_task(insight_jobs.schedule, user_id)
+    return {"status": "scheduled"}
+
 
+# ----------------------------- DASHBOARD (aggregated) -----------------------------
+@app.get("/api/user/{user_id}/dashboard")
+async def get_dashboard(user_id: str, stream: bool = Query(False)):
+    """
+    Every dashboard section in one request. The profile, history and a year
+    of rollups are read once; Firestore-only sections and LLM sections run
+    concurrently. A failing section returns {"error": ...} instead of
+    failing the whole payload. With ?stream=true each section is sent as an
+    SSE event (`event: <section>`) as soon as it completes.
+    """
+    try:
+        profile = await get_profile(user_id)
+        api_key = get_gemini_api_key(user_id, profile)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("Error in get_dashboard:", e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    today = datetime.now(timezone.utc).date()
+
+    history_task = asyncio.create_task(history_cache.series(user_id))
+    rollups_task = asyncio.create_task(read_rollups(user_id, today - timedelta(days=365), today))
+
+    async def history_section(field):
+        return history_page(await history_task, field)
+
+    async def today_section():
+        return {"data": nutrition_for_day(await rollups_task, today)}
+
+    async def macro_section():
+        totals = macro_totals(await rollups_task)
+        if totals is None:
+            return {"message": "No entries found in the past year.", "data": None}
+        return {"data": totals}
+
+    async def protein_section():
+        return {"data": protein_series(await rollups_task, today - timedelta(days=30))}
+
+    async def llm_section(route):
+        # Sync routes; the profile and key are already cached, so only the LLM call remains
+        return await run_in_threadpool(route, user_id)
+
+    async def insights_section():
+        # Same history as the graphs: read once above
+        entries = (await history_task).entries[-TREND_PROMPT_POINTS:]
+        return await run_in_threadpool(body_insights, user_id, entries)
+
+    sections = {
+        "bmi": llm_section(get_bmi),
+        "bmr": llm_section(get_bmr),
+        "reqCal": llm_section(get_user_cal),
+        "bodyInsights": insights_section(),
+        "weight": history_section("weight"),
+        "bmiGraph": history_section("bmi"),
+        "todayNutrition": today_section(),
+        "macroHistory": macro_section(),
+        "proteinHistory": protein_section(),
+    }
+
+    async def run(name, coro):
+        try:
+            return name, await coro
+        except HTTPException as e:
+            return name, {"error": e.detail}
+        except Exception as e:
+            print(f"Error in dashboard section {name}:", e)
+            traceback.print_exc()
+            return name, {"error": str(e)}
+
+    tasks = [asyncio.create_task(run(name, coro)) for name, coro in sections.items()]
+
+    if stream:
+        async def events():
+            for next_done in asyncio.as_completed(tasks):
+                name, result = await next_done
+                yield _sse(result, event=name)
+            yield _sse({}, event="done")
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return dict(await asyncio.gather(*tasks))
+
+
+# ----------------------------- READ STATS -----------------------------
+# Unauthenticated and can reset the counters: off unless READ_STATS_ENDPOINT=1
+READ_STATS_ENDPOINT = os.getenv("READ_STATS_ENDPOINT", "0") == "1"
+
+
+@app.get("/api/stats/reads")
+def get_read_stats(reset: bool = Query(False)):
+    """
+    Firestore reads since startup (or the last reset) per subcollection and
+    projection: queries, documents and estimated bytes. Run with
+    FIRESTORE_PROJECTIONS=0 to get the whole-document numbers to compare.
+    """
+    if not READ_STATS_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not Found")
+    stats = read_stats.snapshot()
+    if reset:
+        read_stats.reset()
+    return {"reads": stats}
@@ -0,0 +1,69 @@
+from typing import Dict, List
+
+from async_store import adb, user_ref
+from llm_cache import make_key
+
+RATINGS = ("best", "good", "bad", "worst")
+
+# Bump when the rating prompt/rules change so stored ratings are redone
+MEAL_RATING_VERSION = 1
+MEAL_RATING_MODEL = "gemini-2.5-flash"
+
+
+# ============= PERSISTED MEAL RATINGS =============
+# A meal's rating is written back onto its document as rating /
+# rating_explain / rating_fp. rating_fp fingerprints everything the rating
+# was computed from (goal, goal explanation and the meal's name and
+# macros), so a rating is reused until one of those changes.
+
+def rating_fingerprint(goal, goal_exp, meal: Dict) -> str:
+    return make_key("mealRating", MEAL_RATING_MODEL, 0, {
+        "version": MEAL_RATING_VERSION,
+        "goal": goal,
+        "goal_exp": goal_exp,
+        "meal_name": meal.get("meal_name"),
+        "cals": meal.get("cals"),
+        "protein": meal.get("protein"),
+        "carbs": meal.get("carbs"),
+        "fat": meal.get("fat"),
+    })
+
+
+def stored_rating(entry: Dict, fingerprint: str):
+    """The rating stored on a meal doc if it is still valid for `fingerprint`, else None."""
+    if entry.get("rating_fp") != fingerprint or entry.get("rating") not in RATINGS:
+        return None
+    return {"rating": entry["rating"], "rating_explain": entry.get("rating_explain", "")}
+
+
+def parse_ratings(items: List) -> Dict[str, Dict]:
+    """doc_id -> {rating, rating_explain} for the well-formed items of a model answer."""
+    out = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        rating = (item.get("rating") or "").strip().lower()
+        if rating not in RATINGS:
+            continue
+        out[str(item.get("doc_id"))] = {
+            "rating": rating,
+            "rating_explain": (item.get("rating_explain") or "").strip(),
+        }
+    return out
+
+
+async def save_ratings(user_id: str, ratings: Dict[str, Dict], fingerprints: Dict[str, str]):
+    """
+    Write new ratings onto their meal docs in one batch. A failed write
+    (e.g. a meal deleted meanwhile) only means it gets rated again later.
+    """
+    if not ratings:
+        return
+    meals = user_ref(user_id).collection("meals")
+    batch = adb.batch()
+    for doc_id, rating in ratings.items():
+        batch.update(meals.document(doc_id), {**rating, "rating_fp": fingerprints[doc_id]})
+    try:
+        await batch.commit()
+    except Exception as e:
+        print(f"Could not store meal ratings for {user_id}: {e}")
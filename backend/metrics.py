@@ -0,0 +1,182 @@
+from typing import Dict, Optional, Tuple
+
+# ============= DETERMINISTIC BODY METRICS =============
+# Server-side counterpart of src/app/Utils/MetricCalc.js, plus the
+# goal-dependent numbers the profile routes used to ask Gemini for.
+
+# Same multipliers as MetricCalc.js (keys are the register form's exercise_intensity values)
+ACTIVITY_MULTIPLIERS = {
+    "no": 1.2,
+    "light": 1.375,
+    "medium": 1.55,
+    "regular": 1.725,
+    "student": 1.9,
+}
+
+# WHO normal-weight range
+HEALTHY_BMI = (18.5, 24.9)
+
+# Target BMI per goal (register form goal values), used when the current BMI is off target
+GOAL_BMI_TARGET = {
+    "lose_weight": 22.0,
+    "build_muscle": 23.5,
+    "tone_body": 22.5,
+    "increase_endurance": 21.5,
+}
+DEFAULT_BMI_TARGET = 22.0
+
+# Daily intake vs maintenance, in percent, when the goal agrees with the ideal weight
+GOAL_CALORIE_CHANGE = {
+    "lose_weight": -20,
+    "build_muscle": 10,
+    "tone_body": -10,
+    "increase_endurance": 5,
+}
+
+# Used instead when the weight has to move the other way (e.g. lose_weight while underweight)
+GAIN_CALORIE_CHANGE = 10
+LOSS_CALORIE_CHANGE = -10
+
+# Within this of the ideal weight (kg) nothing is left to lose or gain
+WEIGHT_TOLERANCE_KG = 0.5
+
+# Floor for goal intake (kcal/day); below this a deficit stops being safe unsupervised
+MIN_INTAKE = {"female": 1200, "male": 1500}
+DEFAULT_MIN_INTAKE = 1350
+
+# Mifflin-St Jeor sex constant; averaged when gender isn't male/female
+_SEX_CONSTANT = {"male": 5, "female": -161}
+_DEFAULT_SEX_CONSTANT = -78
+
+
+def _num(val) -> Optional[float]:
+    try:
+        n = float(val)
+    except (TypeError, ValueError):
+        return None
+    return n if n > 0 else None
+
+
+def _clamp(val: float, lo: float, hi: float) -> float:
+    return max(lo, min(hi, val))
+
+
+def bmi(weight_kg, height_cm) -> Optional[float]:
+    w, h = _num(weight_kg), _num(height_cm)
+    if w is None or h is None:
+        return None
+    return w / (h / 100) ** 2
+
+
+def bmr(weight_kg, height_cm, age, gender: Optional[str] = None) -> Optional[float]:
+    """Mifflin-St Jeor basal metabolic rate (kcal/day)."""
+    w, h, a = _num(weight_kg), _num(height_cm), _num(age)
+    if w is None or h is None or a is None:
+        return None
+    return 10 * w + 6.25 * h - 5 * a + _SEX_CONSTANT.get((gender or "").lower(), _DEFAULT_SEX_CONSTANT)
+
+
+def maintenance_calories(bmr_value, activity: Optional[str]) -> Optional[float]:
+    b = _num(bmr_value)
+    if b is None:
+        return None
+    return b * ACTIVITY_MULTIPLIERS.get(activity, 1.2)
+
+
+def ideal_bmi(current_bmi, goal: Optional[str]) -> float:
+    """
+    BMI to aim for: losing weight never raises it, building muscle never
+    lowers it, and other goals keep a BMI that is already healthy.
+    Always within HEALTHY_BMI.
+    """
+    target = GOAL_BMI_TARGET.get(goal, DEFAULT_BMI_TARGET)
+    cur = _num(current_bmi)
+    if cur is None:
+        ideal = target
+    elif goal == "lose_weight":
+        ideal = min(cur, target)
+    elif goal == "build_muscle":
+        ideal = max(cur, target)
+    elif HEALTHY_BMI[0] <= cur <= HEALTHY_BMI[1]:
+        ideal = cur
+    else:
+        ideal = target
+    return round(_clamp(ideal, *HEALTHY_BMI), 1)
+
+
+def weight_for_bmi(target_bmi: float, height_cm) -> Optional[float]:
+    h = _num(height_cm)
+    return target_bmi * (h / 100) ** 2 if h is not None else None
+
+
+def calorie_change(goal: Optional[str], weight=None, ideal_weight=None, current_bmi=None) -> float:
+    """
+    Percent change vs maintenance: the goal's, but pointing the way the
+    weight has to go to reach the ideal weight. Never a deficit at or
+    below the bottom of HEALTHY_BMI.
+    """
+    change = GOAL_CALORIE_CHANGE.get(goal, 0)
+    w, ideal = _num(weight), _num(ideal_weight)
+    if w is not None and ideal is not None:
+        if ideal - w > WEIGHT_TOLERANCE_KG:
+            change = max(change, GAIN_CALORIE_CHANGE)
+        elif w - ideal > WEIGHT_TOLERANCE_KG:
+            change = min(change, LOSS_CALORIE_CHANGE)
+        else:
+            change = max(change, 0)
+    b = _num(current_bmi)
+    if b is not None and b <= HEALTHY_BMI[0]:
+        change = max(change, 0)
+    return change
+
+
+def required_intake(maintenance, goal: Optional[str], gender: Optional[str] = None, weight=None,
+                    ideal_weight=None, current_bmi=None) -> Tuple[Optional[int], Optional[float]]:
+    """(kcal/day for the goal, percent change vs maintenance); see calorie_change."""
+    m = _num(maintenance)
+    if m is None:
+        return None, None
+    intake = m * (1 + calorie_change(goal, weight, ideal_weight, current_bmi) / 100)
+    intake = max(intake, min(m, MIN_INTAKE.get((gender or "").lower(), DEFAULT_MIN_INTAKE)))
+    intake = round(intake)
+    return intake, round((intake - m) / m * 100, 1)
+
+
+def compute_metrics(profile: Dict) -> Dict:
+    """
+    All numeric metrics for a user profile (top-level fields or currentData).
+    Inputs that are missing give None for whatever depends on them.
+    """
+    cur = profile.get("currentData") if isinstance(profile.get("currentData"), dict) else {}
+
+    def field(key):
+        val = cur.get(key)
+        return val if val not in (None, "") else profile.get(key)
+
+    weight, height = field("weight"), field("height")
+    gender, age, goal = profile.get("gender"), profile.get("age"), field("goal")
+
+    bmi_now = bmi(weight, height) or _num(field("bmi"))
+    bmr_now = bmr(weight, height, age, gender) or _num(field("bmr"))
+    maintenance = maintenance_calories(bmr_now, field("exercise_intensity")) or _num(field("maintenanceCalories"))
+
+    target_bmi = ideal_bmi(bmi_now, goal)
+    ideal_weight = weight_for_bmi(target_bmi, height)
+    intake, percent = required_intake(maintenance, goal, gender, weight, ideal_weight, bmi_now)
+    lo_w, hi_w = (weight_for_bmi(b, height) for b in HEALTHY_BMI)
+
+    def r(val, nd=1):
+        return round(val, nd) if val is not None else None
+
+    return {
+        "bmi": r(bmi_now),
+        "ideal_bmi": target_bmi,
+        "ideal_bmi_range": list(HEALTHY_BMI),
+        "ideal_weight": r(ideal_weight),
+        "healthy_weight_range": [r(lo_w), r(hi_w)] if lo_w is not None else None,
+        "bmr": r(bmr_now, 0),
+        "ideal_bmr": r(bmr(ideal_weight, height, age, gender), 0) if ideal_weight is not None else None,
+        "maintenance": r(maintenance, 0),
+        "req_intake": intake,
+        "percent_chg": percent,
+    }
@@ -0,0 +1,81 @@
+"""
+One-off backfill of the indexed `ts` field on meals/history entries.
+
+Older entries only carry the string `timestamp`, which Firestore cannot
+range-query. This walks every user (or the ones given) and writes `ts`
+as a native Timestamp parsed from it. Safe to re-run: entries that
+already have `ts` are skipped.
+
+Usage:
+    python migrate_timestamps.py                    # all users, meals + history
+    python migrate_timestamps.py --user UID --sub meals
+    python migrate_timestamps.py --dry-run
+"""
+import argparse
+
+from bmibmr import db
+from timestamps import TS_FIELD, parse_timestamp
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+
+def backfill_user(user_id: str, subs, dry_run: bool = False) -> dict:
+    stats = {"scanned": 0, "updated": 0, "skipped": 0, "invalid": 0}
+    batch = db.batch()
+    pending = 0
+
+    for sub in subs:
+        for doc in db.collection("users").document(user_id).collection(sub).stream():
+            stats["scanned"] += 1
+            entry = doc.to_dict() or {}
+
+            if entry.get(TS_FIELD) is not None:
+                stats["skipped"] += 1
+                continue
+
+            dt = parse_timestamp(entry.get("timestamp"))
+            if dt is None:
+                stats["invalid"] += 1
+                continue
+
+            stats["updated"] += 1
+            if dry_run:
+                continue
+
+            batch.update(doc.reference, {TS_FIELD: dt})
+            pending += 1
+            if pending >= BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+
+    if pending and not dry_run:
+        batch.commit()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the indexed `ts` field from string timestamps.")
+    parser.add_argument("--user", action="append", help="User id to migrate (repeatable). Default: all users.")
+    parser.add_argument("--sub", action="append", choices=["meals", "history"],
+                        help="Subcollection to migrate (repeatable). Default: meals and history.")
+    parser.add_argument("--dry-run", action="store_true", help="Count changes without writing.")
+    args = parser.parse_args()
+
+    subs = args.sub or ["meals", "history"]
+    user_ids = args.user or [doc.id for doc in db.collection("users").list_documents()]
+
+    totals = {"scanned": 0, "updated": 0, "skipped": 0, "invalid": 0}
+    for user_id in user_ids:
+        stats = backfill_user(user_id, subs, dry_run=args.dry_run)
+        for k, v in stats.items():
+            totals[k] += v
+        print(f"{user_id}: {stats}")
+
+    print(f"Done{' (dry run)' if args.dry_run else ''}: {totals}")
+
+
+if __name__ == "__main__":
+    main()
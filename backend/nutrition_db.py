@@ -0,0 +1,163 @@
+import os
+import re
+import csv
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Bundled table of common foods (per typical serving)
+NUTRITION_DB = os.getenv("NUTRITION_DB", os.path.join(os.path.dirname(__file__), "data", "foods.csv"))
+
+# Local matches at or above this score are answered without Spoonacular
+NUTRITION_MIN_CONFIDENCE = float(os.getenv("NUTRITION_MIN_CONFIDENCE", 0.75))
+
+# Weaker local matches are still used when Spoonacular is unavailable
+NUTRITION_FALLBACK_CONFIDENCE = float(os.getenv("NUTRITION_FALLBACK_CONFIDENCE", 0.45))
+
+# Matches that don't cover the query word for word (missing, extra or
+# reordered words) or that ignore a quantity in it are scaled by this: kept
+# below NUTRITION_MIN_CONFIDENCE, so they only serve as a fallback
+PARTIAL_MATCH_WEIGHT = 0.6
+
+# Per-word trigram similarity for a typo to still count as the same word
+TOKEN_MIN_SIMILARITY = 0.75
+
+MACRO_FIELDS = ("calories", "protein", "carbs", "fat")
+
+# Words that only make sense as part of an amount ("2 cups of rice")
+QUANTITY_WORDS = {
+    "g", "gm", "gms", "gram", "grams", "kg", "mg", "oz", "ounce", "ounces", "lb", "lbs",
+    "ml", "l", "litre", "liter", "cup", "cups", "tbsp", "tsp", "tablespoon", "tablespoons",
+    "teaspoon", "teaspoons", "slice", "slices", "piece", "pieces", "serving", "servings",
+    "bowl", "bowls", "plate", "plates", "half", "quarter", "of",
+}
+
+
+def normalize_name(name: str) -> str:
+    """Lookup key for a food name: lowercased, punctuation dropped, whitespace collapsed."""
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: set, b: set) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def split_quantity(name: str) -> Tuple[str, bool]:
+    """A normalized name without amount words ("200g", "2 cups of"), and whether it had any."""
+    words = name.split()
+    kept = [w for w in words if not any(c.isdigit() for c in w) and w not in QUANTITY_WORDS]
+    return " ".join(kept), len(kept) != len(words)
+
+
+def token_similarity(a: str, b: str) -> float:
+    if a == b or a in (b + "s", b + "es") or b in (a + "s", a + "es"):
+        return 1.0
+    return dice(trigrams(a), trigrams(b))
+
+
+class NutritionIndex:
+    """
+    In-memory index over the bundled food table. Every name and alias is
+    a key; a trigram -> keys map gives fuzzy matching, so a lookup touches
+    only keys sharing a trigram with the query. Loaded once, read-only
+    afterwards.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.by_key: Dict[str, int] = {}
+        for i, row in enumerate(rows):
+            for key in [row["name"]] + row["aliases"]:
+                self.by_key.setdefault(normalize_name(key), i)
+        self.key_grams = {key: trigrams(key) for key in self.by_key}
+        self.postings: Dict[str, List[str]] = defaultdict(list)
+        for key, grams in self.key_grams.items():
+            for g in grams:
+                self.postings[g].append(key)
+
+    @classmethod
+    def load(cls, path: str = NUTRITION_DB) -> "NutritionIndex":
+        rows = []
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                for rec in csv.DictReader(f):
+                    rows.append({
+                        "name": rec["name"],
+                        "serving": rec["serving"],
+                        **{k: float(rec[k]) for k in MACRO_FIELDS},
+                        "aliases": [a for a in (rec.get("aliases") or "").split("|") if a],
+                    })
+        except OSError as e:
+            print(f"Nutrition table {path} not loaded: {e}")
+        return cls(rows)
+
+    def match(self, text: str) -> Optional[Tuple[Dict, float]]:
+        """
+        Best food for a free-text name and a 0..1 confidence, or None.
+
+        A confident match names the same food word for word: the query and
+        the key have the same words in the same order, allowing plurals and
+        small typos. "chocolate milk" is not "milk chocolate", "apple pie"
+        is not "apple", and "chick" is not "chicken". Anything looser, or a
+        query with an amount the per-serving table can't answer ("chicken
+        breast 200g"), is scaled by PARTIAL_MATCH_WEIGHT.
+        """
+        q = normalize_name(text)
+        if not q:
+            return None
+        weight = 1.0
+        if q not in self.by_key:
+            q, has_quantity = split_quantity(q)
+            if not q:
+                return None
+            if has_quantity:
+                weight = PARTIAL_MATCH_WEIGHT
+        if q in self.by_key:
+            return self.rows[self.by_key[q]], weight
+        # plural typed, singular stored
+        for suffix in ("es", "s"):
+            if q.endswith(suffix) and q[:-len(suffix)] in self.by_key:
+                return self.rows[self.by_key[q[:-len(suffix)]]], round(0.95 * weight, 3)
+
+        words = q.split()
+        grams = trigrams(q)
+        candidates = {key for g in grams for key in self.postings.get(g, ())}
+        best_key, best = None, 0.0
+        for key in candidates:
+            score = self._word_match(words, key.split())
+            if score is None:
+                score = PARTIAL_MATCH_WEIGHT * dice(grams, self.key_grams[key])
+            if score > best or (score == best and best_key is not None and len(key) < len(best_key)):
+                best_key, best = key, score
+        if best_key is None:
+            return None
+        return self.rows[self.by_key[best_key]], round(best * weight, 3)
+
+    @staticmethod
+    def _word_match(words: List[str], key_words: List[str]) -> Optional[float]:
+        """Mean word similarity when the words pair up one to one in order, else None."""
+        if len(words) != len(key_words):
+            return None
+        sims = [token_similarity(a, b) for a, b in zip(words, key_words)]
+        if min(sims) < TOKEN_MIN_SIMILARITY:
+            return None
+        return sum(sims) / len(sims)
+
+
+def local_result(row: Dict, confidence: float) -> Dict:
+    """A match in the /api/macros result shape."""
+    return {
+        "found": True,
+        **{k: row[k] for k in MACRO_FIELDS},
+        "confidence": confidence,
+        "serving": row["serving"],
+        "matched": row["name"],
+        "source": "local",
+    }
+
+
+nutrition_index = NutritionIndex.load()
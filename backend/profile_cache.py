@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+# How long a cached profile is trusted without a listener confirming it (seconds)
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 5 * 60))
+
+# Maximum number of user profiles kept in memory (and listeners kept open)
+PROFILE_CACHE_MAX = int(os.getenv("PROFILE_CACHE_MAX", 512))
+
+# Set PROFILE_CACHE_WATCH=0 to disable Firestore on_snapshot invalidation
+PROFILE_CACHE_WATCH = os.getenv("PROFILE_CACHE_WATCH", "1") != "0"
+
+
+class ProfileCache:
+    """
+    LRU + TTL cache of `users/{user_id}` documents.
+
+    Every fetcher that needs profile fields reads the snapshot from here, so a
+    dashboard load costs one document read instead of one per endpoint.
+    While a profile is cached an on_snapshot listener keeps it fresh; the
+    listener is closed whenever the entry leaves the cache (eviction,
+    expiry, invalidation).
+    """
+
+    def __init__(self, db, ttl: int = PROFILE_CACHE_TTL, max_size: int = PROFILE_CACHE_MAX,
+                 watch: bool = PROFILE_CACHE_WATCH):
+        self.db = db
+        self.ttl = ttl
+        self.max_size = max_size
+        self.watch = watch
+        # user_id -> (data, expiry, document update time)
+        self._entries: "OrderedDict[str, tuple[Dict, float, object]]" = OrderedDict()
+        self._watches: Dict[str, object] = {}
+        self._listeners: List[Callable[[str, Optional[Dict], Optional[Dict]], None]] = []
+        self._lock = threading.Lock()
+
+    # ---------- public API ----------
+
+    def get(self, user_id: str) -> Dict:
+        """
+        Return the profile dict for user_id (treat as read-only).
+        Raises HTTPException(404) if the user document does not exist.
+        """
+        data = self.peek(user_id)
+        if data is not None:
+            return data
+
+        doc = self.db.collection("users").document(user_id).get()
+        if not doc.exists:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        data = doc.to_dict() or {}
+        self.remember(user_id, data, doc.update_time)
+        return data
+
+    def peek(self, user_id: str) -> Optional[Dict]:
+        """Return the cached profile if present and fresh, without touching Firestore."""
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if not cached:
+                return None
+            data, expiry, _ = cached
+            if now < expiry:
+                self._entries.move_to_end(user_id)
+                return data
+            self._entries.pop(user_id, None)
+        self._unwatch(user_id)
+        return None
+
+    def update_time(self, user_id: str):
+        """Firestore update time of the cached profile (None if not cached or unknown)."""
+        with self._lock:
+            cached = self._entries.get(user_id)
+        return cached[2] if cached else None
+
+    def put(self, user_id: str, data: Dict, update_time=None):
+        evicted = []
+        with self._lock:
+            self._entries[user_id] = (data, time.time() + self.ttl, update_time)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                old_id, _ = self._entries.popitem(last=False)
+                evicted.append(old_id)
+        for old_id in evicted:
+            self._unwatch(old_id)
+
+    def remember(self, user_id: str, data: Dict, update_time=None):
+        """Cache a profile loaded elsewhere (e.g. by the async client) and start watching it."""
+        self.put(user_id, data, update_time)
+        self._ensure_watch(user_id)
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        self._unwatch(user_id)
+
+    def add_listener(self, fn: Callable[[str, Optional[Dict], Optional[Dict]], None]):
+        """Call fn(user_id, old, new) whenever a watched profile changes (new is None if deleted)."""
+        self._listeners.append(fn)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            user_ids = list(self._watches)
+        for user_id in user_ids:
+            self._unwatch(user_id)
+
+    # ---------- listeners ----------
+
+    def _ensure_watch(self, user_id: str):
+        if not self.watch:
+            return
+        with self._lock:
+            if user_id in self._watches:
+                return
+            # reserve the slot so concurrent misses don't open two listeners
+            self._watches[user_id] = None
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for snap in doc_snapshots:
+                with self._lock:
+                    cached = self._entries.get(user_id)
+                old = cached[0] if cached else None
+                new = (snap.to_dict() or {}) if snap.exists else None
+                if new is not None:
+                    # refresh in place so the next request is still a cache hit
+                    self.put(user_id, new, snap.update_time)
+                else:
+                    with self._lock:
+                        self._entries.pop(user_id, None)
+                    # unsubscribing joins the watch's own thread: not from its callback
+                    threading.Thread(target=self._unwatch, args=(user_id,), daemon=True).start()
+                if old != new:
+                    self._notify(user_id, old, new)
+
+        try:
+            ref = self.db.collection("users").document(user_id)
+            watch = ref.on_snapshot(on_snapshot)
+        except Exception as e:
+            print(f"Profile listener failed for {user_id}: {e}")
+            with self._lock:
+                self._watches.pop(user_id, None)
+            return
+
+        with self._lock:
+            self._watches[user_id] = watch
+
+    def _notify(self, user_id: str, old: Optional[Dict], new: Optional[Dict]):
+        for fn in self._listeners:
+            try:
+                fn(user_id, old, new)
+            except Exception as e:
+                print(f"Profile listener callback failed for {user_id}: {e}")
+
+    def _unwatch(self, user_id: str):
+        with self._lock:
+            watch = self._watches.pop(user_id, None)
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
@@ -0,0 +1,371 @@
+import os
+import re
+import time
+import hashlib
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from context_builder import entry_line
+from llm_clients import ClientRegistry
+from llm_scheduler import llm_scheduler
+from async_store import stream_subcollection, range_docs, count_docs, doc_versions, get_docs
+from timestamps import entry_datetime
+
+# Subcollections indexed for retrieval
+RAG_SUBS = ("history", "meals")
+
+# Entries retrieved per question
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 12))
+
+# Users whose index is kept in memory
+RAG_INDEX_MAX_USERS = int(os.getenv("RAG_INDEX_MAX_USERS", 256))
+
+# Seconds between full id listings of an index, which pick up edits made outside this process
+RAG_RECONCILE_SECONDS = int(os.getenv("RAG_RECONCILE_SECONDS", 600))
+
+# Optional on-disk persistence (one .npz per user); unset to keep indexes in memory only
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR")
+
+# "gemini" (default) or "hashing" for the local deterministic embedder
+RAG_EMBEDDER = os.getenv("RAG_EMBEDDER", "gemini")
+RAG_EMBED_MODEL = os.getenv("RAG_EMBED_MODEL", "models/gemini-embedding-001")
+RAG_EMBED_DIM = int(os.getenv("RAG_EMBED_DIM", 768))
+
+
+# ============= EMBEDDERS =============
+# An embedder has a `name` (stored with persisted indexes) and async
+# embed_documents / embed_query returning L2-normalized float32 rows.
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class GeminiEmbedder:
+    def __init__(self, api_key: str, model: str = RAG_EMBED_MODEL, dim: int = RAG_EMBED_DIM):
+        self.name = f"gemini:{model}:{dim}"
+        self._api_key = api_key
+        self._docs = GoogleGenerativeAIEmbeddings(
+            model=model, api_key=api_key, task_type="RETRIEVAL_DOCUMENT", output_dimensionality=dim)
+        self._query = GoogleGenerativeAIEmbeddings(
+            model=model, api_key=api_key, task_type="RETRIEVAL_QUERY", output_dimensionality=dim)
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return _normalize(await llm_scheduler.acall(self._api_key, lambda: self._docs.aembed_documents(texts)))
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        return _normalize([await llm_scheduler.acall(self._api_key, lambda: self._query.aembed_query(text))])[0]
+
+
+class HashingEmbedder:
+    """
+    Local, deterministic bag-of-words embedder (signed feature hashing).
+    No network or API key: used for tests and as an offline stand-in.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.name = f"hashing:{dim}"
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return vec
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return _normalize(np.stack([self._vector(t) for t in texts]))
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        return _normalize(self._vector(text)[None, :])[0]
+
+
+def default_embedder(api_key: str):
+    if RAG_EMBEDDER == "hashing":
+        return HashingEmbedder()
+    return GeminiEmbedder(api_key)
+
+
+embedders = ClientRegistry(default_embedder)
+
+
+def get_embedder(api_key: str):
+    """Shared embedder for an API key (see RAG_EMBEDDER)."""
+    return embedders.get(api_key)
+
+
+# ============= PER-USER INDEX =============
+
+class UserIndex:
+    """
+    Compact vector index of one user's meal/history entries: a float32
+    matrix with one normalized row per entry, grown in place as new
+    documents arrive, plus the per-subcollection sync cursors. `versions`
+    holds the update time of every synced document, including those with
+    nothing to embed, and `counts` its size per subcollection, so edited
+    and deleted documents can be told apart without scanning the rows.
+    """
+
+    def __init__(self, embedder_name: str, dim: int = 0):
+        self.embedder_name = embedder_name
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.cursors: Dict[str, Optional[datetime]] = {sub: None for sub in RAG_SUBS}
+        self.versions: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {sub: 0 for sub in RAG_SUBS}
+        self.built = False
+        # monotonic time of the last full id listing (0: never, e.g. loaded from disk)
+        self.reconciled = 0.0
+        self._rows: Dict[str, int] = {}
+
+    def keys(self, sub: str) -> List[str]:
+        prefix = sub + "/"
+        return [key for key in self.versions if key.startswith(prefix)]
+
+    def track(self, key: str, version: str):
+        """Record a synced document's update time."""
+        if key not in self.versions:
+            sub = key.split("/", 1)[0]
+            self.counts[sub] = self.counts.get(sub, 0) + 1
+        self.versions[key] = version
+
+    def remove(self, keys: List[str]):
+        """Forget documents (deleted, or edited and about to be re-added), compacting their rows out."""
+        for key in keys:
+            if key in self.versions:
+                del self.versions[key]
+                self.counts[key.split("/", 1)[0]] -= 1
+        rows = [self._rows[key] for key in keys if key in self._rows]
+        if not rows:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[rows] = False
+        self.matrix = self.matrix[:self.size][keep]
+        self.size = self.matrix.shape[0]
+        self.ids = [key for key, kept in zip(self.ids, keep) if kept]
+        self.texts = [text for text, kept in zip(self.texts, keep) if kept]
+        self._rows = {key: i for i, key in enumerate(self.ids)}
+
+    def add(self, keys: List[str], texts: List[str], vectors: np.ndarray):
+        if not keys:
+            return
+        n = len(keys)
+        if self.matrix.shape[1] != vectors.shape[1]:
+            self.matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        # grow capacity geometrically so incremental adds stay amortized O(1)
+        if self.size + n > self.matrix.shape[0]:
+            capacity = max(self.size + n, 2 * self.matrix.shape[0], 64)
+            grown = np.zeros((capacity, vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size:self.size + n] = vectors
+        self._rows.update((key, self.size + i) for i, key in enumerate(keys))
+        self.size += n
+        self.ids.extend(keys)
+        self.texts.extend(texts)
+
+    def search(self, query_vec: np.ndarray, k: int) -> List[str]:
+        if self.size == 0:
+            return []
+        scores = self.matrix[:self.size] @ query_vec
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.texts[i] for i in top]
+
+    # ---------- persistence ----------
+    # Plain string arrays only, so files load with allow_pickle=False
+
+    def save(self, path: str):
+        cursors = [c.isoformat() if c else "" for c in (self.cursors[s] for s in RAG_SUBS)]
+        keys = list(self.versions)
+        tmp = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            matrix=self.matrix[:self.size],
+            ids=np.array(self.ids, dtype=str),
+            texts=np.array(self.texts, dtype=str),
+            keys=np.array(keys, dtype=str),
+            versions=np.array([self.versions[key] for key in keys], dtype=str),
+            cursors=np.array(cursors, dtype=str),
+            embedder=np.array(self.embedder_name),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, embedder_name: str) -> Optional["UserIndex"]:
+        try:
+            with np.load(path) as data:
+                if str(data["embedder"]) != embedder_name:
+                    return None
+                index = cls(embedder_name)
+                index.add(data["ids"].tolist(), data["texts"].tolist(), data["matrix"])
+                for key, version in zip(data["keys"].tolist(), data["versions"].tolist()):
+                    index.track(key, version)
+                for sub, raw in zip(RAG_SUBS, data["cursors"].tolist()):
+                    index.cursors[sub] = datetime.fromisoformat(raw) if raw else None
+                index.built = True
+                return index
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring unreadable RAG index {path}: {e}")
+            return None
+
+
+# ============= REGISTRY =============
+
+class RagIndexRegistry:
+    """
+    Per-user indexes. The first build embeds every meal/history entry, so
+    it runs as a background task: questions asked before it's done get no
+    retrieved entries and are answered from the recent context alone.
+    Later syncs only read documents at or after each subcollection's cursor
+    and compare the subcollection's count (an aggregation query) with the
+    index. On a mismatch, after mark_stale (an edit through the API) and
+    every RAG_RECONCILE_SECONDS, a keys-only listing of the ids and update
+    times replaces the cursor read instead: rows of deleted documents are
+    removed and new or edited documents (re-)embedded.
+    Retrieval is a top-k cosine search.
+    """
+
+    def __init__(self, index_dir: Optional[str] = RAG_INDEX_DIR, max_users: int = RAG_INDEX_MAX_USERS):
+        self.index_dir = index_dir
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._builds: Dict[str, asyncio.Task] = {}
+        self._stale = set()
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+    async def retrieve(self, user_id: str, query: str, embedder, k: int = RAG_TOP_K) -> List[str]:
+        if not self._get(user_id, embedder.name).built:
+            self._build_in_background(user_id, embedder)
+            return []
+        index = await self.sync(user_id, embedder)
+        if index.size == 0:
+            return []
+        return index.search(await embedder.embed_query(query), k)
+
+    async def sync(self, user_id: str, embedder) -> UserIndex:
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._get(user_id, embedder.name)
+            stale = user_id in self._stale
+            self._stale.discard(user_id)
+            reconcile = index.built and (stale or time.monotonic() - index.reconciled >= RAG_RECONCILE_SECONDS)
+            changed = 0
+            try:
+                for sub in RAG_SUBS:
+                    changed += await self._sync_sub(user_id, sub, index, embedder, reconcile)
+            except Exception:
+                if stale:
+                    self._stale.add(user_id)
+                raise
+            if reconcile or not index.built:
+                index.reconciled = time.monotonic()
+            index.built = True
+            if changed and self.index_dir:
+                index.save(self._path(user_id))
+            return index
+
+    def mark_stale(self, user_id: str):
+        """Have the next sync list the user's documents in full, to pick up edits."""
+        self._stale.add(user_id)
+
+    def invalidate(self, user_id: str):
+        self._indexes.pop(user_id, None)
+
+    def _build_in_background(self, user_id: str, embedder):
+        if user_id in self._builds:
+            return
+        task = asyncio.create_task(self.sync(user_id, embedder))
+        self._builds[user_id] = task
+        task.add_done_callback(lambda t: self._build_done(user_id, t))
+
+    def _build_done(self, user_id: str, task: asyncio.Task):
+        self._builds.pop(user_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Building the RAG index of {user_id} failed: {task.exception()}")
+
+    def _get(self, user_id: str, embedder_name: str) -> UserIndex:
+        index = self._indexes.get(user_id)
+        if index is None or index.embedder_name != embedder_name:
+            index = None
+            if self.index_dir and os.path.exists(self._path(user_id)):
+                index = UserIndex.load(self._path(user_id), embedder_name)
+            index = index or UserIndex(embedder_name)
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.max_users:
+            old_id, _ = self._indexes.popitem(last=False)
+            self._locks.pop(old_id, None)
+        return index
+
+    async def _sync_sub(self, user_id: str, sub: str, index: UserIndex, embedder, reconcile: bool) -> int:
+        """Bring one subcollection up to date; returns the number of entries added, updated or removed."""
+        cursor = index.cursors[sub]
+        removed = 0
+        if reconcile:
+            removed, docs = await self._reconcile(user_id, sub, index)
+        elif cursor is not None:
+            docs = await range_docs(user_id, sub, start=cursor)
+        else:
+            docs = await stream_subcollection(user_id, sub)
+
+        # Unchanged documents (the cursor read starts at the last one seen) are skipped
+        fresh = [doc for doc in docs if index.versions.get(f"{sub}/{doc.id}") != str(doc.update_time)]
+        keys, texts = [], []
+        latest = cursor
+        for doc in fresh:
+            entry = doc.to_dict() or {}
+            dt = entry_datetime(entry, sub)
+            if dt is not None and (latest is None or dt > latest):
+                latest = dt
+            line = entry_line(sub, entry)
+            if line:
+                keys.append(f"{sub}/{doc.id}")
+                texts.append(line)
+
+        # The index only changes once the new entries are embedded: if embedding
+        # fails, the next sync reads the same documents again
+        vectors = await embedder.embed_documents(texts) if texts else None
+        index.remove([f"{sub}/{doc.id}" for doc in fresh])
+        if keys:
+            index.add(keys, texts, vectors)
+        for doc in fresh:
+            index.track(f"{sub}/{doc.id}", str(doc.update_time))
+        index.cursors[sub] = latest
+
+        if not reconcile and cursor is not None and await count_docs(user_id, sub) != index.counts[sub]:
+            print(f"RAG index of {user_id}/{sub} is out of step with Firestore, listing its ids")
+            return removed + len(fresh) + await self._sync_sub(user_id, sub, index, embedder, True)
+        return removed + len(fresh)
+
+    async def _reconcile(self, user_id: str, sub: str, index: UserIndex):
+        """Remove deleted documents; returns (rows removed, snapshots of new or edited documents)."""
+        versions = await doc_versions(user_id, sub)
+        prefix = sub + "/"
+        gone = [key for key in index.keys(sub) if key[len(prefix):] not in versions]
+        index.remove(gone)
+        stale = [doc_id for doc_id, updated in versions.items()
+                 if index.versions.get(prefix + doc_id) != str(updated)]
+        return len(gone), await get_docs(user_id, sub, stale)
+
+    def _path(self, user_id: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_-]", "_", user_id)
+        return os.path.join(self.index_dir, f"{safe}.npz")
+
+
+rag_index = RagIndexRegistry()
@@ -0,0 +1,76 @@
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence
+
+# ============= FIRESTORE READ ACCOUNTING =============
+# The client library doesn't report bytes received, so documents are sized
+# with Firestore's storage size rules
+# (https://firebase.google.com/docs/firestore/storage-size): close to what
+# goes over the wire and what has to be deserialized. Counted per
+# subcollection and per projection, so a select() can be compared with the
+# full-document read it replaces.
+
+# Fixed overhead per document / per document name (storage size rules)
+_DOC_OVERHEAD = 32
+_NAME_OVERHEAD = 16
+
+
+def value_size(val) -> int:
+    if val is None or isinstance(val, bool):
+        return 1
+    if isinstance(val, (int, float, datetime)):
+        return 8
+    if isinstance(val, str):
+        return len(val.encode("utf-8")) + 1
+    if isinstance(val, bytes):
+        return len(val)
+    if isinstance(val, dict):
+        return sum(len(str(k).encode("utf-8")) + 1 + value_size(v) for k, v in val.items())
+    if isinstance(val, (list, tuple)):
+        return sum(value_size(v) for v in val)
+    # GeoPoint, DocumentReference and other rare types
+    return 16
+
+
+def doc_size(snapshot) -> int:
+    """Estimated size of a document snapshot (name + returned fields + overhead)."""
+    ref = getattr(snapshot, "reference", None)
+    path = getattr(ref, "path", "") or getattr(snapshot, "id", "")
+    name = sum(len(part.encode("utf-8")) + 1 for part in path.split("/")) + _NAME_OVERHEAD
+    return name + value_size(snapshot.to_dict() or {}) + _DOC_OVERHEAD
+
+
+class ReadStats:
+    """Queries, documents and estimated bytes read, keyed by (subcollection, projection)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[tuple, Dict[str, int]] = {}
+
+    def record(self, sub: str, fields: Optional[Sequence[str]], docs: Iterable):
+        size, count = 0, 0
+        for doc in docs:
+            size += doc_size(doc)
+            count += 1
+        key = (sub, ",".join(fields) if fields else "*")
+        with self._lock:
+            s = self._stats.setdefault(key, {"queries": 0, "docs": 0, "bytes": 0})
+            s["queries"] += 1
+            s["docs"] += count
+            s["bytes"] += size
+
+    def snapshot(self) -> list:
+        with self._lock:
+            items = [(k, dict(v)) for k, v in self._stats.items()]
+        return [
+            {"collection": sub, "fields": fields, **s,
+             "bytes_per_doc": round(s["bytes"] / s["docs"], 1) if s["docs"] else None}
+            for (sub, fields), s in sorted(items)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+read_stats = ReadStats()
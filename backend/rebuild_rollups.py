@@ -0,0 +1,34 @@
+"""
+Rebuild the per-day macro rollups (users/{uid}/dailyMacros) from raw meals.
+
+Run once for existing users after deploying rollups, or any time a
+rollup is suspected to have drifted. Safe to re-run.
+
+Usage:
+    python rebuild_rollups.py                 # all users
+    python rebuild_rollups.py --user UID
+"""
+import argparse
+
+from bmibmr import db
+from rollups import rebuild_user_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute daily macro rollups from the meals collection.")
+    parser.add_argument("--user", action="append", help="User id to rebuild (repeatable). Default: all users.")
+    args = parser.parse_args()
+
+    user_ids = args.user or [doc.id for doc in db.collection("users").list_documents()]
+
+    total_days = 0
+    for user_id in user_ids:
+        days = rebuild_user_rollups(user_id)
+        total_days += days
+        print(f"{user_id}: {days} day(s)")
+
+    print(f"Done: {len(user_ids)} user(s), {total_days} day(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from firebase_admin import firestore
+
+from bmibmr import db
+from async_store import ROLLUP_CHART_FIELDS, user_ref, fetch
+from timestamps import entry_datetime
+
+# users/{user_id}/dailyMacros/{YYYY-MM-DD}
+ROLLUP_SUB = "dailyMacros"
+
+# Profile counter incremented with every meal write (see data_version)
+DATA_VERSION_FIELD = "dataVersion"
+
+# Meal field -> rollup field
+MACRO_FIELDS = {
+    "cals": "calories",
+    "protein": "protein",
+    "carbs": "carbs",
+    "fat": "fat",
+}
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 400
+
+
+# ============= HELPERS =============
+
+def day_key(dt: datetime) -> str:
+    """UTC calendar day of a timestamp, used as the rollup document id."""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+def meal_macros(entry: Dict) -> Dict[str, float]:
+    out = {}
+    for meal_key, rollup_key in MACRO_FIELDS.items():
+        try:
+            out[rollup_key] = float(entry.get(meal_key) or 0)
+        except (TypeError, ValueError):
+            out[rollup_key] = 0.0
+    return out
+
+
+def _contribution(entry: Optional[Dict]) -> Dict[str, Dict[str, float]]:
+    """{day: {calories, protein, carbs, fat, meal_count}} a meal adds to its day's rollup."""
+    if not entry:
+        return {}
+    dt = entry_datetime(entry, "meals")
+    if dt is None:
+        return {}
+    macros = meal_macros(entry)
+    macros["meal_count"] = 1
+    return {day_key(dt): macros}
+
+
+def rollup_ref(user_id: str, day: str):
+    return db.collection("users").document(user_id).collection(ROLLUP_SUB).document(day)
+
+
+def _apply_delta(writer, user_id: str, before: Optional[Dict], after: Optional[Dict]):
+    """
+    Queue Increment writes on `writer` (batch or transaction) that move a
+    meal's contribution from `before` to `after`. Either side may be None
+    for inserts and deletes; a changed timestamp moves it between days.
+    """
+    old = _contribution(before)
+    new = _contribution(after)
+
+    for day in set(old) | set(new):
+        o = old.get(day, {})
+        n = new.get(day, {})
+        delta = {k: n.get(k, 0) - o.get(k, 0) for k in set(o) | set(n)}
+        if not any(delta.values()):
+            continue
+        update = {k: firestore.Increment(v) for k, v in delta.items() if v}
+        update["date"] = day
+        update["updatedAt"] = firestore.SERVER_TIMESTAMP
+        writer.set(rollup_ref(user_id, day), update, merge=True)
+
+
+def _touch_profile(writer, user_id: str):
+    """
+    Queue an Increment of the profile's dataVersion on `writer`, so the
+    write also changes the profile document: every worker watching it
+    (profile_cache) hears about the meal write, not only this one.
+    """
+    writer.set(db.collection("users").document(user_id), {DATA_VERSION_FIELD: firestore.Increment(1)}, merge=True)
+
+
+# ============= MEAL WRITES (meal + rollups + dataVersion atomically) =============
+
+def add_meal(user_id: str, entry: Dict) -> str:
+    meal_ref = db.collection("users").document(user_id).collection("meals").document()
+    batch = db.batch()
+    batch.set(meal_ref, entry)
+    _apply_delta(batch, user_id, None, entry)
+    _touch_profile(batch, user_id)
+    batch.commit()
+    return meal_ref.id
+
+
+def update_meal(user_id: str, meal_id: str, changes: Dict) -> Optional[Dict]:
+    """Apply `changes` to a meal and its rollups. Returns the new meal, or None if it doesn't exist."""
+    meal_ref = db.collection("users").document(user_id).collection("meals").document(meal_id)
+
+    @firestore.transactional
+    def run(transaction):
+        snap = meal_ref.get(transaction=transaction)
+        if not snap.exists:
+            return None
+        before = snap.to_dict() or {}
+        after = {**before, **changes}
+        transaction.update(meal_ref, changes)
+        _apply_delta(transaction, user_id, before, after)
+        _touch_profile(transaction, user_id)
+        return after
+
+    return run(db.transaction())
+
+
+def delete_meal(user_id: str, meal_id: str) -> bool:
+    meal_ref = db.collection("users").document(user_id).collection("meals").document(meal_id)
+
+    @firestore.transactional
+    def run(transaction):
+        snap = meal_ref.get(transaction=transaction)
+        if not snap.exists:
+            return False
+        transaction.delete(meal_ref)
+        _apply_delta(transaction, user_id, snap.to_dict() or {}, None)
+        _touch_profile(transaction, user_id)
+        return True
+
+    return run(db.transaction())
+
+
+# ============= READS =============
+
+async def read_rollups(user_id: str, start: date, end: Optional[date] = None) -> List[Dict]:
+    """
+    Rollup docs for start <= day <= end, oldest first. Reads one document
+    per logged day, however many meals were logged.
+    """
+    query = user_ref(user_id).collection(ROLLUP_SUB).where(
+        filter=firestore.FieldFilter("date", ">=", start.isoformat())
+    )
+    if end is not None:
+        query = query.where(filter=firestore.FieldFilter("date", "<=", end.isoformat()))
+    query = query.order_by("date")
+
+    out = []
+    for doc in await fetch(query, ROLLUP_SUB, ROLLUP_CHART_FIELDS):
+        data = doc.to_dict() or {}
+        if data.get("meal_count", 0) > 0:
+            out.append(data)
+    return out
+
+
+# ============= SECTION BUILDERS =============
+# Pure functions over already-read rollups, so the chart routes and the
+# aggregated dashboard share one read.
+
+def nutrition_for_day(rollups: List[Dict], day: date) -> List[Dict]:
+    key = day.isoformat()
+    return [
+        {
+            "calories": r.get("calories", 0),
+            "protein": r.get("protein", 0),
+            "carbs": r.get("carbs", 0),
+            "fat": r.get("fat", 0)
+        }
+        for r in rollups if r.get("date") == key
+    ]
+
+
+def macro_totals(rollups: List[Dict]) -> Optional[Dict]:
+    if not rollups:
+        return None
+    return {
+        "protein": round(sum(float(r.get("protein", 0) or 0) for r in rollups), 2),
+        "carbs": round(sum(float(r.get("carbs", 0) or 0) for r in rollups), 2),
+        "fats": round(sum(float(r.get("fat", 0) or 0) for r in rollups), 2)
+    }
+
+
+def protein_series(rollups: List[Dict], start: date) -> List[Dict]:
+    key = start.isoformat()
+    return [
+        {"date": r.get("date"), "protein": round(float(r.get("protein", 0) or 0), 2)}
+        for r in rollups if r.get("date", "") >= key
+    ]
+
+
+# ============= REBUILD =============
+
+def rebuild_user_rollups(user_id: str) -> int:
+    """
+    Recompute every rollup of a user from the raw `meals` collection,
+    replacing whatever is stored. Returns the number of days written.
+    """
+    totals: Dict[str, Dict[str, float]] = {}
+    for doc in db.collection("users").document(user_id).collection("meals").stream():
+        for day, macros in _contribution(doc.to_dict() or {}).items():
+            acc = totals.setdefault(day, {"calories": 0.0, "protein": 0.0, "carbs": 0.0, "fat": 0.0, "meal_count": 0})
+            for k, v in macros.items():
+                acc[k] += v
+
+    batch = db.batch()
+    pending = 0
+
+    def queue(op, *args, **kwargs):
+        nonlocal batch, pending
+        getattr(batch, op)(*args, **kwargs)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    for ref in db.collection("users").document(user_id).collection(ROLLUP_SUB).list_documents():
+        if ref.id not in totals:
+            queue("delete", ref)
+
+    for day, acc in totals.items():
+        doc = {k: (round(v, 2) if k != "meal_count" else v) for k, v in acc.items()}
+        doc["date"] = day
+        doc["updatedAt"] = firestore.SERVER_TIMESTAMP
+        queue("set", rollup_ref(user_id, day), doc)
+
+    if pending:
+        batch.commit()
+    return len(totals)
+
@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable
+
+from llm_scheduler import llm_scheduler, chat_api_key
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs
+    the function, callers arriving while it is in flight wait for and share
+    its result (or exception). Nothing is remembered once the call returns;
+    caching finished results is llm_cache's job.
+
+    `do` serves the sync routes (threadpool), `ado` the async ones. In
+    `ado` the call runs in its own task that every caller, the first one
+    included, awaits through asyncio.shield: cancelling any caller (e.g. a
+    client disconnect) leaves the call running for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._acalls: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn()
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._acalls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._acalls[key] = task
+            task.add_done_callback(lambda t: self._adone(key, t))
+        return await asyncio.shield(task)
+
+    def _adone(self, key: Hashable, task: asyncio.Task):
+        if self._acalls.get(key) is task:
+            del self._acalls[key]
+        if not task.cancelled():
+            # mark retrieved so a failure nobody awaited anymore isn't logged as "never retrieved"
+            task.exception()
+
+    # ---------- LLM helpers ----------
+
+    @staticmethod
+    def llm_key(route: str, user_id: str, chat, prompt: str) -> tuple:
+        """(route, user, model, temperature, prompt hash): the prompt embeds every input field."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return (route, user_id, getattr(chat, "model", None), getattr(chat, "temperature", None), digest)
+
+    # Only the leader goes through the rate-limit scheduler; followers don't take a slot.
+
+    def invoke(self, route: str, user_id: str, chat, prompt: str):
+        return self.do(
+            self.llm_key(route, user_id, chat, prompt),
+            lambda: llm_scheduler.call(chat_api_key(chat), lambda: chat.invoke(prompt)),
+        )
+
+    async def ainvoke(self, route: str, user_id: str, chat, prompt: str):
+        return await self.ado(
+            self.llm_key(route, user_id, chat, prompt),
+            lambda: llm_scheduler.acall(chat_api_key(chat), lambda: chat.ainvoke(prompt)),
+        )
+
+
+llm_flights = SingleFlight()
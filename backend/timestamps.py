@@ -0,0 +1,186 @@
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Native Firestore Timestamp mirror of the legacy string `timestamp` field.
+# Single-field indexes are automatic, so range queries on it need no setup.
+TS_FIELD = "ts"
+
+# Values sampled per (collection, field) before its dominant format is fixed
+TS_DETECT_SAMPLE = int(os.getenv("TS_DETECT_SAMPLE", 32))
+
+
+def parse_timestamp(val) -> Optional[datetime]:
+    """
+    Accepts Firestore Timestamp-like objects (with to_datetime),
+    ISO strings, or datetime objects. Returns datetime (tz-aware UTC)
+    or None if invalid.
+    """
+    if val is None:
+        return None
+
+    # Firestore timestamp object
+    if hasattr(val, "to_datetime") and callable(getattr(val, "to_datetime")):
+        try:
+            dt = val.to_datetime()
+            # Ensure tz-aware (Firestore usually returns tz-aware)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt
+        except Exception:
+            return None
+
+    # datetime instance
+    if isinstance(val, datetime):
+        if val.tzinfo is None:
+            return val.replace(tzinfo=timezone.utc)
+        return val
+
+    # string ISO format
+    if isinstance(val, str):
+        s = val.strip()
+        if not s:
+            return None
+        # Try several common iso variants
+        try:
+            # handle trailing Z
+            s_mod = s.replace("Z", "+00:00")
+            dt = datetime.fromisoformat(s_mod)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt
+        except Exception:
+            # last resort: try to parse common formats
+            try:
+                # e.g., "2025-11-01T15:10:54.784"
+                dt = datetime.strptime(s.split(".")[0], "%Y-%m-%dT%H:%M:%S")
+                return dt.replace(tzinfo=timezone.utc)
+            except Exception:
+                return None
+
+    # unknown type
+    return None
+
+
+# ============= FAST-PATH DECODING =============
+# parse_timestamp probes every type and format on every call. Within one
+# collection/field nearly every value has the same shape (native Timestamps
+# in `ts`, JS toISOString() strings in `timestamp`), so a TimestampDecoder
+# samples the first values, picks the dominant format, and from then on
+# tries a specialized parser first, falling back to parse_timestamp.
+
+KIND_DATETIME = "datetime"   # datetime / Firestore DatetimeWithNanoseconds
+KIND_ISO_Z = "iso_z"         # "2025-11-01T15:10:54.784Z"
+KIND_STRING = "string"       # any other string
+KIND_OTHER = "other"
+
+
+def classify(val) -> Optional[str]:
+    if val is None:
+        return None
+    if isinstance(val, datetime):
+        return KIND_DATETIME
+    if isinstance(val, str):
+        return KIND_ISO_Z if val.endswith("Z") else KIND_STRING
+    return KIND_OTHER
+
+
+class TimestampDecoder:
+    """
+    Decoder for one (collection, field); see the section comment above.
+    `decode` starts as parse_timestamp and is replaced by a specialized
+    function once the dominant format is known.
+    """
+
+    def __init__(self, sample: int = TS_DETECT_SAMPLE):
+        self.sample = sample
+        self.kind: Optional[str] = None
+        self._seen = Counter()
+
+    def decode(self, val) -> Optional[datetime]:
+        if val is None:
+            return None
+        self._seen[classify(val)] += 1
+        if sum(self._seen.values()) >= self.sample:
+            self.kind = self._seen.most_common(1)[0][0]
+            # instance attribute: later calls skip detection entirely
+            self.decode = self._specialized(self.kind)
+        return parse_timestamp(val)
+
+    def _specialized(self, kind: str):
+        if kind == KIND_OTHER:
+            return parse_timestamp
+
+        fromiso, utc = datetime.fromisoformat, timezone.utc
+
+        def from_string(val):
+            # Direct fromisoformat (reads a trailing Z on Python 3.11+); anything
+            # it rejects takes the full parse_timestamp path.
+            try:
+                dt = fromiso(val)
+            except ValueError:
+                return parse_timestamp(val)
+            return dt if dt.tzinfo is not None else dt.replace(tzinfo=utc)
+
+        # Type checks ordered by the dominant kind
+        if kind == KIND_DATETIME:
+            def decode(val):
+                if isinstance(val, datetime) and val.tzinfo is not None:
+                    return val
+                if val.__class__ is str:
+                    return from_string(val)
+                return parse_timestamp(val)
+        else:
+            def decode(val):
+                if val.__class__ is str:
+                    return from_string(val)
+                if isinstance(val, datetime) and val.tzinfo is not None:
+                    return val
+                return parse_timestamp(val)
+        return decode
+
+    def decode_epochs(self, values: Iterable) -> np.ndarray:
+        """Epoch seconds (float64) for a batch of values; NaN where invalid or missing."""
+        decode = self.decode
+        epochs = []
+        for val in values:
+            dt = decode(val) if val is not None else None
+            epochs.append(dt.timestamp() if dt is not None else np.nan)
+        return np.array(epochs, dtype=np.float64)
+
+
+_decoders: Dict[tuple, TimestampDecoder] = {}
+
+
+def decoder_for(collection: Optional[str], field: str) -> TimestampDecoder:
+    """Shared decoder for a (collection, field) pair."""
+    key = (collection, field)
+    dec = _decoders.get(key)
+    if dec is None:
+        dec = _decoders.setdefault(key, TimestampDecoder())
+    return dec
+
+
+def entry_datetime(entry: Dict, collection: Optional[str] = None) -> Optional[datetime]:
+    """
+    Timestamp of a meals/history entry: the indexed `ts` field when present,
+    otherwise the legacy `timestamp` string. Pass the subcollection name so
+    its values share a format-specialized decoder.
+    """
+    dt = decoder_for(collection, TS_FIELD).decode(entry.get(TS_FIELD))
+    if dt is None:
+        dt = decoder_for(collection, "timestamp").decode(entry.get("timestamp"))
+    return dt
+
+
+def entry_epochs(entries: List[Dict], collection: Optional[str] = None) -> np.ndarray:
+    """entry_datetime for a batch, as epoch seconds (NaN where missing)."""
+    out = decoder_for(collection, TS_FIELD).decode_epochs(e.get(TS_FIELD) for e in entries)
+    missing = np.flatnonzero(np.isnan(out))
+    if len(missing):
+        legacy = decoder_for(collection, "timestamp").decode_epochs(entries[i].get("timestamp") for i in missing)
+        out[missing] = legacy
+    return out
@@ -0,0 +1,148 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from google.cloud.firestore import Query
+
+from bmibmr import db
+from async_store import HISTORY_CHART_FIELDS, FIRESTORE_PROJECTIONS, projected
+from read_stats import read_stats
+from timestamps import TS_FIELD, entry_epochs
+
+# Trailing window of the moving average / variance band (days)
+TREND_MA_DAYS = int(os.getenv("TREND_MA_DAYS", 7))
+
+# The slope is fit on this many most recent days
+TREND_FIT_DAYS = int(os.getenv("TREND_FIT_DAYS", 90))
+
+# Cap on points in the pairwise (Theil-Sen) fit: O(n^2) memory
+TREND_MAX_FIT_POINTS = 400
+
+# History docs read for the insights prompt summary
+TREND_PROMPT_POINTS = int(os.getenv("TREND_PROMPT_POINTS", 120))
+
+# Projections further out than this aren't meaningful
+MAX_PROJECTION_DAYS = 3 * 365
+
+_DAY = 86400.0
+
+
+# ============= ARRAYS =============
+
+def series_arrays(entries: List[Dict], field: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(days since epoch, values) for entries with a timestamp and a numeric `field`, sorted by time."""
+    rows, vals = [], []
+    for entry in entries:
+        try:
+            vals.append(float(entry.get(field)))
+        except (TypeError, ValueError):
+            continue
+        rows.append(entry)
+    t = entry_epochs(rows, "history") / _DAY
+    y = np.asarray(vals, dtype=np.float64)
+    keep = np.isfinite(t) & np.isfinite(y)
+    t, y = t[keep], y[keep]
+    order = np.argsort(t, kind="stable")
+    return t[order], y[order]
+
+
+# ============= ANALYTICS =============
+
+def rolling_stats(t: np.ndarray, y: np.ndarray, window: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Trailing time-window mean and standard deviation at every point
+    (window covers (t - window, t]), via prefix sums: O(n log n) total.
+    """
+    cs = np.concatenate(([0.0], np.cumsum(y)))
+    cs2 = np.concatenate(([0.0], np.cumsum(y * y)))
+    right = np.arange(1, len(t) + 1)
+    left = np.searchsorted(t, t - window, side="right")
+    n = right - left
+    mean = (cs[right] - cs[left]) / n
+    var = np.maximum((cs2[right] - cs2[left]) / n - mean * mean, 0.0)
+    return mean, np.sqrt(var)
+
+
+def theil_sen(t: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """
+    Robust line fit: median of all pairwise slopes, so a few mis-logged
+    weigh-ins don't swing the trend. Returns (slope per day, intercept).
+    """
+    i, j = np.triu_indices(len(t), k=1)
+    dt = t[j] - t[i]
+    keep = dt > 0
+    slope = float(np.median((y[j] - y[i])[keep] / dt[keep]))
+    intercept = float(np.median(y - slope * t))
+    return slope, intercept
+
+
+def analyze(t: np.ndarray, y: np.ndarray, goal: Optional[float] = None,
+            ma_days: int = TREND_MA_DAYS, fit_days: int = TREND_FIT_DAYS) -> Dict:
+    """
+    Moving average with a ±1σ band, robust trend over the last `fit_days`,
+    and when the trend heads toward `goal`, the projected date to reach it.
+    """
+    out = {
+        "points": int(len(t)),
+        "series": [],
+        "slope_per_week": None,
+        "trend_value": None,
+        "residual_std": None,
+        "goal": goal,
+        "projected_goal_date": None,
+    }
+    if len(t) == 0:
+        return out
+
+    mean, std = rolling_stats(t, y, ma_days)
+    dates = [datetime.fromtimestamp(d * _DAY, tz=timezone.utc).isoformat() for d in t]
+    out["series"] = [
+        {"date": d, "value": v, "avg": round(m, 2), "lower": round(m - s, 2), "upper": round(m + s, 2)}
+        for d, v, m, s in zip(dates, y.tolist(), mean.tolist(), std.tolist())
+    ]
+
+    recent = t >= t[-1] - fit_days
+    ft, fy = t[recent][-TREND_MAX_FIT_POINTS:], y[recent][-TREND_MAX_FIT_POINTS:]
+    if len(ft) < 2 or ft[-1] - ft[0] < 1:
+        return out
+
+    slope, intercept = theil_sen(ft, fy)
+    now_value = slope * t[-1] + intercept
+    out["slope_per_week"] = round(slope * 7, 3)
+    out["trend_value"] = round(now_value, 2)
+    out["residual_std"] = round(float(np.std(fy - (slope * ft + intercept))), 3)
+
+    if goal is not None and slope != 0:
+        days = (goal - now_value) / slope
+        if 0 < days <= MAX_PROJECTION_DAYS:
+            eta = datetime.fromtimestamp(t[-1] * _DAY, tz=timezone.utc) + timedelta(days=float(days))
+            out["projected_goal_date"] = eta.date().isoformat()
+    return out
+
+
+def trend_summary(label: str, unit: str, result: Dict) -> Optional[str]:
+    """One compact line of a trend result for an LLM prompt."""
+    if result.get("slope_per_week") is None:
+        return None
+    last = result["series"][-1]
+    text = (f"{label} trend {result['slope_per_week']:+.2f} {unit}/week over {result['points']} points; "
+            f"7-day avg {last['avg']:.1f} {unit} (band {last['lower']:.1f}-{last['upper']:.1f})")
+    if result.get("goal") is not None:
+        eta = result.get("projected_goal_date") or "not on current trend"
+        text += f"; goal {result['goal']:.1f} {unit}, reached {eta}"
+    return text
+
+
+# ============= SYNC LOADER (profile routes) =============
+
+def recent_history(user_id: str, limit: int = TREND_PROMPT_POINTS) -> List[Dict]:
+    """Latest `limit` history entries (by `ts`) with the sync client, oldest first; chart fields only."""
+    query = (
+        db.collection("users").document(user_id).collection("history")
+        .order_by(TS_FIELD, direction=Query.DESCENDING)
+        .limit(limit)
+    )
+    docs = list(projected(query, HISTORY_CHART_FIELDS).stream())
+    read_stats.record("history", HISTORY_CHART_FIELDS if FIRESTORE_PROJECTIONS else None, docs)
+    return [doc.to_dict() or {} for doc in docs][::-1]
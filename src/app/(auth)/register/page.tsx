@@ -8,7 +8,7 @@ import PhoneInput from 'react-phone-number-input'
 import ClickSpark from '@/components/ClickSpark';
 import { useCreateUserWithEmailAndPassword } from "react-firebase-hooks/auth";
 import { auth, db } from '@/app/firebase/config';
-import { setDoc, doc, collection, addDoc } from 'firebase/firestore';
+import { setDoc, doc, collection, addDoc, Timestamp } from 'firebase/firestore';
 import { bmi, bmr, maintenanceCalories } from '@/app/Utils/MetricCalc';
 import { useRouter } from 'next/navigation';
 
@@ -253,7 +253,8 @@ export default function Page() {
                     budget: user.budget,
                     any_complication: user.any_complication,
                     explain_goal: user.explain_goal,
-                    timestamp: new Date().toISOString()
+                    timestamp: new Date().toISOString(),
+                    ts: Timestamp.now()
                 });
                 showPopup('Registration successful!', 'success');
                 setTimeout(() => {
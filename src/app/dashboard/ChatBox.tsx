@@ -3,7 +3,6 @@ import React, { useState, useEffect, useRef, FormEvent } from "react";
 import { AnimatePresence, motion } from "framer-motion";
 import { slideAnimation } from "../config/motion";
 import { Poiret_One } from "next/font/google";
-import axios from "axios";
 import { onAuthStateChanged, User } from "firebase/auth";
 import { auth, getAuthToken } from "@/app/firebase/config";
 import ReactMarkdown from "react-markdown";
@@ -67,27 +66,66 @@ export default function ChatBox({convo}: {convo: string}) {
     try {
       const token = await getAuthToken();
 
-      // ✅ Send message to FastAPI
-      const res = await axios.post(
-        `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/ask`,
-        {
-          user_id: user.uid,
-          query: input,
-          history: messages.map((m) => ({
-            role: m.role,
-            content: m.content,
-          })),
-          type: convo
-        },
+      // ✅ Stream the answer from FastAPI (Server-Sent Events)
+      const res = await fetch(
+        `${process.env.NEXT_PUBLIC_BACKEND_URL}/api/ask/stream`,
         {
+          method: "POST",
           headers: {
             "Content-Type": "application/json",
           },
+          body: JSON.stringify({
+            user_id: user.uid,
+            query: input,
+            history: messages.map((m) => ({
+              role: m.role,
+              content: m.content,
+            })),
+            type: convo
+          }),
         }
       );
+      if (!res.ok || !res.body) throw new Error(`Request failed: ${res.status}`);
+
+      // Placeholder assistant message that fills in as tokens arrive
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      const appendToReply = (text: string) =>
+        setMessages((prev) => {
+          const next = [...prev];
+          const last = next[next.length - 1];
+          next[next.length - 1] = { ...last, content: last.content + text };
+          return next;
+        });
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let received = false;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE events are separated by a blank line
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+
+        for (const evt of events) {
+          const eventLine = evt.split("\n").find((l) => l.startsWith("event: "));
+          const dataLine = evt.split("\n").find((l) => l.startsWith("data: "));
+          if (!dataLine) continue;
+          const payload = JSON.parse(dataLine.slice(6));
+
+          if (eventLine === "event: error") throw new Error(payload.detail);
+          if (payload.token) {
+            received = true;
+            appendToReply(payload.token);
+          }
+        }
+      }
 
-      const reply = res.data.answer || "No response from AI.";
-      setMessages((prev) => [...prev, { role: "assistant", content: reply }]);
+      if (!received) appendToReply("No response from AI.");
     } catch (err) {
       console.error(err);
       setMessages((prev) => [
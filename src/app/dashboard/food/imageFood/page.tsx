@@ -3,9 +3,8 @@ import { useState, useEffect } from "react";
 import axios from "axios";
 import { Poiret_One } from "next/font/google";
 import { CloudUpload, Check, RotateCcw, ChevronLeft } from "lucide-react";
-import { addDoc, collection } from "firebase/firestore";
-import { db } from "@/app/firebase/config";
 import { useAuth } from "@/app/Context/AuthContext";
+import { getAuthToken } from "@/app/firebase/config";
 import { useRouter } from "next/navigation";
 import ClickSpark from "@/components/ClickSpark";
 
@@ -111,14 +110,17 @@ export default function CloudinaryUpload() {
     const time = getMealTime();
 
     try {
-      await addDoc(collection(db, "users", userData.uid, "meals"), {
+      // Saved through the backend so the daily macro rollups stay in sync
+      const token = await getAuthToken();
+      await axios.post(`${process.env.NEXT_PUBLIC_BACKEND_URL}/api/user/${userData.uid}/meals`, {
         meal_name: result.food_name,
         cals: result.total_calories,
         protein: result.protein_g,
         carbs: result.carbs_g,
         fat: result.fat_g,
         meal_time: time,
-        timestamp: new Date().toISOString(),
+      }, {
+        headers: { Authorization: `Bearer ${token}` },
       });
 
       if (publicID) {
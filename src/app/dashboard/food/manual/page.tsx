@@ -2,13 +2,9 @@
 
 import React, { useState } from "react";
 import axios from "axios";
-import { db } from "@/app/firebase/config";
-import {
-  collection,
-  addDoc,
-} from "firebase/firestore";
 import { Poiret_One } from "next/font/google";
 import { useAuth } from "@/app/Context/AuthContext";
+import { getAuthToken } from "@/app/firebase/config";
 import ClickSpark from "@/components/ClickSpark";
 import { ChevronLeft } from "lucide-react";
 import { useRouter } from "next/navigation";
@@ -114,12 +110,14 @@ export default function MacrosForm() {
         protein: Number(macros.protein || 0),
         carbs: Number(macros.carbs || 0),
         fat: Number(macros.fat || 0),
-        timestamp: new Date().toISOString(),
         meal_time,
       };
 
-      const colRef = collection(db, "users", uid, "meals");
-      await addDoc(colRef, mealDoc);
+      // Saved through the backend so the daily macro rollups stay in sync
+      const token = await getAuthToken();
+      await axios.post(`${process.env.NEXT_PUBLIC_BACKEND_URL}/api/user/${uid}/meals`, mealDoc, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
 
       // optionally clear UI
       setQuery("");
@@ -4,7 +4,7 @@ import { ChevronLeft } from "lucide-react";
 import { useRouter } from "next/navigation";
 import { Poiret_One } from "next/font/google";
 import { useAuth } from "../Context/AuthContext";
-import { db } from "@/app/firebase/config";
+import { db, getAuthToken } from "@/app/firebase/config";
 import { doc, updateDoc, collection, addDoc, Timestamp } from "firebase/firestore";
 
 // 🔥 Your MetricCalc functions
@@ -116,9 +116,18 @@ export default function Page() {
 
         await addDoc(collection(db, "users", uid, "history"), {
             ...updated.currentData,
-            timestamp: new Date().toISOString()
+            timestamp: new Date().toISOString(),
+            ts: Timestamp.now()
         });
 
+        // Let the backend regenerate AI insights for the new profile in the background
+        getAuthToken()
+            .then((token) => fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/api/user/${uid}/refreshInsights`, {
+                method: "POST",
+                headers: { Authorization: `Bearer ${token}` },
+            }))
+            .catch((err) => console.error(err));
+
         alert("Profile updated successfully!");
         router.back();
     };